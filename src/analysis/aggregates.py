@@ -0,0 +1,51 @@
+# --------------------------------------------------------------
+# Grouped means with analytic confidence intervals
+# --------------------------------------------------------------
+"""
+seaborn's barplot bootstraps a confidence interval for every bar from the
+raw rows, which is slow and grows with the number of rows. group_summary
+computes the same quantities for every (group, ride type) in one groupby
+pass: mean, count, standard deviation and a t-based confidence interval
+mean +- t * std / sqrt(count). Plots then only draw the precomputed bars.
+"""
+
+import numpy as np
+from scipy.stats import t
+
+
+def group_stats(data, by, value_vars, stats, var_name="type"):
+    """
+    Compute the aggregations in stats (e.g. ["mean", "count"]) of value_vars
+    for every group of the columns in by, in one groupby pass.
+    Returns a long frame with the columns by + [var_name] + stats.
+    """
+    grouped = data.groupby(by, observed=True)[value_vars].agg(list(stats))
+    # (group) x (value, stat) -> (group, value) x stat
+    grouped = grouped.stack(level=0, future_stack=True)
+    grouped.index = grouped.index.set_names(var_name, level=-1)
+    return grouped.reset_index()
+
+
+def group_summary(data, by, value_vars, var_name="type", confidence=0.95):
+    """
+    Summarize value_vars for every group of the columns in by.
+    Returns a long frame with the columns by + [var_name, "mean", "count",
+    "std", "ci_low", "ci_high"], one row per group and value column.
+    """
+    stats = group_stats(data, by, value_vars, ["mean", "count", "std"], var_name)
+    return add_confidence_interval(stats, confidence)
+
+
+def add_confidence_interval(stats, confidence=0.95):
+    """
+    Add the columns ci_low and ci_high, the t-based confidence interval of
+    the mean, to a frame with the columns mean, count and std.
+    """
+    count = stats["count"].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sem = stats["std"].to_numpy() / np.sqrt(count)
+        # undefined (NaN) for groups with a single row, as in seaborn
+        half_width = t.ppf((1 + confidence) / 2, count - 1) * sem
+    stats["ci_low"] = stats["mean"] - half_width
+    stats["ci_high"] = stats["mean"] + half_width
+    return stats
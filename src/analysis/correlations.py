@@ -0,0 +1,136 @@
+# --------------------------------------------------------------
+# Pearson and Spearman correlations of many columns at once
+# --------------------------------------------------------------
+"""
+Instead of calling pearsonr/spearmanr (or np.corrcoef) once per pair of
+columns, which ranks the same columns again for every pair, each column is
+ranked once and the full Pearson and Spearman matrices are obtained with one
+matrix product each. p-values use the same t-distribution test as scipy:
+t = r * sqrt((n - 2) / (1 - r^2)) with n - 2 degrees of freedom.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from scipy.stats import rankdata, t
+
+from instrumentation import timed
+
+CorrelationResult = namedtuple(
+    "CorrelationResult", ["pearson", "spearman", "pearson_p", "spearman_p", "n"]
+)
+
+
+def _corr_matrix(values):
+    # correlation matrix of the columns of values
+    centered = values - values.mean(axis=0)
+    norms = np.sqrt((centered**2).sum(axis=0))
+    corr = (centered.T @ centered) / np.outer(norms, norms)
+    return np.clip(corr, -1.0, 1.0)
+
+
+def _p_values(corr, n):
+    # two-sided p-values of the null hypothesis of no correlation
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_stat = corr * np.sqrt((n - 2) / ((1.0 - corr) * (1.0 + corr)))
+    return 2 * t.sf(np.abs(t_stat), n - 2)
+
+
+@timed("compute_correlations")
+def compute_correlations(data, columns):
+    """
+    Pearson and Spearman correlation matrices (and their p-values) between
+    all the given columns of data, as DataFrames indexed by column.
+    """
+    values = data[columns].to_numpy(dtype=float)
+    n = len(values)
+    # rank every column once, ties get their average rank as in spearmanr
+    ranks = rankdata(values, axis=0)
+    pearson = _corr_matrix(values)
+    spearman = _corr_matrix(ranks)
+
+    def frame(matrix):
+        return pd.DataFrame(matrix, index=columns, columns=columns)
+
+    return CorrelationResult(
+        pearson=frame(pearson),
+        spearman=frame(spearman),
+        pearson_p=frame(_p_values(pearson, n)),
+        spearman_p=frame(_p_values(spearman, n)),
+        n=n,
+    )
+
+
+class PearsonMoments:
+    """
+    Sufficient statistics of the Pearson correlations between columns: the
+    number of rows, the means and the co-moments (sums of the products of
+    the centered values). New rows are merged in with the pairwise update of
+    Chan et al., so the correlations of a growing dataset are refreshed from
+    the new rows only. Spearman correlations have no such statistics (the
+    ranks of every row change), they need the whole data.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.n = 0
+        self.mean = np.zeros(len(self.columns))
+        self.comoment = np.zeros((len(self.columns), len(self.columns)))
+
+    def update(self, data):
+        """Add the rows of data (with the columns), returns self."""
+        values = data[self.columns].to_numpy(dtype=float)
+        n_new = len(values)
+        if n_new == 0:
+            return self
+        mean_new = values.mean(axis=0)
+        centered = values - mean_new
+        n = self.n + n_new
+        delta = mean_new - self.mean
+        self.comoment += centered.T @ centered
+        self.comoment += np.outer(delta, delta) * (self.n * n_new / n)
+        self.mean += delta * (n_new / n)
+        self.n = n
+        return self
+
+    def pearson(self):
+        """Pearson correlation matrix of the rows seen so far."""
+        norms = np.sqrt(np.diag(self.comoment))
+        corr = np.clip(self.comoment / np.outer(norms, norms), -1.0, 1.0)
+        return pd.DataFrame(corr, index=self.columns, columns=self.columns)
+
+    def pearson_p(self):
+        corr = self.pearson()
+        return pd.DataFrame(
+            _p_values(corr.to_numpy(), self.n), corr.index, corr.columns
+        )
+
+    def to_dict(self):
+        return {
+            "columns": self.columns,
+            "n": self.n,
+            "mean": self.mean.tolist(),
+            "comoment": self.comoment.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        moments = cls(state["columns"])
+        moments.n = state["n"]
+        moments.mean = np.array(state["mean"])
+        moments.comoment = np.array(state["comoment"])
+        return moments
+
+
+def correlation_table(result, features, targets):
+    """
+    Table of the correlations of features (columns) with every target, with
+    the rows "Pearson (Target)" and "Spearman (Target)" for each target.
+    """
+    rows = {}
+    for target in targets:
+        name = target.capitalize()
+        rows[f"Pearson ({name})"] = result.pearson.loc[features, target]
+        rows[f"Spearman ({name})"] = result.spearman.loc[features, target]
+    return pd.DataFrame(rows).T
@@ -0,0 +1,201 @@
+# --------------------------------------------------------------
+# Aggregate cube of rides
+# --------------------------------------------------------------
+"""
+An OLAP-style cube of the ride counts: for every combination of the
+dimensions (day, hour, weekday, season, year, weather, working day) it holds
+the number of rows and the sum and sum of squares of every measure
+(casual, registered, cnt).
+
+These are additive, so any coarser view is a rollup: grouping the cube by
+fewer dimensions and summing. Means, variances and confidence intervals
+follow from the sums, so the totals, bars and t-tests of the scripts are
+answered from the cube rather than from the raw rows, and new rows are merged
+into the stored cube without rebuilding it.
+
+(dteday, hr) identifies a row, so the base cube has one cell per raw row and
+rolling it up costs as much as grouping the rows. It is kept as the exact
+source the coarser views are built from (and merged into), and the views of
+the scripts are answered from smaller cuboids materialized next to it
+(CUBOIDS): the daily totals, and the hourly profile without the day, which
+rolls up to hr x weekday, hr x season, yr x weathersit, workingday x ... .
+Functions taking a cube also take the {name: cuboid} dict of load_cuboids
+and then roll up the smallest cuboid having all the dimensions asked for.
+
+stream_cube builds the stored cube from data that doesn't fit in memory: the
+cube of every chunk is appended to the file as its own row group, so a cell
+spread over several chunks (e.g. the same hour of several stations) is stored
+once per chunk. The views don't change, since the cells are summed anyway, and
+only the cuboids, whose size is bounded by their dimensions, are merged in
+memory.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from analysis.aggregates import add_confidence_interval
+from data.interim import INTERIM_DIR, append_chunks, load_interim, save_interim
+from instrumentation import timed
+
+DIMENSIONS = ["dteday", "hr", "weekday", "season", "yr", "weathersit", "workingday"]
+MEASURES = ["casual", "registered", "cnt"]
+CUBE_PATH = f"{INTERIM_DIR}/01_rides_cube.parquet"
+CUBOIDS_DIR = f"{INTERIM_DIR}/01_rides_cuboids"
+# name -> dimensions of the materialized cuboids
+CUBOIDS = {
+    "daily": ["dteday"],
+    "profile": ["season", "yr", "weathersit", "workingday", "weekday", "hr"],
+}
+
+
+@timed("build_cube")
+def build_cube(data, dims=DIMENSIONS, measures=MEASURES):
+    """Count, sum and sum of squares of measures for every cell of dims."""
+    values = data[measures].astype(np.int64)
+    cells = data[dims].assign(count=1)
+    for m in measures:
+        cells[f"{m}_sum"] = values[m]
+        cells[f"{m}_sumsq"] = values[m] ** 2
+    return rollup(cells, dims)
+
+
+@timed("rollup")
+def rollup(cube, by):
+    """
+    Aggregate the cube (or a rollup of it) over the dimensions not in by.
+    The result is a cube with the dimensions by.
+    """
+    aggregates = [col for col in cube.columns if col == "count" or "_sum" in col]
+    return cube.groupby(by, observed=True, sort=True)[aggregates].sum().reset_index()
+
+
+def materialize(cube, cuboids=CUBOIDS):
+    """{name: rollup of the cube over the dimensions of every cuboid}."""
+    return {name: rollup(cube, dims) for name, dims in cuboids.items()}
+
+
+def cuboid_for(cube, by):
+    """
+    The cube itself, or for a {name: cuboid} dict the cuboid with the fewest
+    cells among those having all the dimensions of by.
+    """
+    if isinstance(cube, pd.DataFrame):
+        return cube
+    candidates = [c for c in cube.values() if set(by) <= set(c.columns)]
+    if not candidates:
+        raise ValueError(f"no cuboid has the dimensions {by}")
+    return min(candidates, key=len)
+
+
+def merge_cubes(cube, new, dims=DIMENSIONS):
+    """Add the cells of new to cube (both with the dimensions dims)."""
+    return rollup(pd.concat([cube, new], ignore_index=True), dims)
+
+
+def rollup_totals(cube, by, measures=MEASURES):
+    """Total of every measure for each group of by, indexed by the groups."""
+    totals = rollup(cuboid_for(cube, by), by).set_index(by)[
+        [f"{m}_sum" for m in measures]
+    ]
+    return totals.set_axis(measures, axis=1)
+
+
+def rollup_moments(cube, by, measures=MEASURES, var_name="type"):
+    """
+    Count, mean and (sample) variance of every measure for each group of by,
+    as a long frame like analysis.hypothesis.group_moments.
+    """
+    rolled = rollup(cuboid_for(cube, by), by)
+    count = rolled["count"].to_numpy(dtype=float)
+    frames = []
+    for m in measures:
+        sums = rolled[f"{m}_sum"].to_numpy(dtype=float)
+        sumsq = rolled[f"{m}_sumsq"].to_numpy(dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # NaN for groups with a single row, as pandas' var
+            var = (sumsq - sums**2 / count) / (count - 1)
+        frames.append(
+            rolled[by].assign(
+                **{var_name: m, "count": rolled["count"], "mean": sums / count}
+            )
+            # clip tiny negative variances from rounding
+            .assign(var=np.where(var < 0, 0.0, var))
+        )
+    moments = pd.concat(frames, ignore_index=True)
+    # same row order as a groupby over by + [var_name]
+    return moments.sort_values(by, kind="stable", ignore_index=True)
+
+
+def rollup_summary(cube, by, measures=MEASURES, var_name="type", confidence=0.95):
+    """
+    Mean, count, std and confidence interval of every measure for each group
+    of by, as a long frame like analysis.aggregates.group_summary.
+    """
+    stats = rollup_moments(cube, by, measures, var_name)
+    stats["std"] = np.sqrt(stats.pop("var"))
+    stats = stats[by + [var_name, "mean", "count", "std"]]
+    return add_confidence_interval(stats, confidence)
+
+
+def save_cube(cube, path=CUBE_PATH):
+    """Store the cube next to the interim data."""
+    save_interim(cube, path)
+
+
+def load_cube(path=CUBE_PATH):
+    """Load the stored cube."""
+    return load_interim(path=path)
+
+
+def save_cuboids(cuboids, directory=CUBOIDS_DIR):
+    """Store every cuboid as directory/<name>.parquet."""
+    os.makedirs(directory, exist_ok=True)
+    for name, cuboid in cuboids.items():
+        save_interim(cuboid, os.path.join(directory, f"{name}.parquet"))
+
+
+def load_cuboids(directory=CUBOIDS_DIR, names=None):
+    """Load the stored cuboids (all of CUBOIDS by default) as {name: cuboid}."""
+    return {
+        name: load_interim(path=os.path.join(directory, f"{name}.parquet"))
+        for name in (names or CUBOIDS)
+    }
+
+
+def stream_cube(chunks, path=CUBE_PATH, cuboids_dir=CUBOIDS_DIR):
+    """
+    Store the cube of an iterable of data chunks, e.g. data.interim.iter_interim,
+    holding only one chunk and the cuboids in memory. Returns the cuboids.
+    """
+    cuboids = {}
+
+    def chunk_cubes():
+        for chunk in chunks:
+            cube = build_cube(chunk)
+            for name, cuboid in materialize(cube).items():
+                dims = CUBOIDS[name]
+                cuboids[name] = (
+                    merge_cubes(cuboids[name], cuboid, dims)
+                    if name in cuboids
+                    else cuboid
+                )
+            yield cube
+
+    append_chunks(chunk_cubes(), path)
+    save_cuboids(cuboids, cuboids_dir)
+    return cuboids
+
+
+def update_cube(data, path=CUBE_PATH, cuboids_dir=CUBOIDS_DIR):
+    """
+    Merge the cells of the new rows in data into the stored cube (built from
+    scratch if there is none yet), store it with its cuboids and return it.
+    """
+    cube = build_cube(data)
+    if os.path.exists(path):
+        cube = merge_cubes(load_cube(path), cube)
+    save_cube(cube, path)
+    save_cuboids(materialize(cube), cuboids_dir)
+    return cube
@@ -0,0 +1,131 @@
+# --------------------------------------------------------------
+# Incremental seasonal decomposition
+# --------------------------------------------------------------
+"""
+Additive decomposition of a series into trend, seasonal and residual
+components, giving the same result as statsmodels' seasonal_decompose
+(two-sided moving average trend, no trend extrapolation), but updated as new
+observations arrive instead of recomputed from scratch.
+
+The trend at t is a centered moving average, so it becomes known once
+half a period of later observations has arrived; at that point the
+detrended value x[t] - trend[t] is added to the running sum of its phase
+(t mod period). The seasonal indices are the phase means of the detrended
+values, centered to sum to zero. An update therefore costs O(period),
+whatever the length of the history.
+
+The last points, whose trend (and so residual) is still missing, are
+provisional: their components are filled in when enough new observations
+arrive. The seasonal indices themselves are refined by every new trend
+value, exactly as a full recompute would.
+"""
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+
+
+def trend_filter(period):
+    """Weights of the centered moving average used for the trend."""
+    if period % 2 == 0:
+        # 2 x period moving average, as in seasonal_decompose
+        return np.array([0.5] + [1] * (period - 1) + [0.5]) / period
+    return np.repeat(1.0 / period, period)
+
+
+class IncrementalDecomposition:
+    """Additive seasonal decomposition of a growing series."""
+
+    def __init__(self, period):
+        self.period = period
+        self.filt = trend_filter(period)
+        self.half = len(self.filt) // 2
+        self.values = []
+        self.index = []
+        self.trend = []
+        # running sums and counts of the detrended values of every phase
+        self.phase_sums = np.zeros(period)
+        self.phase_counts = np.zeros(period, dtype=int)
+
+    def __len__(self):
+        return len(self.values)
+
+    def append(self, values, index=None):
+        """
+        Add new observations (a Series, or values with their index labels).
+        Returns self, so calls can be chained.
+        """
+        if isinstance(values, pd.Series):
+            index = values.index
+            values = values.to_numpy()
+        values = np.asarray(values, dtype=float).ravel()
+        if index is None:
+            index = range(len(self.values), len(self.values) + len(values))
+        for label, x in zip(index, values):
+            self.values.append(float(x))
+            self.index.append(label)
+            self.trend.append(np.nan)
+            self._update_trend()
+        return self
+
+    def _update_trend(self):
+        # the newest observation completes the window centered at t
+        t = len(self.values) - 1 - self.half
+        if t < self.half:
+            return
+        window = self.values[t - self.half : t + self.half + 1]
+        trend = float(np.dot(self.filt, window))
+        self.trend[t] = trend
+        phase = t % self.period
+        self.phase_sums[phase] += self.values[t] - trend
+        self.phase_counts[phase] += 1
+
+    def seasonal_indices(self):
+        """Seasonal component of every phase (0 .. period - 1)."""
+        with np.errstate(invalid="ignore"):
+            averages = self.phase_sums / self.phase_counts
+        return averages - averages.mean()
+
+    def provisional(self):
+        """Boolean mask of the points whose trend and residual are not final."""
+        mask = np.zeros(len(self.values), dtype=bool)
+        mask[max(len(self.values) - self.half, 0) :] = True
+        return mask
+
+    def components(self):
+        """
+        DataFrame with the observed, trend, seasonal and resid components and
+        the provisional flag, indexed like the appended observations.
+        """
+        observed = np.asarray(self.values)
+        trend = np.asarray(self.trend)
+        phases = np.arange(len(observed)) % self.period
+        seasonal = self.seasonal_indices()[phases]
+        return pd.DataFrame(
+            {
+                "observed": observed,
+                "trend": trend,
+                "seasonal": seasonal,
+                "resid": observed - trend - seasonal,
+                "provisional": self.provisional(),
+            },
+            index=pd.Index(self.index),
+        )
+
+    def result(self, name=None):
+        """The components as a statsmodels DecomposeResult (e.g. to plot them)."""
+        from statsmodels.tsa.seasonal import DecomposeResult
+
+        components = self.components()
+        series = {
+            col: components[col].rename(name if col == "observed" else col)
+            for col in ["observed", "seasonal", "trend", "resid"]
+        }
+        return DecomposeResult(**series)
+
+
+@timed("decompose")
+def decompose(series, period):
+    """Decompose a whole series, keeping the state for later appends."""
+    return IncrementalDecomposition(period).append(series)
@@ -0,0 +1,95 @@
+# --------------------------------------------------------------
+# Missing hours of the hourly data
+# --------------------------------------------------------------
+"""
+hour.csv has no row for some hours (no rides, or no record), which daily
+sums hide. Every row is given its slot in the full hourly calendar,
+
+    slot = (day - first day) * 24 + hr
+
+and the rows are counted per slot with np.bincount: the slots with no row are
+the gaps. Consecutive missing slots are grouped into runs for the report.
+Everything is a few numpy passes over the rows and the calendar, with no
+loop over days, so the cost is linear in the number of rows and hours.
+
+reindex_hours lays the values on the full calendar and fills the missing
+hours (with 0, the previous hour or a linear interpolation) before rolling
+statistics or decompositions, which expect one value per hour.
+"""
+
+import numpy as np
+import pandas as pd
+
+FILLS = [None, "zero", "ffill", "interpolate"]
+
+
+def hour_slots(data):
+    """
+    Slot of every row in the hourly calendar starting at midnight of the
+    first day, and that first day.
+    """
+    days = pd.to_datetime(data["dteday"]).to_numpy().astype("datetime64[D]")
+    first_day = days.min()
+    slots = (days - first_day).astype(np.int64) * 24 + data["hr"].to_numpy()
+    return slots, first_day
+
+
+def slot_counts(data):
+    """
+    Number of rows in every hour of the calendar (0 for the missing hours),
+    as a Series indexed by the hours.
+    """
+    slots, first_day = hour_slots(data)
+    counts = np.bincount(slots, minlength=(slots.max() // 24 + 1) * 24)
+    index = pd.date_range(first_day, periods=len(counts), freq="h", name="datetime")
+    return pd.Series(counts, index=index, name="rows")
+
+
+def gap_report(data):
+    """
+    Runs of consecutive missing hours, one row per run with its first and
+    last hour and its length in hours.
+    """
+    missing = slot_counts(data) == 0
+    flags = np.concatenate([[False], missing.to_numpy(), [False]])
+    # a run starts where missing goes from False to True and ends where it
+    # goes back to False
+    changes = np.flatnonzero(np.diff(flags.astype(np.int8)))
+    starts, ends = changes[::2], changes[1::2]
+    hours = missing.index
+    return pd.DataFrame(
+        {
+            "start": hours[starts],
+            "end": hours[ends - 1],
+            "hours": ends - starts,
+        }
+    )
+
+
+def reindex_hours(data, columns, fill="zero"):
+    """
+    Totals of columns for every hour of the calendar, rows of the same hour
+    being summed. The missing hours are NaN (fill=None), 0 ("zero"), the
+    value of the previous hour ("ffill") or linearly interpolated
+    ("interpolate"); missing hours before the first row are 0 in all but the
+    first case.
+    """
+    if fill not in FILLS:
+        raise ValueError(f"fill must be one of {FILLS}, got {fill!r}")
+    slots, first_day = hour_slots(data)
+    n_slots = (slots.max() // 24 + 1) * 24
+    present = np.bincount(slots, minlength=n_slots) > 0
+    totals = {
+        col: np.bincount(slots, weights=data[col].to_numpy(), minlength=n_slots)
+        for col in columns
+    }
+    index = pd.date_range(first_day, periods=n_slots, freq="h", name="datetime")
+    hourly = pd.DataFrame(totals, index=index)
+    hourly.loc[~present] = np.nan
+    if fill == "ffill":
+        hourly = hourly.ffill()
+    elif fill == "interpolate":
+        hourly = hourly.interpolate(limit_area="inside")
+    if fill is not None:
+        hourly = hourly.fillna(0)
+    return hourly
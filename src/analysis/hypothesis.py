@@ -0,0 +1,128 @@
+# --------------------------------------------------------------
+# Vectorized t-tests over many segments
+# --------------------------------------------------------------
+"""
+Runs the t-tests of the hypothesis testing script for every segment of the
+data at once (e.g. every season x yr x weathersit x hr) instead of one
+scipy call per hand-built mask. The counts, means and variances of all
+segments come from a single groupby pass; the t statistics, degrees of
+freedom and p-values are then computed on whole arrays. Since hundreds of
+tests are run, the p-values are corrected for multiple comparisons.
+"""
+
+import numpy as np
+from scipy.stats import t
+
+from analysis.aggregates import group_stats
+from instrumentation import timed
+
+MOMENTS = ["count", "mean", "var"]
+
+
+def group_moments(data, by, value_vars, var_name="type"):
+    """Count, mean and (sample) variance of value_vars in every group of by."""
+    return group_stats(data, by, value_vars, MOMENTS, var_name)
+
+
+def one_sample_t(count, mean, var, popmean):
+    """t statistics and two-sided p-values of H_0: mean == popmean."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_stat = (mean - popmean) / np.sqrt(var / count)
+    return t_stat, 2 * t.sf(np.abs(t_stat), count - 1)
+
+
+def welch_t(count_a, mean_a, var_a, count_b, mean_b, var_b):
+    """Welch t statistics, degrees of freedom and two-sided p-values."""
+    se_a = var_a / count_a
+    se_b = var_b / count_b
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_stat = (mean_a - mean_b) / np.sqrt(se_a + se_b)
+        dof = (se_a + se_b) ** 2 / (se_a**2 / (count_a - 1) + se_b**2 / (count_b - 1))
+    return t_stat, dof, 2 * t.sf(np.abs(t_stat), dof)
+
+
+def adjust_p_values(p_values, method="fdr_bh", alpha=0.05):
+    """
+    Correct p-values for multiple comparisons (statsmodels multipletests
+    methods, e.g. "fdr_bh", "holm", "bonferroni"). NaN p-values, from
+    segments too small to be tested, are left out of the correction.
+    Returns (adjusted p-values, reject H_0).
+    """
+    from statsmodels.stats.multitest import multipletests
+
+    p_values = np.asarray(p_values, dtype=float)
+    adjusted = np.full_like(p_values, np.nan)
+    reject = np.zeros(len(p_values), dtype=bool)
+    tested = ~np.isnan(p_values)
+    if tested.any():
+        reject[tested], adjusted[tested], _, _ = multipletests(
+            p_values[tested], alpha=alpha, method=method
+        )
+    return adjusted, reject
+
+
+def grouped_ttest_1samp(
+    data, by, value_vars, popmean=None, method="fdr_bh", alpha=0.05
+):
+    """
+    One-sample t-test of every segment of by against popmean, for each of
+    value_vars. popmean is a dict {value column: mean}, by default the mean
+    of each column over all the data (the population mean).
+    Returns one row per (segment, value column) with the moments, the t
+    statistic, the p-value and the corrected p-value.
+    """
+    if popmean is None:
+        popmean = data[value_vars].mean().to_dict()
+    moments = group_moments(data, by, value_vars)
+    return moments_ttest_1samp(moments, popmean, method, alpha)
+
+
+@timed("moments_ttest_1samp")
+def moments_ttest_1samp(moments, popmean, method="fdr_bh", alpha=0.05):
+    """
+    grouped_ttest_1samp from precomputed moments (a long frame with the
+    columns type, count, mean and var, e.g. from analysis.cube.rollup_moments).
+    """
+    tests = moments.copy()
+    tests["popmean"] = tests["type"].map(popmean).astype(float)
+    tests["t_stat"], tests["p_value"] = one_sample_t(
+        tests["count"], tests["mean"], tests["var"], tests["popmean"]
+    )
+    tests["p_adjusted"], tests["reject"] = adjust_p_values(
+        tests["p_value"], method, alpha
+    )
+    return tests
+
+
+def grouped_ttest_ind(data, by, mask, value_vars, method="fdr_bh", alpha=0.05):
+    """
+    Welch t-test of the rows where mask is True against the rows where it is
+    False (e.g. weekend vs working days) inside every segment of by, for
+    each of value_vars. Segments where one side is empty get NaN results.
+    """
+    data = data.assign(_side=np.asarray(mask, dtype=bool))
+    moments = group_moments(data, by + ["_side"], value_vars)
+    return moments_ttest_ind(moments, by, "_side", method, alpha)
+
+
+@timed("moments_ttest_ind")
+def moments_ttest_ind(moments, by, side, method="fdr_bh", alpha=0.05):
+    """
+    grouped_ttest_ind from precomputed moments of every segment of by and
+    side (the boolean column telling the two groups apart).
+    """
+    # one row per (segment, type) with the moments of both sides
+    tests = moments.pivot_table(
+        index=by + ["type"], columns=side, values=MOMENTS, observed=True
+    )
+    tests.columns = [f"{stat}_{'a' if is_a else 'b'}" for stat, is_a in tests.columns]
+    tests = tests.reindex(
+        columns=[f"{stat}_{side}" for side in "ab" for stat in MOMENTS]
+    ).reset_index()
+    tests["t_stat"], tests["dof"], tests["p_value"] = welch_t(
+        *(tests[f"{stat}_{side}"] for side in "ab" for stat in MOMENTS)
+    )
+    tests["p_adjusted"], tests["reject"] = adjust_p_values(
+        tests["p_value"], method, alpha
+    )
+    return tests
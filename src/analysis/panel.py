@@ -0,0 +1,184 @@
+# --------------------------------------------------------------
+# Panel of datasets analyzed in parallel
+# --------------------------------------------------------------
+"""
+Runs the analysis of hour.csv on many hour-level datasets with the same
+schema (e.g. one export per city or station), one dataset per task of a
+process pool: validation and preprocessing, the weather correlations, the
+hypothesis tests and the stationarity tests (see analysis/stages.py).
+
+The tables of all datasets are combined into one table per kind, with a
+"dataset" column holding the id of each dataset (its file name without the
+extension), plus a "datasets" table with the number of rows, the time and
+the error of each one. A dataset that fails (invalid file, out of memory, ...) is reported
+there instead of stopping the others.
+
+Every worker can be given a memory budget: the address space it may
+allocate on top of what it inherits when it starts (RLIMIT_AS, so a
+dataset going over it raises MemoryError in its own worker only), and a
+progress line is printed as every dataset completes.
+"""
+
+import glob
+import os
+import resource
+import time
+import traceback
+from concurrent.futures import as_completed
+
+import pandas as pd
+
+from analysis import stages
+from analysis.cube import build_cube, materialize
+from analysis.parallel import cpu_count, process_pool
+from data.preprocessing import preprocess
+from data.schema import enforce_schema
+from data.validation import validate
+from instrumentation import timed
+
+# tables of every dataset, combined over the panel
+TABLES = ["validation", "tests", "segment_tests", "correlations", "stationarity"]
+MB = 2**20
+
+
+def dataset_paths(source, extension=".csv"):
+    """Sorted files of a directory (those with extension) or of a glob pattern."""
+    if os.path.isdir(source):
+        source = os.path.join(source, f"*{extension}")
+    paths = sorted(glob.glob(source))
+    if not paths:
+        raise ValueError(f"no datasets match {source}")
+    return paths
+
+
+def dataset_id(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _address_space():
+    # current virtual memory size of the process in bytes (0 if unknown)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+
+def limit_memory(budget_mb):
+    """
+    Pool initializer: cap the address space of the worker to what it has
+    already mapped plus budget_mb.
+    """
+    limit = _address_space() + int(budget_mb * MB)
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+@timed("analyze_dataset")
+def analyze_dataset(path, n_resamples=10_000, seed=111):
+    """
+    Validate, preprocess and analyze one raw hourly file, in this process.
+    Returns {table name: DataFrame} with the tables of TABLES, and the number
+    of raw rows.
+    """
+    raw = pd.read_csv(path)
+    n_rows = len(raw)
+    validator = validate(raw)
+    data = enforce_schema(preprocess(raw))
+    del raw
+    hypothesis = stages.hypothesis_stage(
+        data, materialize(build_cube(data)), n_resamples, seed, n_jobs=1
+    )
+    weather = stages.weather_stage(data)
+    timeseries = stages.timeseries_stage(data, n_jobs=1)
+    tables = {
+        "validation": validator.report().reset_index(),
+        "tests": hypothesis["tests"],
+        "segment_tests": hypothesis["segment_tests"],
+        "correlations": weather["correlations"],
+        "stationarity": timeseries["stationarity"],
+    }
+    return tables, n_rows
+
+
+def _dataset_task(path, n_resamples, seed):
+    # errors are returned rather than raised, so one bad dataset doesn't
+    # cancel the rest of the panel
+    start = time.perf_counter()
+    tables, n_rows, error = None, None, None
+    try:
+        tables, n_rows = analyze_dataset(path, n_resamples, seed)
+    except MemoryError:
+        error = "MemoryError: over the worker memory budget"
+    except Exception as exc:
+        error = "".join(traceback.format_exception_only(type(exc), exc)).strip()
+    return tables, n_rows, error, time.perf_counter() - start
+
+
+def combine(results):
+    """
+    Combine the results {dataset id: (tables, rows, error, seconds)} into
+    one table per kind keyed by dataset, plus the "datasets" table.
+    """
+    combined = {}
+    for name in TABLES:
+        frames = [
+            tables[name].assign(dataset=dataset)
+            for dataset, (tables, _, _, _) in results.items()
+            if tables is not None
+        ]
+        if frames:
+            table = pd.concat(frames, ignore_index=True)
+            combined[name] = table[["dataset"] + list(table.columns[:-1])]
+    combined["datasets"] = pd.DataFrame(
+        [
+            {
+                "dataset": dataset,
+                "rows": n_rows,
+                "seconds": round(seconds, 3),
+                "error": error,
+            }
+            for dataset, (_, n_rows, error, seconds) in results.items()
+        ]
+    )
+    return combined
+
+
+def run_panel(source, processes=None, memory_mb=None, n_resamples=10_000, seed=111):
+    """
+    Analyze every dataset of source (a directory or a glob pattern) in a
+    pool of processes workers (all cores when None, at most one per
+    dataset), each limited to memory_mb of extra address space when given.
+    Returns the combined tables (see combine), in the order of the files.
+    """
+    paths = dataset_paths(source)
+    ids = [dataset_id(path) for path in paths]
+    if len(set(ids)) < len(ids):
+        raise ValueError("datasets must have distinct file names")
+    processes = min(processes or cpu_count(), len(paths))
+    initializer, initargs = (limit_memory, (memory_mb,)) if memory_mb else (None, ())
+
+    results = {}
+    start = time.perf_counter()
+    with process_pool(processes, initializer, initargs) as pool:
+        futures = {
+            pool.submit(_dataset_task, path, n_resamples, seed): dataset
+            for path, dataset in zip(paths, ids)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            dataset = futures[future]
+            try:
+                results[dataset] = future.result()
+            except Exception as exc:
+                # the worker itself died (e.g. killed), not the analysis
+                results[dataset] = (None, None, f"{type(exc).__name__}: {exc}", 0.0)
+            _, _, error, seconds = results[dataset]
+            print(
+                f"[{done}/{len(paths)}] {dataset:<24} {seconds:7.2f}s "
+                f"{'ok' if error is None else error} "
+                f"({time.perf_counter() - start:.1f}s elapsed)",
+                flush=True,
+            )
+    return combine({dataset: results[dataset] for dataset in ids})
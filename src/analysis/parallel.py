@@ -0,0 +1,31 @@
+# --------------------------------------------------------------
+# Process pools
+# --------------------------------------------------------------
+"""
+Process pools shared by the parallel parts of the analysis.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def cpu_count():
+    return os.cpu_count() or 1
+
+
+def process_pool(processes=None, initializer=None, initargs=()):
+    """
+    ProcessPoolExecutor with processes workers (all cores when None).
+    Workers are forked where available: they inherit sys.path and the
+    imported modules, and the numbered scripts (which have no __main__
+    guard) are not re-imported in every worker as they would be with spawn.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    return ProcessPoolExecutor(
+        processes or cpu_count(),
+        mp_context=context,
+        initializer=initializer,
+        initargs=initargs,
+    )
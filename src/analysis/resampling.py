@@ -0,0 +1,182 @@
+# --------------------------------------------------------------
+# Permutation and bootstrap tests
+# --------------------------------------------------------------
+"""
+Distribution-free alternatives to ttest_ind for comparing two groups of
+rides (e.g. weekend vs working days), whose distributions are skewed.
+
+Resamples are drawn in batches: a batch of permutations is one 2-D array of
+indices (one row per resample) and its statistics are computed with a single
+numpy reduction, so there is no python loop over resamples. Every
+batch has its own seed, spawned from the seed of the test, so the results
+don't depend on whether the batches run in this process or in a pool.
+
+prepare_samples pools and ranks the two groups once; the prepared
+samples can be passed to several tests instead of the raw groups.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+from scipy.stats import rankdata
+
+from analysis.parallel import process_pool
+from instrumentation import timed
+
+# a, b: the two groups, pooled: a then b, ranks: ranks of pooled (average
+# ranks for ties)
+PreparedSamples = namedtuple("PreparedSamples", ["a", "b", "pooled", "ranks"])
+PermutationResult = namedtuple(
+    "PermutationResult", ["statistic", "p_value", "n_resamples"]
+)
+BootstrapResult = namedtuple(
+    "BootstrapResult", ["statistic", "ci_low", "ci_high", "p_value", "n_resamples"]
+)
+
+# statistics computed on the pooled values or on their ranks
+STATISTICS = {"mean": "pooled", "rank": "ranks"}
+
+
+def prepare_samples(a, b):
+    """Pool and rank the two groups once, for use by several tests."""
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    pooled = np.concatenate([a, b])
+    return PreparedSamples(a=a, b=b, pooled=pooled, ranks=rankdata(pooled))
+
+
+def _prepared(a, b):
+    if isinstance(a, PreparedSamples):
+        return a
+    if b is None:
+        # both tests compare two groups, there is no one-sample variant
+        raise ValueError("b is required unless a is the PreparedSamples of both groups")
+    return prepare_samples(a, b)
+
+
+def _batch_sizes(n_resamples, batch_size):
+    n_batches, rest = divmod(n_resamples, batch_size)
+    return [batch_size] * n_batches + ([rest] if rest else [])
+
+
+def _run_batches(func, args, n_resamples, batch_size, seed, n_jobs):
+    # one child seed per batch, so n_jobs doesn't change the results
+    sizes = _batch_sizes(n_resamples, batch_size)
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    seeds = seed.spawn(len(sizes))
+    tasks = [(*args, size, child) for size, child in zip(sizes, seeds)]
+    if n_jobs == 1 or len(tasks) == 1:
+        results = [func(*task) for task in tasks]
+    else:
+        with process_pool(n_jobs) as pool:
+            results = list(pool.map(func, *zip(*tasks)))
+    return np.concatenate(results)
+
+
+def _mean_difference(values, n_a):
+    # difference of means of values[:n_a] and values[n_a:]
+    sum_a = values[:n_a].sum()
+    return sum_a / n_a - (values.sum() - sum_a) / (len(values) - n_a)
+
+
+def _permutation_batch(values, n_a, size, seed):
+    rng = np.random.default_rng(seed)
+    n = len(values)
+    # a permutation only matters through the subset of values it assigns to
+    # the smaller group: draw size random subsets at once as the k smallest
+    # of size x n random keys (argpartition is linear in n)
+    k = min(n_a, n - n_a)
+    keys = rng.random((size, n), dtype=np.float32)
+    subsets = np.argpartition(keys, k - 1, axis=1)[:, :k]
+    sum_subset = values[subsets].sum(axis=1)
+    sum_a = sum_subset if k == n_a else values.sum() - sum_subset
+    return sum_a / n_a - (values.sum() - sum_a) / (n - n_a)
+
+
+@timed("permutation_test")
+def permutation_test(
+    a,
+    b=None,
+    statistic="mean",
+    n_resamples=10_000,
+    batch_size=500,
+    seed=None,
+    n_jobs=1,
+):
+    """
+    Two-sided permutation test of H_0: a and b come from the same
+    distribution. statistic is "mean" (difference of means) or "rank"
+    (difference of mean ranks, a Mann-Whitney type statistic).
+    a can be the PreparedSamples of both groups, b is then ignored;
+    otherwise b is required (ValueError).
+    """
+    samples = _prepared(a, b)
+    values = getattr(samples, STATISTICS[statistic])
+    n_a = len(samples.a)
+    observed = _mean_difference(values, n_a)
+    permuted = _run_batches(
+        _permutation_batch, (values, n_a), n_resamples, batch_size, seed, n_jobs
+    )
+    # the observed split counts as one of the permutations, the tolerance
+    # keeps permutations equal to it up to rounding
+    extreme = np.count_nonzero(np.abs(permuted) >= np.abs(observed) - 1e-12)
+    p_value = (extreme + 1) / (n_resamples + 1)
+    return PermutationResult(observed, p_value, n_resamples)
+
+
+def _bootstrap_batch(a, b, size, seed):
+    rng = np.random.default_rng(seed)
+    # resample each group with replacement, one resample per row
+    mean_a = a[rng.integers(0, len(a), (size, len(a)))].mean(axis=1)
+    mean_b = b[rng.integers(0, len(b), (size, len(b)))].mean(axis=1)
+    return mean_a - mean_b
+
+
+@timed("bootstrap_test")
+def bootstrap_test(
+    a,
+    b=None,
+    n_resamples=10_000,
+    batch_size=500,
+    confidence=0.95,
+    seed=None,
+    n_jobs=1,
+):
+    """
+    Bootstrap percentile confidence interval of mean(a) - mean(b), and the
+    two-sided p-value of H_0: equal means, from resamples of both groups
+    shifted to the pooled mean.
+    a can be the PreparedSamples of both groups, b is then ignored;
+    otherwise b is required (ValueError).
+    """
+    samples = _prepared(a, b)
+    observed = samples.a.mean() - samples.b.mean()
+    seeds = np.random.SeedSequence(seed).spawn(2)
+
+    differences = _run_batches(
+        _bootstrap_batch,
+        (samples.a, samples.b),
+        n_resamples,
+        batch_size,
+        seeds[0],
+        n_jobs,
+    )
+    tail = (1 - confidence) / 2
+    ci_low, ci_high = np.quantile(differences, [tail, 1 - tail])
+
+    # under H_0 both groups have the pooled mean
+    pooled_mean = samples.pooled.mean()
+    null_a = samples.a - samples.a.mean() + pooled_mean
+    null_b = samples.b - samples.b.mean() + pooled_mean
+    null_differences = _run_batches(
+        _bootstrap_batch,
+        (null_a, null_b),
+        n_resamples,
+        batch_size,
+        seeds[1],
+        n_jobs,
+    )
+    extreme = np.count_nonzero(np.abs(null_differences) >= np.abs(observed))
+    p_value = (extreme + 1) / (n_resamples + 1)
+    return BootstrapResult(observed, ci_low, ci_high, p_value, n_resamples)
@@ -0,0 +1,243 @@
+# --------------------------------------------------------------
+# Rolling statistics engine
+# --------------------------------------------------------------
+"""
+Rolling mean, standard deviation, min and max of many series for several
+window sizes, with the semantics of pandas' rolling(window) (a statistic is
+NaN unless its window holds window non-NaN values).
+
+A whole series is computed at once: means and variances come from the
+differences of cumulative sums (of the values, their squares and the number
+of non-NaN values), on values centered on their mean so the sums of squares
+keep their precision; min and max are running np.minimum/np.maximum over
+the values shifted by every lag of the window. Every operation is vectorized
+over the points and the series, only the windows and lags are looped over.
+
+RollingStats keeps the last points of the series to extend the statistics
+when new points arrive (e.g. a new day) without recomputing the history.
+A few new points update the running means and variances with Welford's
+algorithm extended to sliding windows, O(1) per point and window:
+
+    mean' = mean + (x_in - mean) / n        (a value enters, n values now)
+    M2'   = M2 + (x_in - mean) * (x_in - mean')
+
+and the reverse update when a value leaves; NaNs neither enter nor leave,
+they only lower the count of the window. Longer batches go through the
+vectorized computation over the kept points and the new ones.
+"""
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+
+STATS = ["mean", "std", "min", "max"]
+# batches up to this many points are appended with the Welford updates
+STREAM_POINTS = 8
+
+
+def window_stats(values, windows):
+    """
+    Trailing rolling statistics of the columns of values (n_points,
+    n_series) for every window size, as {stat: (n_points, n_windows,
+    n_series)} arrays, NaN where a window isn't full of non-NaN values.
+    """
+    values = np.asarray(values, dtype=float)
+    n, n_series = values.shape
+    valid = ~np.isnan(values)
+    # center every series so the cumulative sums of squares stay small
+    with np.errstate(invalid="ignore"):
+        shift = np.nan_to_num(
+            np.nanmean(np.where(valid, values, np.nan), axis=0)
+            if valid.any()
+            else np.zeros(n_series)
+        )
+    centered = np.where(valid, values - shift, 0.0)
+    zero = np.zeros((1, n_series))
+    sums = np.vstack([zero, np.cumsum(centered, axis=0)])
+    squares = np.vstack([zero, np.cumsum(centered**2, axis=0)])
+    counts = np.vstack([zero, np.cumsum(valid, axis=0)])
+
+    out = {stat: np.full((n, len(windows), n_series), np.nan) for stat in STATS}
+    for i, window in enumerate(windows):
+        if window > n:
+            continue
+        total = sums[window:] - sums[:-window]
+        total_sq = squares[window:] - squares[:-window]
+        full = counts[window:] - counts[:-window] == window
+        mean = total / window
+        # clip tiny negative M2 from rounding, as pandas does (no std of one value)
+        m2 = np.maximum(total_sq - total * mean, 0)
+        var = m2 / (window - 1) if window > 1 else np.full_like(m2, np.nan)
+        out["mean"][window - 1 :, i] = np.where(full, mean + shift, np.nan)
+        out["std"][window - 1 :, i] = np.where(full, np.sqrt(var), np.nan)
+        # min and max of the window shifted by every lag, on contiguous
+        # slices; NaNs propagate through them, like the incomplete windows
+        low, high = values[window - 1 :].copy(), values[window - 1 :].copy()
+        for lag in range(1, window):
+            np.minimum(low, values[window - 1 - lag : n - lag], out=low)
+            np.maximum(high, values[window - 1 - lag : n - lag], out=high)
+        out["min"][window - 1 :, i] = low
+        out["max"][window - 1 :, i] = high
+    return out
+
+
+class RollingStats:
+    """
+    Streaming rolling statistics of n_series series over each of windows.
+    Statistics are NaN until a window holds window non-NaN values, as with
+    pandas' rolling.
+    """
+
+    def __init__(self, windows, n_series=1):
+        self.windows = list(windows)
+        self.n_series = n_series
+        size = max(self.windows)
+        # the last max(windows) points of every series, as a ring buffer
+        self.buffer = np.full((size, n_series), np.nan)
+        self.n_seen = 0
+        # running mean, M2 and number of non-NaN values of every window
+        self.mean = np.zeros((len(self.windows), n_series))
+        self.m2 = np.zeros((len(self.windows), n_series))
+        self.count = np.zeros((len(self.windows), n_series), dtype=int)
+
+    def _update(self, x):
+        size = len(self.buffer)
+        for i, window in enumerate(self.windows):
+            mean, m2, count = self.mean[i], self.m2[i], self.count[i]
+            if self.n_seen >= window:
+                # the oldest value leaves the window, unless it is NaN
+                x_out = self.buffer[(self.n_seen - window) % size]
+                leaves = ~np.isnan(x_out)
+                left = count - leaves
+                x_out = np.where(leaves, x_out, 0.0)
+                new_mean = np.where(
+                    left > 0, (mean * count - x_out) / np.maximum(left, 1), 0.0
+                )
+                m2 = np.where(leaves, m2 - (x_out - mean) * (x_out - new_mean), m2)
+                m2 = np.where(left > 0, m2, 0.0)
+                mean, count = new_mean, left
+            enters = ~np.isnan(x)
+            count = count + enters
+            delta = np.where(enters, x - mean, 0.0)
+            new_mean = mean + delta / np.maximum(count, 1)
+            m2 = m2 + np.where(enters, delta * (np.where(enters, x, 0.0) - new_mean), 0)
+            self.mean[i], self.m2[i], self.count[i] = new_mean, m2, count
+        self.buffer[self.n_seen % size] = x
+        self.n_seen += 1
+
+    def history(self):
+        """The kept points in order, NaN before the first point."""
+        size = len(self.buffer)
+        return self.buffer[(self.n_seen - size + np.arange(size)) % size]
+
+    def _reset_moments(self):
+        # running moments of the current windows, from the kept points
+        history = self.history()
+        for i, window in enumerate(self.windows):
+            values = history[-window:]
+            valid = ~np.isnan(values)
+            count = valid.sum(axis=0)
+            total = np.where(valid, values, 0.0).sum(axis=0)
+            mean = np.where(count > 0, total / np.maximum(count, 1), 0.0)
+            deviations = np.where(valid, values - mean, 0.0)
+            self.mean[i], self.count[i] = mean, count
+            self.m2[i] = (deviations**2).sum(axis=0)
+
+    def current(self):
+        """Statistics of the current windows, {stat: (n_windows, n_series)}."""
+        result = {stat: np.full(self.mean.shape, np.nan) for stat in STATS}
+        history = self.history()
+        for i, window in enumerate(self.windows):
+            full = self.count[i] == window
+            if not full.any():
+                continue
+            values = history[-window:]
+            result["mean"][i] = np.where(full, self.mean[i], np.nan)
+            if window > 1:
+                std = np.sqrt(np.maximum(self.m2[i], 0) / (window - 1))
+                result["std"][i] = np.where(full, std, np.nan)
+            result["min"][i] = np.where(full, values.min(axis=0), np.nan)
+            result["max"][i] = np.where(full, values.max(axis=0), np.nan)
+        return result
+
+    def append(self, values):
+        """
+        Add new points, values has shape (n_points, n_series) (or
+        (n_series,) for a single point). Returns the statistics after each
+        new point as {stat: array of shape (n_points, n_windows, n_series)}.
+        """
+        values = np.asarray(values, dtype=float).reshape(-1, self.n_series)
+        if len(values) <= STREAM_POINTS:
+            out = {stat: np.empty((len(values),) + self.mean.shape) for stat in STATS}
+            for t, x in enumerate(values):
+                self._update(x)
+                for stat, value in self.current().items():
+                    out[stat][t] = value
+            return out
+        # a longer batch: vectorized over the kept points and the new ones
+        size = len(self.buffer)
+        points = np.vstack([self.history(), values])
+        stats = window_stats(points, self.windows)
+        self.n_seen += len(values)
+        self.buffer[(self.n_seen - size + np.arange(size)) % size] = points[-size:]
+        self._reset_moments()
+        return {stat: array[size:] for stat, array in stats.items()}
+
+    def to_dict(self):
+        """State of the engine (JSON-serializable), see from_dict."""
+        return {
+            "windows": self.windows,
+            "n_series": self.n_series,
+            "n_seen": self.n_seen,
+            "buffer": self.buffer.tolist(),
+            "mean": self.mean.tolist(),
+            "m2": self.m2.tolist(),
+            "count": self.count.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        """Engine resuming from a state of to_dict, e.g. on the next day."""
+        engine = cls(state["windows"], state["n_series"])
+        engine.n_seen = state["n_seen"]
+        engine.buffer = np.array(state["buffer"], dtype=float)
+        engine.mean = np.array(state["mean"], dtype=float)
+        engine.m2 = np.array(state["m2"], dtype=float)
+        engine.count = np.array(state["count"], dtype=int)
+        return engine
+
+
+def _to_frame(stats, windows, columns, index, center):
+    # {stat: (n_points, n_windows, n_series)} -> columns (stat, window, series)
+    frames = {}
+    for stat, values in stats.items():
+        for i, window in enumerate(windows):
+            block = values[:, i, :]
+            if center:
+                # the centered window at t is the trailing one ending at
+                # t + (window - 1) // 2, as with rolling(center=True)
+                offset = (window - 1) // 2
+                block = np.vstack(
+                    [block[offset:], np.full((offset, block.shape[1]), np.nan)]
+                )
+            for j, col in enumerate(columns):
+                frames[(stat, window, col)] = block[:, j]
+    result = pd.DataFrame(frames, index=index)
+    result.columns = result.columns.set_names(["stat", "window", "series"])
+    # sorted columns keep label lookups such as result["mean", 10] fast
+    return result.sort_index(axis=1)
+
+
+@timed("rolling_stats")
+def rolling_stats(data, windows, center=False):
+    """
+    Rolling mean, std, min and max of every column of data (a DataFrame or
+    Series) for every window size in windows, vectorized over the points.
+    Returns a DataFrame with columns (stat, window, series), e.g.
+    result["mean", 10, "registered"] == data.registered.rolling(10).mean()
+    """
+    frame = data.to_frame() if isinstance(data, pd.Series) else data
+    windows = list(windows)
+    stats = window_stats(frame.to_numpy(dtype=float), windows)
+    return _to_frame(stats, windows, list(frame.columns), frame.index, center)
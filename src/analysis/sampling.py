@@ -0,0 +1,74 @@
+# --------------------------------------------------------------
+# Reproducible, vectorized sampling
+# --------------------------------------------------------------
+"""
+Draws many random samples of row indices at once with a seeded
+numpy.random.Generator. All samples come back as one 2-D index array (one
+row per sample), which can be reused to compute any number of statistics
+on any column with a single numpy reduction. The same seed always gives the
+same samples; unlike random.seed, which doesn't affect pandas' sample.
+"""
+
+import numpy as np
+
+
+def _random_subsets(rng, n, size, n_samples):
+    # n_samples random subsets of size rows out of n: the positions of the
+    # size smallest of n random keys, without sorting the rest
+    if size == n:
+        return np.tile(np.arange(n), (n_samples, 1))
+    keys = rng.random((n_samples, n))
+    return np.argpartition(keys, size - 1, axis=1)[:, :size]
+
+
+def sample_indices(n, size=None, frac=None, n_samples=1, replace=False, seed=None):
+    """
+    Indices of n_samples random samples of size rows (or frac of the rows)
+    out of n, as an array of shape (n_samples, size).
+    """
+    if size is None:
+        size = int(round(frac * n))
+    rng = np.random.default_rng(seed)
+    if replace:
+        return rng.integers(0, n, (n_samples, size))
+    return _random_subsets(rng, n, size, n_samples)
+
+
+def strata_codes(data, columns):
+    """Integer code of the stratum (combination of columns) of every row."""
+    return data.groupby(columns, observed=True, sort=True).ngroup().to_numpy()
+
+
+def stratified_sample_indices(strata, frac, n_samples=1, seed=None):
+    """
+    Indices of n_samples stratified samples without replacement: each
+    stratum contributes round(frac * its size) rows, so every sample has the
+    same composition as the data. strata holds the stratum code of each row
+    (see strata_codes). Returns an array of shape (n_samples, sample size).
+    """
+    strata = np.asarray(strata)
+    rng = np.random.default_rng(seed)
+    codes, counts = np.unique(strata, return_counts=True)
+    takes = np.round(frac * counts).astype(int)
+
+    # sorting code + random key in [0, 1) groups the rows by stratum in a
+    # random order inside each stratum; the strata are at the same positions
+    # in every row, so the first takes[s] positions of each stratum select
+    # the same columns for all samples
+    rank = np.searchsorted(codes, strata)
+    keys = rank + rng.random((n_samples, len(strata)))
+    order = np.argsort(keys, axis=1)
+
+    starts = np.cumsum(counts) - counts
+    offsets = np.arange(takes.sum()) - np.repeat(np.cumsum(takes) - takes, takes)
+    selected = np.repeat(starts, takes) + offsets
+    return order[:, selected]
+
+
+def sample_statistic(values, indices, statistic=np.mean):
+    """
+    Apply statistic (a numpy reduction taking an axis argument, e.g. np.mean,
+    np.median, np.var) to every sample of values given by indices.
+    Returns one value per sample.
+    """
+    return statistic(np.asarray(values)[indices], axis=1)
@@ -0,0 +1,262 @@
+# --------------------------------------------------------------
+# Compute-only stages of the analysis
+# --------------------------------------------------------------
+"""
+The numbers of the four visualization scripts (summaries, tests,
+correlations, stationarity), without any figure. Every stage takes the
+loaded data and returns a dict {table name: DataFrame}, ready to be printed
+or written to disk by a headless job.
+
+Nothing here imports matplotlib or seaborn, and statsmodels is only imported
+by the functions that need it (ADF tests, p-value corrections), so importing
+this module, and running the stages that don't test stationarity, stays as
+light as pandas and scipy.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.stats import ttest_1samp, ttest_ind
+
+from analysis.correlations import compute_correlations, correlation_table
+from analysis.cube import cuboid_for, rollup_moments, rollup_summary, rollup_totals
+from analysis.hypothesis import moments_ttest_1samp, moments_ttest_ind
+from analysis.resampling import bootstrap_test, permutation_test, prepare_samples
+from analysis.rolling import rolling_stats
+from analysis.sampling import (
+    sample_indices,
+    sample_statistic,
+    strata_codes,
+    stratified_sample_indices,
+)
+from analysis.stationarity import adf_screen
+from analysis.timeseries import RideSeries
+from instrumentation import stage
+
+RIDE_TYPES = ["registered", "casual"]
+WEATHER_FEATURES = ["temp", "atemp", "hum", "windspeed"]
+WEEKEND_DAYS = ["Saturday", "Sunday"]
+SEGMENTS = ["season", "yr", "weathersit", "hr"]
+
+# columns each stage reads from the preprocessed data
+STAGE_COLUMNS = {
+    "temporal": [],
+    "hypothesis": ["season", "yr", "weathersit", "hr", "weekday"] + RIDE_TYPES,
+    "weather": WEATHER_FEATURES + RIDE_TYPES,
+    "timeseries": ["dteday", "hr"] + RIDE_TYPES,
+}
+
+
+def temporal_stage(cube):
+    """Daily totals and the mean rides per weekday/season and hour."""
+    tables = {"daily_rides": rollup_totals(cube, ["dteday"], RIDE_TYPES).reset_index()}
+    for by in [["weekday", "hr"], ["season", "hr"], ["season", "weekday"]]:
+        tables[f"{'_'.join(by)}_summary"] = rollup_summary(cube, by, RIDE_TYPES)
+    return tables
+
+
+def _test_row(test, ride_type, statistic, p_value, **extra):
+    return {
+        "test": test,
+        "type": ride_type,
+        "statistic": float(statistic),
+        "p_value": float(p_value),
+        **extra,
+    }
+
+
+def hypothesis_stage(data, cube, n_resamples=10_000, seed=111, n_jobs=1):
+    """
+    The tests of the hypothesis testing script: one-sample t-tests of a
+    biased (summer 2011) and a random sample, the sampling distribution of
+    the mean, weekend vs working days (t, permutation and bootstrap tests)
+    and the t-tests of every segment.
+    """
+    rows = []
+    registered = data["registered"].to_numpy()
+    population_mean = registered.mean()
+
+    summer = (data["season"] == "summer").to_numpy() & (data["yr"] == 2011).to_numpy()
+    with stage("ttest_1samp"):
+        result = ttest_1samp(registered[summer], population_mean)
+    rows.append(_test_row("t_1samp_summer_2011", "registered", *result))
+    sample = registered[sample_indices(len(registered), frac=0.5, seed=seed)[0]]
+    with stage("ttest_1samp"):
+        result = ttest_1samp(sample, population_mean)
+    rows.append(_test_row("t_1samp_random_half", "registered", *result))
+
+    weekend = data["weekday"].isin(WEEKEND_DAYS).to_numpy()
+    for ride_type, statistic in [("registered", "mean"), ("casual", "rank")]:
+        values = data[ride_type].to_numpy()
+        samples = prepare_samples(values[weekend], values[~weekend])
+        with stage("ttest_ind"):
+            result = ttest_ind(*samples[:2])
+        rows.append(_test_row("t_ind_weekend", ride_type, *result))
+        perm = permutation_test(
+            samples, None, statistic, n_resamples, seed=seed, n_jobs=n_jobs
+        )
+        rows.append(
+            _test_row(
+                f"permutation_{statistic}", ride_type, perm.statistic, perm.p_value
+            )
+        )
+        boot = bootstrap_test(
+            samples, n_resamples=n_resamples, seed=seed, n_jobs=n_jobs
+        )
+        rows.append(
+            _test_row(
+                "bootstrap_mean",
+                ride_type,
+                boot.statistic,
+                boot.p_value,
+                ci_low=boot.ci_low,
+                ci_high=boot.ci_high,
+            )
+        )
+
+    strata = strata_codes(data, ["season", "yr", "hr"])
+    samples_idx = stratified_sample_indices(strata, 0.05, n_samples=1000, seed=seed)
+    sampling = (
+        pd.DataFrame(
+            {
+                name: sample_statistic(registered, samples_idx, func)
+                for name, func in [("mean", np.mean), ("median", np.median)]
+            }
+        )
+        .agg(["mean", "std"])
+        .T
+    )
+
+    profile = cuboid_for(cube, ["season", "yr", "hr", "weekday"])
+    profile = profile.assign(weekend=profile["weekday"].isin(WEEKEND_DAYS))
+    popmean = data[RIDE_TYPES].mean().to_dict()
+    return {
+        "tests": pd.DataFrame(rows),
+        "sampling_distribution": sampling.rename_axis("statistic").reset_index(),
+        "segment_tests": moments_ttest_1samp(
+            rollup_moments(cube, SEGMENTS, RIDE_TYPES), popmean
+        ),
+        "weekend_segment_tests": moments_ttest_ind(
+            rollup_moments(profile, ["season", "yr", "hr", "weekend"], RIDE_TYPES),
+            ["season", "yr", "hr"],
+            "weekend",
+        ),
+    }
+
+
+def weather_stage(data):
+    """
+    Pearson and Spearman correlations of the weather with the rides, and the
+    Pearson matrix of all of them.
+    """
+    columns = WEATHER_FEATURES + RIDE_TYPES
+    result = compute_correlations(data, columns)
+    tables = {
+        "correlations": correlation_table(result, WEATHER_FEATURES, RIDE_TYPES)
+        .rename_axis("correlation")
+        .reset_index()
+    }
+    for name in ["pearson", "spearman", "pearson_p", "spearman_p"]:
+        matrix = getattr(result, name).loc[WEATHER_FEATURES, RIDE_TYPES]
+        tables[name] = matrix.rename_axis("feature").reset_index()
+    matrix = result.pearson.loc[columns, columns]
+    tables["pearson_matrix"] = matrix.rename_axis("feature").reset_index()
+    return tables
+
+
+def stationarity_panel(rides, hourly_rides=None):
+    """
+    The series tested by the time series script, from a RideSeries of the
+    ride types: daily totals, their differences with the 10 days rolling
+    mean and with the previous day, and the residuals of their weekly
+    decomposition; plus the residuals of the hourly decompositions (24 and
+    168 hours) of hourly_rides, when given.
+    """
+    daily = rides.view("daily")
+    rolling_means = rolling_stats(daily, [10])["mean", 10]
+    panel = {}
+    for col in daily.columns:
+        panel[col] = daily[col]
+        panel[f"{col}_ma_difference"] = (daily[col] - rolling_means[col]).dropna()
+        panel[f"{col}_last_difference"] = daily[col].diff().dropna()
+    for col in daily.columns:
+        resid = rides.decomposition(col, 7, "daily").components()["resid"]
+        panel[f"{col}_resid"] = resid.dropna()
+    if hourly_rides is not None:
+        for period in [24, 168]:
+            decomposition = hourly_rides.decomposition("registered", period)
+            panel[f"registered_hourly_resid_{period}"] = decomposition.components()[
+                "resid"
+            ]
+    return panel
+
+
+def panel_table(panel):
+    """The series of a stationarity panel as one long frame."""
+    return pd.concat(
+        [
+            pd.DataFrame({"series": name, "datetime": ts.index, "value": ts.to_numpy()})
+            for name, ts in panel.items()
+        ],
+        ignore_index=True,
+    )
+
+
+def panel_series(table, name):
+    """One series of a panel_table, indexed by its datetimes."""
+    rows = table[table["series"] == name]
+    return pd.Series(
+        rows["value"].to_numpy(), index=pd.DatetimeIndex(rows["datetime"]), name=name
+    )
+
+
+def decomposition_result(table, series, period, resolution="daily"):
+    """
+    One decomposition of a decomposition_table as a statsmodels
+    DecomposeResult (e.g. to plot it), its observed component named series.
+    """
+    from statsmodels.tsa.seasonal import DecomposeResult
+
+    rows = table[
+        (table["series"] == series)
+        & (table["period"] == period)
+        & (table["resolution"] == resolution)
+    ].set_index("datetime")
+    components = {
+        col: rows[col].rename(series if col == "observed" else col)
+        for col in ["observed", "seasonal", "trend", "resid"]
+    }
+    return DecomposeResult(**components)
+
+
+def decomposition_table(*series):
+    """
+    The components of every decomposition cached by the RideSeries, one row
+    per timestamp, with the column, period and resolution of each one.
+    """
+    frames = []
+    for rides in series:
+        for (column, period, resolution), result in rides.decompositions.items():
+            components = result.components().rename_axis("datetime").reset_index()
+            components.insert(0, "series", column)
+            components.insert(1, "period", period)
+            components.insert(2, "resolution", resolution)
+            frames.append(components)
+    return pd.concat(frames, ignore_index=True)
+
+
+def timeseries_stage(data, cache_dir=None, n_jobs=None):
+    """
+    Daily totals, missing hours, the components of the decompositions, and
+    the ADF test and values of every series of the time series script
+    (statsmodels is imported here).
+    """
+    rides = RideSeries(data, columns=RIDE_TYPES)
+    hourly_rides = RideSeries(data, columns=["registered"], fill="interpolate")
+    panel = stationarity_panel(rides, hourly_rides)
+    return {
+        "daily_rides": rides.view("daily").reset_index(),
+        "gaps": rides.gaps,
+        "decomposition": decomposition_table(rides, hourly_rides),
+        "stationarity": adf_screen(panel, n_jobs, cache_dir).reset_index(),
+        "series": panel_table(panel),
+    }
@@ -0,0 +1,128 @@
+# --------------------------------------------------------------
+# Batch ADF stationarity screening
+# --------------------------------------------------------------
+"""
+Runs the augmented Dickey-Fuller test over a whole panel of series (e.g.
+every station or segment, in raw, differenced and residual form) and
+returns one tidy table, without any plotting.
+
+Tests run in a process pool, and every result is cached on disk under a key
+made of a hash of the series values and of the adfuller parameters, so
+screening the same panel again only tests the series that changed.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from analysis.parallel import cpu_count, process_pool
+from instrumentation import timed
+
+COLUMNS = [
+    "adf_stat",
+    "p_value",
+    "used_lag",
+    "n_obs",
+    "crit_1%",
+    "crit_5%",
+    "crit_10%",
+]
+
+
+@timed("adf_test")
+def adf_test(values, **adf_kwargs):
+    """ADF test of values, as a dict with the keys of COLUMNS."""
+    from statsmodels.tsa.stattools import adfuller
+
+    adf_stat, p_value, used_lag, n_obs, critical = adfuller(values, **adf_kwargs)[:5]
+    return {
+        "adf_stat": float(adf_stat),
+        "p_value": float(p_value),
+        "used_lag": int(used_lag),
+        "n_obs": int(n_obs),
+        "crit_1%": float(critical["1%"]),
+        "crit_5%": float(critical["5%"]),
+        "crit_10%": float(critical["10%"]),
+    }
+
+
+def _clean(series):
+    # ADF can't handle missing values, drop them as the scripts did
+    return np.asarray(pd.Series(series).dropna(), dtype=np.float64)
+
+
+def cache_key(values, adf_kwargs):
+    """Hash of the series values and the adfuller parameters."""
+    digest = hashlib.sha256(np.ascontiguousarray(values).tobytes())
+    digest.update(json.dumps(adf_kwargs, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def _read_cache(cache_dir, key):
+    path = os.path.join(cache_dir, f"{key}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_cache(cache_dir, key, result):
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, f"{key}.json"), "w") as f:
+        json.dump(result, f)
+
+
+def _adf_task(values, adf_kwargs):
+    return adf_test(values, **adf_kwargs)
+
+
+@timed("adf_screen")
+def adf_screen(panel, n_jobs=None, cache_dir=None, **adf_kwargs):
+    """
+    ADF test of every series of panel (a dict {name: series} or a DataFrame,
+    one series per column). NaNs are dropped before testing.
+    n_jobs: worker processes (all cores when None, 1 runs in this process)
+    cache_dir: directory of cached results, no caching when None
+    adf_kwargs: passed to statsmodels' adfuller (maxlag, regression, ...)
+    Returns a DataFrame indexed by series name with the columns of COLUMNS
+    and "cached" (whether the result came from the cache).
+    """
+    series = {name: _clean(values) for name, values in panel.items()}
+    keys = {name: cache_key(values, adf_kwargs) for name, values in series.items()}
+
+    results = {}
+    cached = {}
+    for name, key in keys.items():
+        hit = _read_cache(cache_dir, key) if cache_dir else None
+        cached[name] = hit is not None
+        if hit is not None:
+            results[name] = hit
+
+    todo = [name for name in series if name not in results]
+    processes = min(n_jobs or cpu_count(), len(todo))
+    if todo:
+        if processes <= 1:
+            computed = [_adf_task(series[name], adf_kwargs) for name in todo]
+        else:
+            with process_pool(processes) as pool:
+                computed = list(
+                    pool.map(
+                        _adf_task,
+                        [series[name] for name in todo],
+                        [adf_kwargs] * len(todo),
+                    )
+                )
+        for name, result in zip(todo, computed):
+            results[name] = result
+            if cache_dir:
+                _write_cache(cache_dir, keys[name], result)
+
+    table = pd.DataFrame.from_dict(
+        {name: results[name] for name in series}, orient="index", columns=COLUMNS
+    )
+    table["cached"] = pd.Series(cached)
+    table.index.name = "series"
+    return table
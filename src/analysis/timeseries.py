@@ -0,0 +1,83 @@
+# --------------------------------------------------------------
+# Hourly time series of rides
+# --------------------------------------------------------------
+"""
+Time series of the ride counts at hourly resolution. The timestamp of every
+row is built once from dteday + hr, and the counts are kept as one compact
+hourly frame (one column per count, a DatetimeIndex with every hour). Hours
+missing from the data count 0 by default, or are imputed (see analysis.gaps).
+
+Coarser views are resampled from the next finer cached view (days from
+hours, weeks and months from days), and every view and decomposition is
+cached, so looking at the same data at several resolutions doesn't rebuild
+or regroup the frame each time.
+"""
+
+import numpy as np
+import pandas as pd
+
+from analysis.decomposition import decompose
+from analysis.gaps import gap_report, reindex_hours
+from instrumentation import timed
+
+COUNTS = ["casual", "registered", "cnt"]
+
+# resampling frequency of every view, and the view it is resampled from
+FREQUENCIES = {"hourly": "h", "daily": "D", "weekly": "W", "monthly": "MS"}
+SOURCES = {"daily": "hourly", "weekly": "daily", "monthly": "daily"}
+
+
+def hourly_index(data):
+    """DatetimeIndex of the hour of every row, from its dteday and hr."""
+    timestamps = pd.to_datetime(data["dteday"]) + pd.to_timedelta(data["hr"], "h")
+    return pd.DatetimeIndex(timestamps, name="datetime")
+
+
+@timed("hourly_totals")
+def hourly_totals(data, columns=COUNTS, fill="zero"):
+    """
+    Totals of columns for every hour of the days in data, the missing hours
+    filled with fill (see analysis.gaps.reindex_hours).
+    """
+    hourly = reindex_hours(data, columns, fill)
+    # counts stay integers unless they were interpolated
+    return hourly.astype(np.float32 if fill == "interpolate" else np.int32)
+
+
+class RideSeries:
+    """
+    Hourly ride counts, with cached resampled views and decompositions.
+    data: the preprocessed frame (dteday, hr and the count columns)
+    fill: how the missing hours are filled ("zero", "ffill" or "interpolate")
+    gaps: the runs of missing hours of data (see analysis.gaps.gap_report)
+    """
+
+    def __init__(self, data, columns=COUNTS, fill="zero"):
+        self.columns = list(columns)
+        self.fill = fill
+        self.gaps = gap_report(data)
+        self.views = {"hourly": hourly_totals(data, self.columns, fill)}
+        self.decompositions = {}
+
+    def view(self, resolution="hourly"):
+        """Totals at resolution ("hourly", "daily", "weekly" or "monthly")."""
+        if resolution not in self.views:
+            source = self.view(SOURCES[resolution])
+            rule = FREQUENCIES[resolution]
+            self.views[resolution] = source.resample(rule).sum()
+        return self.views[resolution]
+
+    def series(self, column, resolution="hourly"):
+        """One count column at resolution, as float for the statistics."""
+        return self.view(resolution)[column].astype(float)
+
+    def decomposition(self, column, period, resolution="hourly"):
+        """
+        IncrementalDecomposition of column at resolution with the seasonal
+        period (e.g. 24 or 168 hours), computed once.
+        """
+        key = (column, period, resolution)
+        if key not in self.decompositions:
+            series = self.series(column, resolution)
+            self.decompositions[key] = decompose(series, period)
+        return self.decompositions[key]
@@ -0,0 +1,50 @@
+# --------------------------------------------------------------
+# Benchmark: vectorized decoding vs per-row apply
+# --------------------------------------------------------------
+"""
+Compares decode_columns with the original Series.apply(lambda x: mapping[x])
+path on synthetic data with the schema of hour.csv (see synthetic.py).
+
+run from src/benchmarks:  python bench_decoding.py [scale ...]
+"""
+
+import sys
+import time
+
+sys.path.append("..")
+from benchmarks.synthetic import synthetic_hours
+from data.decoding import decode_apply, decode_columns
+
+
+def best_of(func, data, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(data)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def memory_mb(data, cols):
+    return data[cols].memory_usage(deep=True).sum() / 2**20
+
+
+if __name__ == "__main__":
+    scales = [int(s) for s in sys.argv[1:]] or [1, 10, 50]
+    cols = ["season", "yr", "weekday", "weathersit"]
+
+    print(
+        f"{'scale':>6} {'rows':>10} {'apply s':>9} {'vector s':>9} "
+        f"{'speedup':>8} {'apply MB':>9} {'vector MB':>9}"
+    )
+    for scale in scales:
+        data = synthetic_hours(scale)
+        t_apply, applied = best_of(decode_apply, data)
+        t_vector, decoded = best_of(decode_columns, data)
+        # both paths must give the same labels
+        assert (applied[cols].astype(str) == decoded[cols].astype(str)).all().all()
+        print(
+            f"{scale:>6} {len(data):>10} {t_apply:>9.3f} {t_vector:>9.3f} "
+            f"{t_apply / t_vector:>7.1f}x {memory_mb(applied, cols):>9.1f} "
+            f"{memory_mb(decoded, cols):>9.1f}"
+        )
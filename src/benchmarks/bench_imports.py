@@ -0,0 +1,81 @@
+# --------------------------------------------------------------
+# Benchmark: startup time of compute-only vs full-report runs
+# --------------------------------------------------------------
+"""
+Measures, in fresh interpreters, the time to import what a compute-only
+job needs (analysis.stages and the data loaders) against what a full
+report needs (the same plus the figures, rendering and plot settings, i.e.
+seaborn and matplotlib, and statsmodels for the decompositions plots).
+
+For every entry point it reports the best wall time of the import over
+several runs, and the time spent importing each of the heavy libraries,
+from python -X importtime.
+
+run from src/benchmarks:  python bench_imports.py [repeat]
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+HEAVY = ["seaborn", "matplotlib", "statsmodels", "scipy", "pandas"]
+ENTRY_POINTS = {
+    "compute-only": "import analysis.stages, data.interim",
+    "full report": (
+        "import analysis.stages, data.interim; "
+        "import visualization.figures, visualization.rendering; "
+        "from visualization.plot_settings import apply_plot_settings; "
+        "import statsmodels.tsa.seasonal"
+    ),
+}
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(code, *options):
+    # run code in a fresh interpreter with src on the path
+    return subprocess.run(
+        [sys.executable, *options, "-c", code],
+        cwd=SRC,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def wall_time(code, repeat=5):
+    """Best wall time (s) of a fresh interpreter running code."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(code)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def import_times(code):
+    """
+    {library: import time in ms} of the HEAVY libraries imported by code: the
+    sum of the self times of all their modules, from python -X importtime.
+    """
+    stderr = run(code, "-X", "importtime").stderr
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_time, _, name = line[len("import time:") :].split("|")
+        library = name.strip().split(".")[0]
+        if library in HEAVY and self_time.strip().isdigit():
+            times[library] = times.get(library, 0) + int(self_time) / 1000
+    return times
+
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    baseline = wall_time("pass", repeat)
+    print(f"interpreter startup: {baseline:.3f}s")
+    for name, code in ENTRY_POINTS.items():
+        seconds = wall_time(code, repeat)
+        print(f"\n{name}: {seconds:.3f}s ({seconds - baseline:.3f}s of imports)")
+        for library, ms in import_times(code).items():
+            print(f"  {library:<12} {ms:>8.1f} ms")
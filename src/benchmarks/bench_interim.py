@@ -0,0 +1,94 @@
+# --------------------------------------------------------------
+# Benchmark: loading the interim data, pickle vs parquet
+# --------------------------------------------------------------
+"""
+Times loading the preprocessed data from a pickle (the previous interim
+format) against parquet: full loads, the column projection used by the
+time series script, a filtered (predicate pushdown) load and the
+memory-mapped column cache.
+
+run from src/benchmarks:  python bench_interim.py [scale ...]
+"""
+
+import os
+import sys
+import tempfile
+import time
+import pandas as pd
+
+sys.path.append("..")
+from benchmarks.synthetic import synthetic_hours
+from data.interim import (
+    load_column_cache,
+    load_interim,
+    save_column_cache,
+    save_interim,
+)
+from data.preprocessing import preprocess
+from data.schema import enforce_schema
+
+
+def best_of(func, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    scales = [int(s) for s in sys.argv[1:]] or [1, 10, 50]
+    print(f"{'scale':>6} {'rows':>10} {'load':<36} {'seconds':>8} {'size MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        pickle_path = os.path.join(tmp, "data.plk")
+        parquet_path = os.path.join(tmp, "data.parquet")
+        cache_dir = os.path.join(tmp, "columns")
+        for scale in scales:
+            data = enforce_schema(preprocess(synthetic_hours(scale)))
+            data.to_pickle(pickle_path)
+            save_interim(data, parquet_path)
+            save_column_cache(data, cache_dir)
+            pickle_mb = os.path.getsize(pickle_path) / 2**20
+            parquet_mb = os.path.getsize(parquet_path) / 2**20
+            cache_mb = (
+                sum(os.path.getsize(e.path) for e in os.scandir(cache_dir)) / 2**20
+            )
+
+            loads = {
+                "pickle, all columns": (
+                    lambda: pd.read_pickle(pickle_path),
+                    pickle_mb,
+                ),
+                "parquet, all columns": (
+                    lambda: load_interim(path=parquet_path),
+                    parquet_mb,
+                ),
+                "parquet, dteday/registered/casual": (
+                    lambda: load_interim(
+                        columns=["dteday", "registered", "casual"],
+                        path=parquet_path,
+                    ),
+                    parquet_mb,
+                ),
+                "parquet, registered of summer 2011": (
+                    lambda: load_interim(
+                        columns=["registered"],
+                        filters=[("season", "==", "summer"), ("yr", "==", 2011)],
+                        path=parquet_path,
+                    ),
+                    parquet_mb,
+                ),
+                "column cache, weather + rides": (
+                    lambda: load_column_cache(
+                        columns=["temp", "atemp", "hum", "windspeed", "registered"],
+                        cache_dir=cache_dir,
+                    ),
+                    cache_mb,
+                ),
+            }
+            for name, (load, size) in loads.items():
+                print(
+                    f"{scale:>6} {len(data):>10} {name:<36} "
+                    f"{best_of(load):>8.4f} {size:>8.1f}"
+                )
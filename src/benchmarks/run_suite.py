@@ -0,0 +1,341 @@
+# --------------------------------------------------------------
+# Benchmark suite of the whole analysis pipeline
+# --------------------------------------------------------------
+"""
+Times every stage of the pipeline, from reading the raw csv to rendering
+figures, on synthetic data with the schema of hour.csv (see synthetic.py)
+at several scales, and records the peak memory of each stage.
+
+Each stage is timed repeat times (the best time is kept), then run once more
+under tracemalloc for its peak of allocated memory, which includes numpy
+and pandas buffers (but not pyarrow's own memory pool, used by the parquet
+reads and writes). The results are written as JSON with the versions of the
+libraries, and can be compared with an earlier run: stages slower than the
+baseline by more than the threshold are reported as regressions and the
+suite exits with status 1.
+
+The default scales are 1x, 10x and 100x. 1000x (17 million rows) is opt-in:
+memory grows linearly with the scale, and 100x already peaks at 2.4 GB of
+resident memory (80 s on one core), so 1000x needs about 24 GB and a quarter
+of an hour, more than a laptop or a CI runner has. Pass --scales 1 10 100 1000
+on a machine with the memory for it.
+
+run from src/benchmarks:
+    python run_suite.py [--scales 1 10 100 1000] [--stages load decode ...]
+                        [--repeat N] [--output results.json]
+                        [--compare baseline.json] [--threshold 1.25]
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.append("..")
+from analysis.correlations import compute_correlations
+from analysis.cube import (
+    build_cube,
+    cuboid_for,
+    materialize,
+    rollup_moments,
+    rollup_summary,
+    rollup_totals,
+)
+from analysis.hypothesis import moments_ttest_1samp, moments_ttest_ind
+from analysis.rolling import rolling_stats
+from analysis.stationarity import adf_screen
+from analysis.timeseries import RideSeries
+from benchmarks.synthetic import synthetic_hours
+from data.interim import load_interim, save_column_cache, save_interim
+from data.preprocessing import preprocess
+from data.schema import enforce_schema
+from data.validation import validate
+from instrumentation import max_rss_mb
+
+RESULTS_DIR = "results"
+WEATHER = ["temp", "atemp", "hum", "windspeed"]
+RIDES = ["registered", "casual", "cnt"]
+ROLLING_WINDOWS = [7, 10, 24]
+# 1000x is opt-in, see above
+DEFAULT_SCALES = [1, 10, 100]
+
+
+# every stage takes the context of the run, reads what the previous stages
+# left in it and adds its own results
+
+
+def stage_load(ctx):
+    ctx["raw"] = pd.read_csv(ctx["csv"])
+
+
+def stage_validate(ctx):
+    validate(ctx["raw"])
+
+
+def stage_decode(ctx):
+    ctx["data"] = enforce_schema(preprocess(ctx["raw"]))
+
+
+def stage_persist(ctx):
+    save_interim(ctx["data"], ctx["parquet"])
+    save_column_cache(ctx["data"], ctx["columns"])
+    load_interim(columns=["dteday", "registered", "casual"], path=ctx["parquet"])
+
+
+def stage_aggregate(ctx):
+    cube = ctx["cube"] = materialize(build_cube(ctx["data"]))
+    ctx["daily"] = rollup_totals(cube, ["dteday"], ["registered", "casual"])
+    for by in [["weekday", "hr"], ["season", "hr"], ["season", "weekday"]]:
+        ctx[f"summary_{'_'.join(by)}"] = rollup_summary(
+            cube, by, ["registered", "casual"]
+        )
+
+
+def stage_correlations(ctx):
+    compute_correlations(ctx["data"], WEATHER + RIDES)
+
+
+def stage_ttests(ctx):
+    cube = ctx["cube"]
+    segments = ["season", "yr", "weathersit", "hr"]
+    popmean = ctx["data"][["registered", "casual"]].mean().to_dict()
+    moments_ttest_1samp(
+        rollup_moments(cube, segments, ["registered", "casual"]), popmean
+    )
+    weekend = cuboid_for(cube, ["season", "yr", "hr", "weekday"])
+    weekend = weekend.assign(weekend=weekend.weekday.isin(["Saturday", "Sunday"]))
+    moments_ttest_ind(
+        rollup_moments(weekend, ["season", "yr", "hr", "weekend"], ["registered"]),
+        ["season", "yr", "hr"],
+        "weekend",
+    )
+
+
+def stage_adf(ctx):
+    daily = ctx["daily"]
+    panel = {name: daily[name] for name in daily.columns}
+    panel.update({f"{name}_diff": daily[name].diff() for name in daily.columns})
+    adf_screen(panel, n_jobs=1)
+
+
+def stage_decomposition(ctx):
+    rides = RideSeries(ctx["data"], columns=["registered"], fill="interpolate")
+    rides.decomposition("registered", 7, resolution="daily").components()
+    for period in [24, 168]:
+        rides.decomposition("registered", period).components()
+
+
+def stage_rolling(ctx):
+    rolling_stats(ctx["data"][RIDES], ROLLING_WINDOWS)
+
+
+def stage_rolling_pandas(ctx):
+    # the same statistics with pandas, as the reference for stage_rolling
+    rides = ctx["data"][RIDES].astype(float)
+    for window in ROLLING_WINDOWS:
+        rolling = rides.rolling(window)
+        rolling.mean(), rolling.std(), rolling.min(), rolling.max()
+
+
+def stage_render(ctx):
+    import matplotlib
+
+    matplotlib.use("Agg")
+    from visualization import figures
+    from visualization.plot_settings import apply_plot_settings
+    from visualization.rendering import FigureJob, render_jobs
+
+    apply_plot_settings()
+    render_jobs(
+        [
+            FigureJob(figures.rides_daily, ctx["daily"], ctx["figure"]),
+            FigureJob(
+                figures.rides_facet_barplot,
+                ctx["summary_weekday_hr"],
+                ctx["figure"],
+                {"row": "weekday", "x": "hr", "row_order": figures.WEEKDAYS_ORDER},
+            ),
+        ],
+        processes=1,
+        # always draw, this stage measures the rendering
+        state_path=None,
+    )
+
+
+STAGES = {
+    "load": stage_load,
+    "validate": stage_validate,
+    "decode": stage_decode,
+    "persist": stage_persist,
+    "aggregate": stage_aggregate,
+    "correlations": stage_correlations,
+    "ttests": stage_ttests,
+    "adf": stage_adf,
+    "decomposition": stage_decomposition,
+    "rolling": stage_rolling,
+    "rolling_pandas": stage_rolling_pandas,
+    "render": stage_render,
+}
+
+
+def measure(stage, ctx, repeat=1):
+    """Best time of repeat runs of stage, and its peak memory in MB."""
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        stage(ctx)
+        timings.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    stage(ctx)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak / 2**20
+
+
+def run_scale(scale, stages, repeat=1, seed=0):
+    """Run the stages on synthetic data at scale, one record per stage."""
+    records = []
+    with tempfile.TemporaryDirectory() as tmp:
+        ctx = {
+            "csv": os.path.join(tmp, "hour.csv"),
+            "parquet": os.path.join(tmp, "data.parquet"),
+            "columns": os.path.join(tmp, "columns"),
+            "figure": os.path.join(tmp, "figure.png"),
+        }
+        raw = synthetic_hours(scale, seed=seed)
+        raw.to_csv(ctx["csv"], index=False)
+        n_rows = len(raw)
+        del raw
+        # stages before the last selected one run even when they aren't
+        # selected (untimed), since the later stages use their results
+        last = max(list(STAGES).index(name) for name in stages)
+        for name, stage in list(STAGES.items())[: last + 1]:
+            if name not in stages:
+                stage(ctx)
+                continue
+            seconds, peak_mb = measure(stage, ctx, repeat)
+            records.append(
+                {
+                    "scale": scale,
+                    "rows": n_rows,
+                    "stage": name,
+                    "seconds": round(seconds, 6),
+                    "peak_mb": round(peak_mb, 3),
+                }
+            )
+            print(
+                f"{scale:>6} {n_rows:>10} {name:<14} "
+                f"{seconds:>9.3f} {peak_mb:>9.1f}",
+                flush=True,
+            )
+    return records
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+
+def run_suite(scales, stages=None, repeat=1, seed=0):
+    """Run the suite, returns the results as a JSON-serializable dict."""
+    stages = list(STAGES) if stages is None else list(stages)
+    print(f"{'scale':>6} {'rows':>10} {'stage':<14} {'seconds':>9} {'peak MB':>9}")
+    records = []
+    for scale in scales:
+        records.extend(run_scale(scale, stages, repeat, seed))
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(),
+        "repeat": repeat,
+        "seed": seed,
+        # maximum resident set size of the whole run, in MB (Linux: KB)
+        "max_rss_mb": max_rss_mb(),
+        "results": records,
+    }
+
+
+def save_results(results, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(results, baseline, threshold=1.25, min_seconds=0.01):
+    """
+    Compare the stages of results with the same (scale, stage) of baseline.
+    A stage regressed when it is more than threshold times slower and at
+    least min_seconds slower (shorter differences are noise).
+    Returns a DataFrame with the times, memory and ratios of both runs.
+    """
+    keys = ["scale", "stage"]
+    new = pd.DataFrame(results["results"]).set_index(keys)
+    old = pd.DataFrame(baseline["results"]).set_index(keys)
+    table = new[["seconds", "peak_mb"]].join(
+        old[["seconds", "peak_mb"]], rsuffix="_baseline", how="inner"
+    )
+    table["time_ratio"] = table["seconds"] / table["seconds_baseline"]
+    table["memory_ratio"] = table["peak_mb"] / table["peak_mb_baseline"]
+    table["regression"] = (table["time_ratio"] > threshold) & (
+        table["seconds"] - table["seconds_baseline"] >= min_seconds
+    )
+    return table.round(3)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--scales",
+        nargs="+",
+        type=int,
+        default=DEFAULT_SCALES,
+        help="multiples of hour.csv (default: 1 10 100, 1000 needs about 24 GB)",
+    )
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs per stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="results file (default: results/<time>.json)")
+    parser.add_argument("--compare", help="results file of a baseline run")
+    parser.add_argument(
+        "--threshold", type=float, default=1.25, help="slowdown reported as regression"
+    )
+    args = parser.parse_args()
+
+    # deprecation notices of the libraries would drown the timings
+    warnings.simplefilter("ignore", FutureWarning)
+    results = run_suite(args.scales, args.stages, args.repeat, args.seed)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"suite_{datetime.now():%Y%m%d_%H%M%S}.json"
+    )
+    save_results(results, output)
+    print(f"results written to {output}")
+
+    if args.compare:
+        table = compare(results, load_results(args.compare), args.threshold)
+        print(table.to_string())
+        regressions = table[table["regression"]]
+        if len(regressions):
+            print(f"{len(regressions)} regressions above {args.threshold}x")
+            sys.exit(1)
@@ -0,0 +1,133 @@
+# --------------------------------------------------------------
+# Synthetic hourly data with the schema of hour.csv
+# --------------------------------------------------------------
+"""
+Generates raw data with the columns, codes and value ranges of hour.csv for
+the benchmarks. A dataset at scale n holds n stations, each with the hours
+of 2011-2012 one after the other (like hour.csv repeated n times), with
+random weather and ride counts following the daily profiles of registered
+and casual users, and about 1% of the hours missing.
+
+Everything is drawn with one seeded numpy Generator over whole arrays, so
+the same scale and seed always give the same data, in time linear in the
+number of rows.
+"""
+
+import numpy as np
+import pandas as pd
+
+from data.decoding import WEATHERS
+
+START, END = "2011-01-01", "2012-12-31 23:00"
+COLUMNS = [
+    "instant",
+    "dteday",
+    "season",
+    "yr",
+    "mnth",
+    "hr",
+    "holiday",
+    "weekday",
+    "workingday",
+    "weathersit",
+    "temp",
+    "atemp",
+    "hum",
+    "windspeed",
+    "casual",
+    "registered",
+    "cnt",
+]
+
+# share of the hours of every weathersit code in hour.csv
+WEATHER_SHARES = [0.657, 0.261, 0.0818, 0.0002]
+# effect of the weather and of the season on the number of rides
+WEATHER_FACTORS = np.array([1.0, 0.85, 0.45, 0.2])
+SEASON_FACTORS = np.array([0.55, 1.0, 1.15, 1.0])
+# mean temp, atemp, hum and windspeed (normalized) per season
+SEASON_WEATHER = np.array(
+    [
+        [0.30, 0.30, 0.58, 0.22],
+        [0.55, 0.52, 0.63, 0.20],
+        [0.71, 0.66, 0.63, 0.17],
+        [0.42, 0.42, 0.67, 0.17],
+    ]
+)
+WEATHER_SPREAD = np.array([0.12, 0.11, 0.19, 0.12])
+
+
+def _bump(hours, center, width, height):
+    return height * np.exp(-(((hours - center) / width) ** 2))
+
+
+def hourly_profiles():
+    """Mean registered and casual rides per hour, on working and other days."""
+    h = np.arange(24)
+    registered_work = 10 + _bump(h, 8, 1.2, 330) + _bump(h, 17.5, 1.5, 400)
+    registered_work += _bump(h, 13, 3, 120)
+    registered_off = 10 + _bump(h, 14, 4, 200)
+    casual_work = 3 + _bump(h, 15, 3, 45)
+    casual_off = 3 + _bump(h, 14, 3, 140)
+    # indexed by [workingday, hour]
+    registered = np.stack([registered_off, registered_work])
+    casual = np.stack([casual_off, casual_work])
+    return registered, casual
+
+
+def calendar():
+    """Calendar columns of every hour of 2011-2012."""
+    hours = pd.date_range(START, END, freq="h")
+    month = hours.month.to_numpy()
+    return pd.DataFrame(
+        {
+            "dteday": hours.strftime("%Y-%m-%d"),
+            # meteorological seasons: winter = Dec-Feb, spring = Mar-May, ...
+            "season": (month % 12) // 3 + 1,
+            "yr": hours.year.to_numpy() - 2011,
+            "mnth": month,
+            "hr": hours.hour.to_numpy(),
+            # 0 = Sunday, as in hour.csv
+            "weekday": (hours.dayofweek.to_numpy() + 1) % 7,
+        }
+    )
+
+
+def synthetic_hours(scale=1, seed=0, missing=0.01):
+    """
+    Raw hourly data of scale stations over 2011-2012, with the columns of
+    hour.csv; each hour is missing with probability missing.
+    """
+    rng = np.random.default_rng(seed)
+    base = calendar()
+    data = base.iloc[np.tile(np.arange(len(base)), scale)].reset_index(drop=True)
+    n = len(data)
+
+    # the same holidays for all stations, about 3% of the days
+    days = pd.factorize(base["dteday"])[0]
+    holiday_days = rng.random(days.max() + 1) < 0.03
+    data["holiday"] = np.tile(holiday_days[days], scale).astype(np.int64)
+    weekday = data["weekday"].to_numpy()
+    data["workingday"] = (
+        (weekday >= 1) & (weekday <= 5) & (data["holiday"] == 0)
+    ).astype(np.int64)
+    weathersit = rng.choice(len(WEATHERS), size=n, p=WEATHER_SHARES)
+    data["weathersit"] = weathersit + 1
+
+    season = data["season"].to_numpy() - 1
+    weather = SEASON_WEATHER[season] + rng.normal(size=(n, 4)) * WEATHER_SPREAD
+    weather = np.clip(weather, 0, 1).round(4)
+    for i, col in enumerate(["temp", "atemp", "hum", "windspeed"]):
+        data[col] = weather[:, i]
+
+    registered, casual = hourly_profiles()
+    workingday, hr = data["workingday"].to_numpy(), data["hr"].to_numpy()
+    factor = SEASON_FACTORS[season] * WEATHER_FACTORS[weathersit]
+    # ridership grows from 2011 to 2012
+    factor = factor * (1 + 0.6 * data["yr"].to_numpy())
+    data["registered"] = rng.poisson(registered[workingday, hr] * factor)
+    data["casual"] = rng.poisson(casual[workingday, hr] * factor)
+    data["cnt"] = data["registered"] + data["casual"]
+
+    data = data[rng.random(n) >= missing].reset_index(drop=True)
+    data["instant"] = np.arange(1, len(data) + 1)
+    return data[COLUMNS]
@@ -0,0 +1,302 @@
+# --------------------------------------------------------------
+# Command-line entry point of the analysis
+# --------------------------------------------------------------
+"""
+Runs selected stages of the analysis from one place, with configurable data
+paths, instead of executing the numbered scripts from their own directories.
+
+By default the stages run the numbered scripts through the pipeline runner
+(see pipeline.py), which renders the figures to reports/Figs and skips the
+stages that are up to date; the scripts read the default data paths, so the
+path options need --no-figures.
+
+With --no-figures nothing is rendered (matplotlib and seaborn are not even
+imported): the preprocess stage writes the interim data, and every analysis
+stage writes its numeric results (summaries, t-statistics, correlations,
+decomposition components, ADF p-values; see analysis/stages.py) as one
+JSON or Parquet file per table under <output>/<stage>/, with a summary.json
+listing the tables and timings of the run.
+
+The panel subcommand runs the analysis without figures on every dataset of a
+directory or glob of hour-level files, in parallel (see analysis/panel.py),
+and writes the tables combined over the datasets under <output>/panel/.
+
+The update subcommand ingests only the rows appended to the raw csv since
+its last run into the partitioned store of data/incremental.py.
+
+run from anywhere:
+    python src/cli.py [stage ...] [--no-figures] [--raw hour.csv]
+                      [--interim-dir DIR] [--output DIR] [--format json|parquet]
+    python src/cli.py panel "exports/*.csv" [--jobs N] [--memory-mb MB]
+                      [--output DIR] [--format json|parquet] [--profile FILE]
+    python src/cli.py update [--raw hour.csv] [--store DIR]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+SRC = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(SRC)
+sys.path.append(SRC)
+import instrumentation  # noqa: E402
+
+STAGE_NAMES = ["preprocess", "temporal", "hypothesis", "weather", "timeseries"]
+FORMATS = ["json", "parquet"]
+RAW = os.path.join(ROOT, "data", "raw", "hour.csv")
+INTERIM_DIR = os.path.join(ROOT, "data", "interim")
+OUTPUT_DIR = os.path.join(ROOT, "reports", "results")
+STORE_DIR = os.path.join(INTERIM_DIR, "01_incremental")
+
+# file names of the interim data, as written by data.preprocessing.preprocess_file
+INTERIM_FILE = "01_preprocessed_data.parquet"
+CUBOIDS_DIR = "01_rides_cuboids"
+
+
+def run_preprocess(raw, interim_dir):
+    """
+    Validate and preprocess the raw csv and store the interim data in
+    interim_dir, like data/01_Processing_data.py. Returns the validation report.
+    """
+    from data.preprocessing import preprocess_file
+
+    validator = preprocess_file(raw, interim_dir).validator
+    return {"validation": validator.report().reset_index()}
+
+
+@contextlib.contextmanager
+def profiling(path, trace_memory=False):
+    """
+    Profile the block to the events file path (when given, see
+    instrumentation.py) and print the summary of the run when it ends,
+    unless the run belongs to a parent process, which prints it.
+    """
+    if not path:
+        yield
+        return
+    starts_run = instrumentation.RUN_ENV not in os.environ
+    instrumentation.enable(os.path.abspath(path), trace_memory, summary_at_exit=False)
+    try:
+        yield
+    finally:
+        if starts_run:
+            instrumentation.print_summary()
+
+
+def run_stage(name, args):
+    """Run one stage without figures, returns its {table name: DataFrame}."""
+    from analysis import stages
+    from analysis.cube import load_cuboids
+    from data.interim import load_interim
+
+    if name == "preprocess":
+        return run_preprocess(args.raw, args.interim_dir)
+
+    def data():
+        path = os.path.join(args.interim_dir, INTERIM_FILE)
+        return load_interim(columns=stages.STAGE_COLUMNS[name], path=path)
+
+    def cube():
+        return load_cuboids(os.path.join(args.interim_dir, CUBOIDS_DIR))
+
+    jobs = args.jobs or os.cpu_count()
+    if name == "temporal":
+        return stages.temporal_stage(cube())
+    if name == "hypothesis":
+        return stages.hypothesis_stage(
+            data(), cube(), args.resamples, args.seed, n_jobs=jobs
+        )
+    if name == "weather":
+        return stages.weather_stage(data())
+    cache_dir = os.path.join(args.interim_dir, "adf_cache")
+    return stages.timeseries_stage(data(), cache_dir, n_jobs=jobs)
+
+
+def write_tables(tables, directory, fmt="json"):
+    """Write every table as directory/<name>.<fmt>, returns the file names."""
+    os.makedirs(directory, exist_ok=True)
+    files = {}
+    for name, table in tables.items():
+        path = os.path.join(directory, f"{name}.{fmt}")
+        if fmt == "parquet":
+            table.to_parquet(path, index=False)
+        else:
+            table.to_json(path, orient="records", date_format="iso", indent=2)
+        files[name] = os.path.relpath(path, directory)
+    return files
+
+
+def run_no_figures(names, args):
+    """
+    Run the stages without figures and write their results, returns the
+    summary of the run (also written to <output>/summary.json).
+    """
+    summary = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "raw": args.raw,
+        "interim_dir": args.interim_dir,
+        "stages": {},
+    }
+    for name in names:
+        start = time.perf_counter()
+        with instrumentation.stage(f"{name} stage"):
+            tables = run_stage(name, args)
+        files = write_tables(tables, os.path.join(args.output, name), args.format)
+        seconds = time.perf_counter() - start
+        summary["stages"][name] = {"seconds": round(seconds, 3), "tables": files}
+        print(f"{name:<12} {len(files):>3} tables {seconds:7.2f}s")
+    with open(os.path.join(args.output, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def run_figures(names, force=False):
+    """Run the numbered scripts of the stages through the pipeline runner."""
+    from pipeline import run_pipeline
+
+    for name, status, seconds in run_pipeline(names, force):
+        print(f"{name:<12} {status:<9} {seconds:7.2f}s")
+
+
+def run_panel(args):
+    """Analyze the datasets of args.source and write the combined tables."""
+    from analysis.panel import run_panel as analyze_panel
+
+    start = time.perf_counter()
+    tables = analyze_panel(
+        args.source, args.jobs, args.memory_mb, args.resamples, args.seed
+    )
+    files = write_tables(tables, os.path.join(args.output, "panel"), args.format)
+    datasets = tables["datasets"]
+    failed = datasets["error"].notna().sum()
+    print(
+        f"{len(datasets) - failed} datasets analyzed, {failed} failed, "
+        f"{len(files)} tables in {time.perf_counter() - start:.2f}s"
+    )
+    return tables
+
+
+def parse_panel_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="cli.py panel",
+        description="Analyze many hour-level datasets with the same schema.",
+    )
+    parser.add_argument("source", help="directory of csv files or glob pattern")
+    parser.add_argument("--output", default=OUTPUT_DIR, help="results directory")
+    parser.add_argument("--format", choices=FORMATS, default="json")
+    parser.add_argument(
+        "--jobs", type=int, help="worker processes (default: all cores)"
+    )
+    parser.add_argument(
+        "--memory-mb", type=float, help="memory budget of every worker, in MB"
+    )
+    parser.add_argument("--resamples", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=111)
+    parser.add_argument("--profile", help="write timing events to this JSON-lines file")
+    parser.add_argument(
+        "--trace-memory", action="store_true", help="profile with tracemalloc"
+    )
+    args = parser.parse_args(argv)
+    args.output = os.path.abspath(args.output)
+    return args
+
+
+def run_update(args):
+    """Append the new rows of args.raw to the incremental store."""
+    from data.incremental import update
+
+    start = time.perf_counter()
+    summary = update(args.raw, args.store)
+    print(
+        f"{summary['rows']} new rows in {len(summary['months'])} months, "
+        f"{summary['days']} days completed, {summary['total_rows']} rows in "
+        f"the store ({time.perf_counter() - start:.2f}s)"
+    )
+    return summary
+
+
+def parse_update_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="cli.py update",
+        description="Append the new rows of the raw csv to the incremental store.",
+    )
+    parser.add_argument("--raw", default=RAW, help="raw hourly csv")
+    parser.add_argument(
+        "--store", default=STORE_DIR, help="incremental store directory"
+    )
+    args = parser.parse_args(argv)
+    args.raw, args.store = os.path.abspath(args.raw), os.path.abspath(args.store)
+    return args
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "stages",
+        nargs="*",
+        help=f"stages to run: {', '.join(STAGE_NAMES)} (default: all)",
+    )
+    parser.add_argument(
+        "--no-figures",
+        action="store_true",
+        help="write the numeric results instead of rendering figures",
+    )
+    parser.add_argument("--raw", default=RAW, help="raw hourly csv")
+    parser.add_argument(
+        "--interim-dir", default=INTERIM_DIR, help="preprocessed data directory"
+    )
+    parser.add_argument("--output", default=OUTPUT_DIR, help="results directory")
+    parser.add_argument("--format", choices=FORMATS, default="json")
+    parser.add_argument(
+        "--jobs", type=int, help="worker processes (default: all cores)"
+    )
+    parser.add_argument("--resamples", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=111)
+    parser.add_argument(
+        "--force", action="store_true", help="rerun up to date stages (figures)"
+    )
+    parser.add_argument("--profile", help="write timing events to this JSON-lines file")
+    parser.add_argument(
+        "--trace-memory", action="store_true", help="profile with tracemalloc"
+    )
+    args = parser.parse_args(argv)
+
+    unknown = set(args.stages) - set(STAGE_NAMES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    paths = {"raw": RAW, "interim_dir": INTERIM_DIR, "output": OUTPUT_DIR}
+    for name in paths:
+        setattr(args, name, os.path.abspath(getattr(args, name)))
+    if not args.no_figures:
+        # compared once absolute, so the defaults given relatively are accepted
+        custom = [
+            name for name, default in paths.items() if getattr(args, name) != default
+        ]
+        if custom:
+            parser.error(f"--{custom[0].replace('_', '-')} needs --no-figures")
+    return args
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["panel"]:
+        args = parse_panel_args(sys.argv[2:])
+        with profiling(args.profile, args.trace_memory):
+            run_panel(args)
+        raise SystemExit
+    if sys.argv[1:2] == ["update"]:
+        run_update(parse_update_args(sys.argv[2:]))
+        raise SystemExit
+    args = parse_args()
+    # keep the order of the pipeline whatever the order of the arguments
+    names = [name for name in STAGE_NAMES if not args.stages or name in args.stages]
+    # enabled before the analysis modules are imported, so their hot paths are timed
+    with profiling(args.profile, args.trace_memory):
+        if args.no_figures:
+            run_no_figures(names, args)
+        else:
+            run_figures(names, args.force)
@@ -2,12 +2,56 @@
 # Importing Libraries
 # --------------------------------------------------------------
 
+import sys
 import pandas as pd
 
+sys.path.append("..")
+from data.decoding import decode_apply
+from data.preprocessing import RAW_PATH, preprocess_file, stream_preprocess
+from data.schema import memory_report
+from data.validation import Validator
+
+# --------------------------------------------------------------
+# Streaming mode
+# --------------------------------------------------------------
+"""
+for inputs too large to load at once, pass a chunk size:
+    python 01_Processing_data.py 100000
+the raw csv is then read chunk by chunk, each chunk is transformed and
+appended to the interim parquet file, so memory stays bounded by the
+chunk size no matter how big the input is. every raw chunk is validated
+before it is transformed, and the first chunk with invalid rows stops the
+feed (ValidationError). large inputs often hold several series one after the
+other (e.g. stations), so the order of the hours is not checked here (see
+ORDER_CHECKS in data/validation.py). the chunks are written to a temporary file that
+replaces the interim parquet only once the whole feed went through, so a
+failed feed leaves the previous interim data as it was (see data/interim.py).
+the cube is built after that in a second pass over the row groups of the new
+parquet, one chunk at a time (see stream_preprocess in data/preprocessing.py).
+the memory-mapped column cache needs the whole data at once, so it is removed
+rather than left stale: the analysis scripts read the parquet until the next
+run without a chunk size.
+"""
+if len(sys.argv) > 1:
+    chunksize = int(sys.argv[1])
+    n_rows = stream_preprocess(RAW_PATH, chunksize, Validator(fail_fast=True))
+    print(f"Streamed {n_rows} rows in chunks of {chunksize}")
+    raise SystemExit
+
 # --------------------------------------------------------------
 # Loading Data
 # --------------------------------------------------------------
-hourly_data = pd.read_csv("../../data/raw/hour.csv")
+"""
+preprocess_file (data/preprocessing.py, also run by cli.py) reads the raw csv,
+checks, transforms and compacts it, and stores the result in data/interim:
+as parquet, so the analysis scripts can read only the columns they need, as
+memory-mapped .npy columns, for zero-copy loads, and as the cube of ride
+counts (sums, counts and sums of squares over all the dimensions) with its
+coarser cuboids (daily totals, hourly profile), which answer the grouped views
+of the analysis scripts. the sections below look at every step of it.
+"""
+result = preprocess_file(RAW_PATH)
+hourly_data = result.raw
 
 # --------------------------------------------------------------
 # print some generic statistics about the data
@@ -22,54 +66,39 @@ the second for sum all columns null values
 print(f"Number of missing valuse in the data: {hourly_data.isnull().sum().sum()}")
 hourly_data.describe().T  # "T" to show statical as columns
 
+"""
+data quality checks (see data/validation.py): code and normalized ranges,
+order of the hours, duplicate instants and casual + registered == cnt,
+with the number and the first invalid rows of every check
+"""
+validator = result.validator
+print(validator.report())
+
 # --------------------------------------------------------------
 # Data Preprocessing
 # --------------------------------------------------------------
 # 1.01: Preprocessing Temporal and Weather Features
 
-preprocessed_data = hourly_data.copy()  # copying original data
-# transform seasons
-seasons_mapping = {1: "winter", 2: "spring", 3: "summer", 4: "fall"}
-preprocessed_data["season"] = preprocessed_data["season"].apply(
-    lambda x: seasons_mapping[x]
-)
-
-# transform yr
-yr_mapping = {0: 2011, 1: 2012}
-preprocessed_data["yr"] = preprocessed_data["yr"].apply(lambda x: yr_mapping[x])
-
-# transform weekday
-weekday_mapping = {
-    0: "Sunday",
-    1: "Monday",
-    2: "Tuesday",
-    3: "Wednesday",
-    4: "Thursday",
-    5: "Friday",
-    6: "Saturday",
-}
-preprocessed_data["weekday"] = preprocessed_data["weekday"].apply(
-    lambda x: weekday_mapping[x]
-)
-
-# transform weathersit
-weather_mapping = {
-    1: "clear",
-    2: "cloudy",
-    3: "light_rain_snow",
-    4: "heavy_rain_snow",
-}
-preprocessed_data["weathersit"] = preprocessed_data["weathersit"].apply(
-    lambda x: weather_mapping[x]
-)
-
-# transform hum and windspeed
-preprocessed_data["hum"] = preprocessed_data["hum"] * 100
-preprocessed_data["windspeed"] = preprocessed_data["windspeed"] * 67
+"""
+transform season, yr, weekday and weathersit from codes to labels (one
+vectorized pass, seasons/weekdays/weather become categoricals and yr becomes
+2011/2012), then rescale hum and windspeed to their original units.
+preprocess works on a copy, so hourly_data keeps the raw values.
+"""
+preprocessed_data = result.preprocessed
 
 # visualize preprocessed columns
 cols = ["season", "yr", "weekday", "weathersit", "hum", "windspeed"]
 preprocessed_data[cols].sample(10, random_state=123)
 
-
-preprocessed_data.to_pickle("../../data/interim/01_preprocessed_data.plk")
+"""
+convert every column to the compact dtypes of data/schema.py (int8 hours,
+months and flags, int32 counts, float32 weather measures, datetime days),
+the analysis scripts check these dtypes when they load the data. the memory
+report compares them with the frame of the original preprocessing: labels
+decoded row by row into strings (decode_apply in data/decoding.py),
+days as strings and 64-bit numbers
+"""
+compact_data = result.data
+print(memory_report(decode_apply(hourly_data), compact_data))
+preprocessed_data = compact_data
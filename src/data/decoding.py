@@ -0,0 +1,101 @@
+# --------------------------------------------------------------
+# Vectorized decoding of the coded columns in hour.csv
+# --------------------------------------------------------------
+"""
+The raw data stores season, yr, weekday and weathersit as small integer codes.
+Instead of mapping every row through a python dict (Series.apply), each column
+is decoded with a single lookup: the codes are shifted to start at 0 and used
+directly as pandas Categorical codes (or as indices into a numpy lookup array
+for yr), so the work is done in numpy and the result is a compact categorical
+column rather than object strings.
+"""
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+
+# code -> label mappings, same as the ones used in 01_Processing_data.py
+SEASONS = {1: "winter", 2: "spring", 3: "summer", 4: "fall"}
+YEARS = {0: 2011, 1: 2012}
+WEEKDAYS = {
+    0: "Sunday",
+    1: "Monday",
+    2: "Tuesday",
+    3: "Wednesday",
+    4: "Thursday",
+    5: "Friday",
+    6: "Saturday",
+}
+WEATHERS = {
+    1: "clear",
+    2: "cloudy",
+    3: "light_rain_snow",
+    4: "heavy_rain_snow",
+}
+
+# columns decoded into categoricals, with their mapping
+CATEGORICAL_MAPPINGS = {
+    "season": SEASONS,
+    "weekday": WEEKDAYS,
+    "weathersit": WEATHERS,
+}
+
+
+def _check_codes(codes, mapping, col):
+    # codes must be consecutive integers starting at min(mapping)
+    low, high = min(mapping), max(mapping)
+    bad = (codes < low) | (codes > high)
+    if bad.any():
+        raise ValueError(
+            f"unknown {col} codes: {sorted(np.unique(codes[bad]).tolist())}"
+        )
+    return codes - low
+
+
+def decode_categorical(codes, mapping, col=""):
+    """Decode an integer code column into a pandas Categorical."""
+    codes = np.asarray(codes)
+    shifted = _check_codes(codes, mapping, col)
+    return pd.Categorical.from_codes(shifted, categories=list(mapping.values()))
+
+
+def decode_year(codes):
+    """Decode the 0/1 yr column into calendar years (int16)."""
+    codes = np.asarray(codes)
+    shifted = _check_codes(codes, YEARS, "yr")
+    lookup = np.array(list(YEARS.values()), dtype=np.int16)
+    return lookup[shifted]
+
+
+@timed("decode_columns")
+def decode_columns(data, inplace=False):
+    """
+    Decode season, yr, weekday and weathersit in one vectorized pass.
+    Columns missing from data are skipped.
+    """
+    if not inplace:
+        data = data.copy()
+    for col, mapping in CATEGORICAL_MAPPINGS.items():
+        if col in data:
+            data[col] = pd.Series(
+                decode_categorical(data[col].to_numpy(), mapping, col),
+                index=data.index,
+            )
+    if "yr" in data:
+        data["yr"] = decode_year(data["yr"].to_numpy())
+    return data
+
+
+def decode_apply(data):
+    """
+    The per-row path used before decode_columns (Series.apply with the
+    mappings, giving string labels and int64 years), kept as the reference
+    of the decoding benchmark and of the memory report of 01_Processing_data.py.
+    """
+    data = data.copy()
+    data["season"] = data["season"].apply(lambda x: SEASONS[x])
+    data["yr"] = data["yr"].apply(lambda x: YEARS[x])
+    data["weekday"] = data["weekday"].apply(lambda x: WEEKDAYS[x])
+    data["weathersit"] = data["weathersit"].apply(lambda x: WEATHERS[x])
+    return data
@@ -0,0 +1,275 @@
+# --------------------------------------------------------------
+# Incremental updates of the interim data
+# --------------------------------------------------------------
+"""
+Append-only updates for raw hourly data that grows every day. Instead of
+re-reading and re-transforming the whole history, update reads only the
+bytes appended to the raw csv since the last update (the offset is kept in
+the state file), keeps the rows with a new instant, and:
+
+  - validates them, continuing the checks of the previous rows (order of
+    the hours, duplicate instants, see data/validation.py)
+  - preprocesses them and appends them to a store partitioned by month,
+    rows/<yyyy-mm>/part-<first instant>.parquet, never rewriting old files
+  - merges their cells into the cube of their months only (cube/<yyyy-mm>,
+    dteday is a dimension of the cube so other months can't change)
+  - adds their days to the daily totals and to the rolling statistics of
+    the complete days (analysis.rolling.RollingStats, resumed from its
+    state), the last day being kept pending until its hours are complete
+  - adds them to the sufficient statistics of the Pearson correlations
+    (analysis.correlations.PearsonMoments)
+
+The cost of an update is thus proportional to the new rows. The store is
+read back with load_rows, load_store_cube and load_daily.
+
+An update that fails halfway must not count its rows twice when it is run
+again. The row and daily parts are named after their first instant and day,
+so running again rewrites the same files. Merging into a month cube is not
+idempotent, though: the merged cubes are first staged next to the published
+ones (hidden files that load_store_cube skips) and only replace them after
+the state listing them is saved. The next update first finishes publishing
+the cubes listed in the state, if the previous one stopped in between.
+"""
+
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from analysis.correlations import PearsonMoments
+from analysis.cube import build_cube, load_cube, merge_cubes, save_cube
+from analysis.rolling import STATS, RollingStats
+from data.interim import INTERIM_DIR, load_interim, save_interim
+from data.preprocessing import RAW_PATH, preprocess
+from data.schema import enforce_schema
+from data.validation import Validator
+from instrumentation import timed
+
+STORE_DIR = f"{INTERIM_DIR}/01_incremental"
+STATE_FILE = "state.json"
+RIDES = ["registered", "casual", "cnt"]
+CORRELATION_COLUMNS = ["temp", "atemp", "hum", "windspeed"] + RIDES
+ROLLING_WINDOWS = [7, 10]
+
+
+def initial_state():
+    return {
+        "offsets": {},
+        "n_rows": 0,
+        "validator": {"last_day": None, "last_hr": -1, "last_instant": None},
+        # totals of the last day, which may still get hours
+        "pending_day": None,
+        "pending_totals": [0] * len(RIDES),
+        "rolling": RollingStats(ROLLING_WINDOWS, len(RIDES)).to_dict(),
+        "pearson": PearsonMoments(CORRELATION_COLUMNS).to_dict(),
+        # months whose merged cube is staged but not yet published
+        "staged_cubes": [],
+    }
+
+
+def load_state(store_dir=STORE_DIR):
+    path = os.path.join(store_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return initial_state()
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(state, store_dir=STORE_DIR):
+    # written last and replaced atomically: an update that fails halfway
+    # leaves the previous state
+    path = os.path.join(store_dir, STATE_FILE)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def read_new_rows(path, offset=0):
+    """
+    The rows appended to the csv at path after the byte offset (all of them
+    for 0), and the offset of the end of its last complete line.
+    """
+    with open(path, "rb") as f:
+        header = f.readline()
+        size = os.fstat(f.fileno()).st_size
+        if offset > size:
+            raise ValueError(f"{path} is shorter than at the last update")
+        f.seek(max(offset, len(header)))
+        new = f.read()
+    # a line still being written is left for the next update
+    end = new.rfind(b"\n") + 1
+    offset = max(offset, len(header)) + end
+    return pd.read_csv(io.BytesIO(header + new[:end])), offset
+
+
+def _month(yr, mnth):
+    return f"{yr}-{mnth:02d}"
+
+
+def append_rows(data, store_dir=STORE_DIR):
+    """Append preprocessed rows to their month partitions, returns the months."""
+    months = []
+    for (yr, mnth), rows in data.groupby(["yr", "mnth"], sort=True):
+        month = _month(yr, mnth)
+        directory = os.path.join(store_dir, "rows", month)
+        os.makedirs(directory, exist_ok=True)
+        name = f"part-{rows['instant'].iloc[0]:010d}.parquet"
+        save_interim(rows, os.path.join(directory, name))
+        months.append(month)
+    return months
+
+
+def _cube_paths(month, store_dir=STORE_DIR):
+    # published and staged cube of a month
+    directory = os.path.join(store_dir, "cube")
+    return (
+        os.path.join(directory, f"{month}.parquet"),
+        os.path.join(directory, f".{month}.parquet.staged"),
+    )
+
+
+def stage_month_cubes(data, store_dir=STORE_DIR):
+    """
+    Merge the cells of the rows into the published cubes of their months,
+    and stage the results (see publish_month_cubes). Returns the months.
+    """
+    os.makedirs(os.path.join(store_dir, "cube"), exist_ok=True)
+    months = []
+    for (yr, mnth), rows in data.groupby(["yr", "mnth"], sort=True):
+        month = _month(yr, mnth)
+        path, staged = _cube_paths(month, store_dir)
+        cube = build_cube(rows)
+        if os.path.exists(path):
+            cube = merge_cubes(load_cube(path), cube)
+        save_cube(cube, staged)
+        months.append(month)
+    return months
+
+
+def publish_month_cubes(state, store_dir=STORE_DIR):
+    """
+    Replace the cubes of the months staged in state by their staged
+    versions, then clear the list in the saved state. Cubes already
+    published by an interrupted call have no staged file left.
+    """
+    if not state.get("staged_cubes"):
+        return
+    for month in state["staged_cubes"]:
+        path, staged = _cube_paths(month, store_dir)
+        if os.path.exists(staged):
+            os.replace(staged, path)
+    state["staged_cubes"] = []
+    save_state(state, store_dir)
+
+
+def update_daily(data, state, store_dir=STORE_DIR):
+    """
+    Add the rows to the daily totals and roll the statistics over the days
+    they complete (all but the last one, which stays pending). Days without
+    any row count 0, as in the daily view of analysis.timeseries.
+    Returns the number of completed days.
+    """
+    totals = data.groupby("dteday")[RIDES].sum()
+    if state["pending_day"] is not None:
+        pending = pd.DataFrame(
+            [state["pending_totals"]],
+            index=pd.DatetimeIndex([state["pending_day"]]),
+            columns=RIDES,
+        )
+        totals = totals.add(pending, fill_value=0)
+    days = pd.date_range(totals.index.min(), totals.index.max(), freq="D")
+    totals = totals.reindex(days, fill_value=0)
+    complete, last = totals.iloc[:-1], totals.iloc[-1]
+    state["pending_day"] = str(last.name.date())
+    state["pending_totals"] = last.astype(int).tolist()
+    if complete.empty:
+        return 0
+
+    engine = RollingStats.from_dict(state["rolling"])
+    stats = engine.append(complete.to_numpy(dtype=float))
+    state["rolling"] = engine.to_dict()
+    daily = complete.astype(np.int64).rename_axis("dteday")
+    for stat in STATS:
+        for i, window in enumerate(engine.windows):
+            for j, col in enumerate(RIDES):
+                daily[f"{col}_{stat}_{window}"] = stats[stat][:, i, j]
+    directory = os.path.join(store_dir, "daily")
+    os.makedirs(directory, exist_ok=True)
+    name = f"part-{complete.index[0]:%Y-%m-%d}.parquet"
+    daily.reset_index().to_parquet(os.path.join(directory, name), index=False)
+    return len(complete)
+
+
+def _validator(state):
+    # continue the checks where the previous update stopped; the feed is one
+    # chronological series, so the order of the hours is checked too
+    validator = Validator(fail_fast=True, ordered=True)
+    saved = state["validator"]
+    validator.last_day = saved["last_day"]
+    validator.last_hr = saved["last_hr"]
+    if saved["last_instant"] is not None:
+        validator.last_instant = saved["last_instant"]
+    return validator
+
+
+@timed("incremental_update")
+def update(raw_path=RAW_PATH, store_dir=STORE_DIR):
+    """
+    Ingest the rows appended to raw_path since the last update into the
+    store. Raises data.validation.ValidationError (and changes nothing)
+    when the new rows are invalid. Returns a summary of the update.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    state = load_state(store_dir)
+    # cubes of an update stopped after its state was saved
+    publish_month_cubes(state, store_dir)
+    key = os.path.abspath(raw_path)
+    raw, offset = read_new_rows(raw_path, state["offsets"].get(key, 0))
+    last_instant = state["validator"]["last_instant"]
+    if last_instant is not None:
+        # rows of an export overlapping the previous ones are skipped
+        raw = raw[raw["instant"] > last_instant]
+    summary = {"rows": len(raw), "months": [], "days": 0}
+    if not raw.empty:
+        validator = _validator(state)
+        validator.validate(raw)
+        data = enforce_schema(preprocess(raw))
+        summary["months"] = append_rows(data, store_dir)
+        state["staged_cubes"] = stage_month_cubes(data, store_dir)
+        summary["days"] = update_daily(data, state, store_dir)
+        pearson = PearsonMoments.from_dict(state["pearson"])
+        state["pearson"] = pearson.update(data).to_dict()
+        state["n_rows"] += len(data)
+        state["validator"] = {
+            "last_day": validator.last_day,
+            "last_hr": int(validator.last_hr),
+            "last_instant": int(validator.last_instant),
+        }
+    state["offsets"][key] = offset
+    save_state(state, store_dir)
+    publish_month_cubes(state, store_dir)
+    summary["total_rows"] = state["n_rows"]
+    return summary
+
+
+def load_rows(columns=None, filters=None, store_dir=STORE_DIR):
+    """Preprocessed rows of the store, like data.interim.load_interim."""
+    return load_interim(columns, filters, os.path.join(store_dir, "rows"))
+
+
+def load_store_cube(store_dir=STORE_DIR):
+    """The cube of all the months of the store."""
+    return load_interim(path=os.path.join(store_dir, "cube"))
+
+
+def load_daily(store_dir=STORE_DIR):
+    """Daily totals and rolling statistics of the complete days."""
+    return pd.read_parquet(os.path.join(store_dir, "daily"))
+
+
+def pearson_correlations(store_dir=STORE_DIR):
+    """Pearson correlations (and p-values) of all the rows of the store."""
+    moments = PearsonMoments.from_dict(load_state(store_dir)["pearson"])
+    return moments.pearson(), moments.pearson_p()
@@ -0,0 +1,203 @@
+# --------------------------------------------------------------
+# Interim data store
+# --------------------------------------------------------------
+"""
+The preprocessed data is stored as parquet under data/interim. Parquet is
+columnar, so a script can load only the columns it uses, and row filters
+such as [("season", "==", "summer")] are pushed down to the reader, skipping
+row groups whose statistics don't match instead of loading everything.
+"""
+
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_datetime64_dtype, is_numeric_dtype
+
+from data.schema import validate_schema
+from instrumentation import timed
+
+INTERIM_DIR = "../../data/interim"
+PARQUET_PATH = f"{INTERIM_DIR}/01_preprocessed_data.parquet"
+
+
+def _tmp_path(path):
+    # hidden, so readers of a partitioned directory skip it
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.tmp")
+
+
+def append_chunks(chunks, path):
+    """
+    Write an iterable of preprocessed DataFrames to a single parquet file,
+    one row group per chunk, so only one chunk is held in memory at a time.
+    The chunks go to a temporary file, which replaces path only once all of
+    them are written: if the iterable raises (e.g. a ValidationError), path
+    is left as it was. Returns the number of rows written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tmp_path = _tmp_path(path)
+    writer = None
+    n_rows = 0
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            else:
+                # keep the schema of the first chunk (e.g. dictionary types)
+                table = table.cast(writer.schema)
+            writer.write_table(table)
+            n_rows += len(chunk)
+    except BaseException:
+        if writer is not None:
+            writer.close()
+            os.remove(tmp_path)
+        raise
+    if writer is not None:
+        writer.close()
+        os.replace(tmp_path, path)
+    return n_rows
+
+
+@timed("save_interim")
+def save_interim(data, path=PARQUET_PATH):
+    """
+    Write the preprocessed frame to parquet, keeping its dtypes. It goes to a
+    temporary file first and is then renamed, so readers never see half of it.
+    """
+    tmp_path = _tmp_path(path)
+    data.to_parquet(tmp_path, engine="pyarrow", index=False)
+    os.replace(tmp_path, path)
+
+
+@timed("load_interim")
+def load_interim(columns=None, filters=None, path=PARQUET_PATH):
+    """
+    Load the preprocessed frame from parquet.
+    columns: list of columns to read (all when None)
+    filters: pyarrow filters, e.g. [("yr", "==", 2011)], applied while reading
+    The dtypes of the loaded columns are checked against data.schema.
+    """
+    data = pd.read_parquet(path, engine="pyarrow", columns=columns, filters=filters)
+    return validate_schema(data)
+
+
+def iter_interim(columns=None, path=PARQUET_PATH):
+    """
+    Yield the preprocessed data one row group at a time (one chunk of
+    append_chunks), so a file larger than memory can be read in a second pass.
+    """
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(path)
+    for i in range(parquet.num_row_groups):
+        table = parquet.read_row_group(i, columns=columns)
+        yield validate_schema(table.to_pandas())
+
+
+# --------------------------------------------------------------
+# Memory-mapped column cache
+# --------------------------------------------------------------
+"""
+Besides parquet, every column can be cached as its own .npy file. Numeric
+columns are stored as they are, categorical (and string) columns as integer
+codes, with their categories kept in manifest.json next to the dtypes.
+Loading maps the files into memory (np.load(mmap_mode="r")): nothing is
+parsed or copied, pages are read lazily and are shared by all processes
+reading the same cache.
+
+The manifest records the size and modification time of the parquet file the
+cache was written with, and column_cache_fresh tells whether it still
+matches, so a cache left over from an older parquet is never read.
+"""
+
+CACHE_DIR = f"{INTERIM_DIR}/01_preprocessed_columns"
+MANIFEST = "manifest.json"
+
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+@timed("save_column_cache")
+def save_column_cache(data, cache_dir=CACHE_DIR, source=None):
+    """
+    Write each column of data as cache_dir/<column>.npy plus a manifest.
+    source: the parquet file holding the same data, whose stamp is recorded
+    for column_cache_fresh
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest = {"n_rows": len(data), "columns": {}}
+    if source is not None:
+        manifest["source"] = _file_stamp(source)
+    for col in data.columns:
+        values = data[col]
+        entry = {"file": f"{col}.npy"}
+        if not (is_numeric_dtype(values) or is_datetime64_dtype(values)):
+            # strings and categoricals are stored as codes + dictionary
+            values = values.astype("category")
+            entry["categories"] = values.cat.categories.tolist()
+            values = values.cat.codes
+        entry["dtype"] = "category" if "categories" in entry else str(values.dtype)
+        np.save(os.path.join(cache_dir, entry["file"]), values.to_numpy())
+        manifest["columns"][col] = entry
+    with open(os.path.join(cache_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def read_manifest(cache_dir=CACHE_DIR):
+    with open(os.path.join(cache_dir, MANIFEST)) as f:
+        return json.load(f)
+
+
+def column_cache_fresh(cache_dir=CACHE_DIR, source=PARQUET_PATH):
+    """
+    Whether the cache exists and was written with the current source file
+    (same size and modification time as recorded in its manifest).
+    """
+    try:
+        recorded = read_manifest(cache_dir).get("source")
+        return recorded == _file_stamp(source)
+    except (OSError, ValueError):
+        return False
+
+
+def remove_column_cache(cache_dir=CACHE_DIR):
+    """Delete the cache, e.g. when the parquet is rewritten without it."""
+    if os.path.isdir(cache_dir):
+        shutil.rmtree(cache_dir)
+
+
+def load_column_arrays(columns=None, cache_dir=CACHE_DIR):
+    """
+    Return {column: read-only memory-mapped array} for the cached columns.
+    Categorical columns are returned as their codes, see read_manifest for
+    the categories.
+    """
+    manifest = read_manifest(cache_dir)["columns"]
+    columns = list(manifest) if columns is None else columns
+    return {
+        col: np.load(os.path.join(cache_dir, manifest[col]["file"]), mmap_mode="r")
+        for col in columns
+    }
+
+
+@timed("load_column_cache")
+def load_column_cache(columns=None, cache_dir=CACHE_DIR):
+    """
+    Load cached columns as a DataFrame backed by the memory-mapped arrays
+    (categoricals are rebuilt from their codes without copying them).
+    """
+    manifest = read_manifest(cache_dir)["columns"]
+    arrays = load_column_arrays(columns, cache_dir)
+    for col, values in arrays.items():
+        if "categories" in manifest[col]:
+            arrays[col] = pd.Categorical.from_codes(
+                values, categories=manifest[col]["categories"]
+            )
+    return validate_schema(pd.DataFrame(arrays, copy=False))
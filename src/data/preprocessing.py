@@ -0,0 +1,120 @@
+# --------------------------------------------------------------
+# Preprocessing of the raw hourly data
+# --------------------------------------------------------------
+"""
+The transforms of 01_Processing_data.py as reusable functions, so they can be
+applied to the whole hour.csv at once or chunk by chunk while streaming, and
+preprocess_file, the whole preprocessing step shared by the script and cli.py.
+"""
+
+import os
+from collections import namedtuple
+
+import pandas as pd
+
+from analysis.cube import (
+    CUBE_PATH,
+    CUBOIDS_DIR,
+    build_cube,
+    materialize,
+    save_cube,
+    save_cuboids,
+    stream_cube,
+)
+from data.decoding import decode_columns
+from data.interim import (
+    CACHE_DIR,
+    INTERIM_DIR,
+    PARQUET_PATH,
+    append_chunks,
+    iter_interim,
+    remove_column_cache,
+    save_column_cache,
+    save_interim,
+)
+from data.schema import enforce_schema
+from data.validation import validate
+from instrumentation import stage, timed
+
+RAW_PATH = "../../data/raw/hour.csv"
+
+# raw: the rows of the csv, preprocessed: decoded and rescaled, data: the
+# stored frame (preprocessed with the compact dtypes of data/schema.py)
+Preprocessed = namedtuple("Preprocessed", ["raw", "validator", "preprocessed", "data"])
+
+
+@timed("preprocess")
+def preprocess(data, inplace=False):
+    """Decode the coded columns and rescale hum and windspeed."""
+    data = decode_columns(data, inplace=inplace)
+    # hum is normalized by 100 and windspeed by 67 in the raw data
+    data["hum"] = data["hum"] * 100
+    data["windspeed"] = data["windspeed"] * 67
+    return data
+
+
+def iter_preprocessed(path=RAW_PATH, chunksize=100_000, validator=None):
+    """
+    Read the raw csv in chunks of chunksize rows and preprocess each one.
+    validator: a data.validation.Validator checking every raw chunk first
+    """
+    with pd.read_csv(path, chunksize=chunksize) as reader:
+        for chunk in reader:
+            if validator is not None:
+                validator.validate(chunk)
+            yield preprocess(chunk, inplace=True)
+
+
+def _interim_path(default, interim_dir):
+    return os.path.join(interim_dir, os.path.basename(default))
+
+
+def stream_preprocess(
+    path=RAW_PATH, chunksize=100_000, validator=None, interim_dir=INTERIM_DIR
+):
+    """
+    Preprocess the raw csv at path chunk by chunk, with the compact dtypes,
+    and store it in interim_dir like preprocess_file: every chunk is appended
+    to the parquet file, then the cube is built from its row groups (see
+    analysis.cube.stream_cube). Peak memory depends on chunksize, not on the
+    size of the input. The column cache needs the whole data at once, so it
+    is removed instead. Returns the number of rows written.
+    """
+    os.makedirs(interim_dir, exist_ok=True)
+    parquet_path = _interim_path(PARQUET_PATH, interim_dir)
+    chunks = iter_preprocessed(path, chunksize, validator)
+    n_rows = append_chunks(map(enforce_schema, chunks), parquet_path)
+    stream_cube(
+        iter_interim(path=parquet_path),
+        _interim_path(CUBE_PATH, interim_dir),
+        _interim_path(CUBOIDS_DIR, interim_dir),
+    )
+    remove_column_cache(_interim_path(CACHE_DIR, interim_dir))
+    return n_rows
+
+
+def preprocess_file(path=RAW_PATH, interim_dir=INTERIM_DIR, ordered=True):
+    """
+    Read the raw csv at path, validate, preprocess and compact it, and store
+    it in interim_dir: the parquet file, the column cache and the cube of
+    rides with its cuboids (under the file names of the default paths).
+    ordered: the rows are one chronological series like hour.csv, the order
+    of the hours is checked too (see data.validation)
+    Returns the Preprocessed frames and the Validator of the raw rows.
+    """
+
+    with stage("read_csv"):
+        raw = pd.read_csv(path)
+    validator = validate(raw, ordered=ordered)
+    preprocessed = preprocess(raw)
+    data = enforce_schema(preprocessed)
+
+    os.makedirs(interim_dir, exist_ok=True)
+    parquet_path = _interim_path(PARQUET_PATH, interim_dir)
+    save_interim(data, parquet_path)
+    # memory-mapped .npy columns, stamped with the parquet they match
+    save_column_cache(data, _interim_path(CACHE_DIR, interim_dir), source=parquet_path)
+    cube = build_cube(data)
+    save_cube(cube, _interim_path(CUBE_PATH, interim_dir))
+    save_cuboids(materialize(cube), _interim_path(CUBOIDS_DIR, interim_dir))
+    return Preprocessed(raw, validator, preprocessed, data)
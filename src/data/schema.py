@@ -0,0 +1,92 @@
+# --------------------------------------------------------------
+# Schema of the preprocessed dataset
+# --------------------------------------------------------------
+"""
+The dtype of every column of the preprocessed data. pandas reads every
+integer column of hour.csv as int64 and every float as float64, although
+hours, months and flags fit in int8, the counts in int32 and the weather
+measures don't need double precision. The decoded labels are categoricals
+with a fixed order and the day is a datetime, not a string.
+
+enforce_schema converts a frame to these types at the end of preprocessing,
+and validate_schema checks them when the analysis scripts load the data, so
+a stale interim file with other types fails early instead of silently
+producing slower (or different) results.
+"""
+
+import pandas as pd
+
+from data.decoding import SEASONS, WEATHERS, WEEKDAYS
+
+SCHEMA = {
+    "instant": "int32",
+    "dteday": "datetime64[ms]",
+    "season": pd.CategoricalDtype(list(SEASONS.values())),
+    "yr": "int16",
+    "mnth": "int8",
+    "hr": "int8",
+    "holiday": "int8",
+    "weekday": pd.CategoricalDtype(list(WEEKDAYS.values())),
+    "workingday": "int8",
+    "weathersit": pd.CategoricalDtype(list(WEATHERS.values())),
+    "temp": "float32",
+    "atemp": "float32",
+    "hum": "float32",
+    "windspeed": "float32",
+    "casual": "int32",
+    "registered": "int32",
+    "cnt": "int32",
+}
+
+
+def enforce_schema(data, schema=SCHEMA):
+    """Convert the columns of data found in schema to their schema dtype."""
+    return data.astype({col: dtype for col, dtype in schema.items() if col in data})
+
+
+def schema_mismatches(data, schema=SCHEMA):
+    """{column: (dtype, expected dtype)} for the columns of data not matching schema."""
+    mismatches = {}
+    for col in data.columns:
+        if col in schema and data[col].dtype != pd.api.types.pandas_dtype(schema[col]):
+            mismatches[col] = (str(data[col].dtype), str(schema[col]))
+    return mismatches
+
+
+def validate_schema(data, schema=SCHEMA):
+    """
+    Check that the columns of data found in schema (e.g. the projected columns
+    of a load) have their schema dtype. Returns data, raises ValueError
+    otherwise.
+    """
+    mismatches = schema_mismatches(data, schema)
+    if mismatches:
+        details = ", ".join(
+            f"{col}: {dtype} instead of {expected}"
+            for col, (dtype, expected) in mismatches.items()
+        )
+        raise ValueError(
+            f"preprocessed data doesn't match the schema ({details}), "
+            "rerun data/01_Processing_data.py"
+        )
+    return data
+
+
+def memory_report(before, after):
+    """
+    Memory used by every column of before and after (e.g. the frame before
+    and after enforce_schema) in KB, with the total and the reduction.
+    """
+    report = pd.DataFrame(
+        {
+            "before_dtype": before.dtypes.astype(str),
+            "before_kb": before.memory_usage(index=False, deep=True) / 1024,
+            "after_dtype": after.dtypes.astype(str),
+            "after_kb": after.memory_usage(index=False, deep=True) / 1024,
+        }
+    )
+    report.loc["total", ["before_kb", "after_kb"]] = report[
+        ["before_kb", "after_kb"]
+    ].sum()
+    report["reduction"] = 1 - report["after_kb"] / report["before_kb"]
+    return report.round(3)
@@ -0,0 +1,199 @@
+# --------------------------------------------------------------
+# Data quality checks of the raw hourly data
+# --------------------------------------------------------------
+"""
+Checks every chunk of raw rows (before decoding) while it is ingested:
+
+- codes: season, yr, weekday, weathersit, mnth, hr and the flags are in their
+  range of codes
+- normalized: temp, atemp, hum and windspeed are in [0, 1]
+- missing: no missing value
+- hour_order: hours increase within a day and days never go back
+- missing_hours: no hour is skipped, within a day or around midnight (the
+  row after each gap is reported; the hours missing at the end of the last
+  day are only known once the next day comes)
+- duplicate_instant: every instant is greater than all the previous ones
+- identity: casual + registered == cnt
+
+Every check is one vectorized comparison over the chunk. The last day, hour
+and instant are kept between chunks, so a feed read chunk by chunk is checked
+exactly like the whole file. The labels of the offending rows are collected
+per check; with fail_fast, the first failing chunk raises ValidationError.
+Missing hours are only reported, never fatal: the raw data itself has hours
+without any record (165 of them in hour.csv).
+
+hour_order and missing_hours (ORDER_CHECKS) assume the rows are a single
+chronological series, like hour.csv or the feed of data/incremental.py, and
+only run with ordered=True. A file holding several series one after the
+other (e.g. the stations of benchmarks/synthetic.py or of a panel dataset)
+goes back in time at every new series, and has no column telling them apart.
+"""
+
+import numpy as np
+import pandas as pd
+
+from data.decoding import SEASONS, WEATHERS, WEEKDAYS, YEARS
+from instrumentation import timed
+
+# column -> (lowest, highest) valid code
+CODE_RANGES = {
+    "season": (min(SEASONS), max(SEASONS)),
+    "yr": (min(YEARS), max(YEARS)),
+    "mnth": (1, 12),
+    "hr": (0, 23),
+    "holiday": (0, 1),
+    "weekday": (min(WEEKDAYS), max(WEEKDAYS)),
+    "workingday": (0, 1),
+    "weathersit": (min(WEATHERS), max(WEATHERS)),
+}
+NORMALIZED = ["temp", "atemp", "hum", "windspeed"]
+CHECKS = [
+    "codes",
+    "normalized",
+    "missing",
+    "hour_order",
+    "missing_hours",
+    "duplicate_instant",
+    "identity",
+]
+# checks of a single chronological series, run by an ordered Validator
+ORDER_CHECKS = ["hour_order", "missing_hours"]
+# reported but not raised by a fail-fast Validator
+WARNINGS = ["missing_hours"]
+
+
+class ValidationError(ValueError):
+    """Raised by a fail-fast Validator on the first chunk with invalid rows."""
+
+
+class Validator:
+    """
+    Stateful validator of the raw rows, fed chunk by chunk with validate.
+    fail_fast: raise ValidationError on the first invalid chunk, instead of
+    collecting the invalid rows for the report
+    ordered: the rows are one chronological series, also run ORDER_CHECKS
+    """
+
+    def __init__(self, fail_fast=False, ordered=False):
+        self.fail_fast = fail_fast
+        self.ordered = ordered
+        self.checks = [c for c in CHECKS if ordered or c not in ORDER_CHECKS]
+        self.n_rows = 0
+        self.errors = {check: [] for check in self.checks}
+        # last day, hour and instant of the previous chunks
+        self.last_day = None
+        self.last_hr = -1
+        self.last_instant = -np.inf
+
+    def _failures(self, chunk):
+        # {check: boolean mask of the invalid rows of chunk}
+        failures = {}
+
+        codes = np.zeros(len(chunk), dtype=bool)
+        for col, (low, high) in CODE_RANGES.items():
+            values = chunk[col].to_numpy()
+            codes |= (values < low) | (values > high)
+        failures["codes"] = codes
+
+        values = chunk[NORMALIZED].to_numpy(dtype=float)
+        failures["normalized"] = ((values < 0) | (values > 1)).any(axis=1)
+        failures["missing"] = chunk.isna().to_numpy().any(axis=1)
+        if self.ordered:
+            failures.update(self._order_failures(chunk))
+
+        instant = chunk["instant"].to_numpy()
+        previous_max = np.maximum.accumulate(
+            np.concatenate([[self.last_instant], instant[:-1]])
+        )
+        failures["duplicate_instant"] = instant <= previous_max
+
+        failures["identity"] = (
+            chunk["casual"] + chunk["registered"] != chunk["cnt"]
+        ).to_numpy()
+        return failures
+
+    def _order_failures(self, chunk):
+        # {check of ORDER_CHECKS: boolean mask of the invalid rows of chunk}
+        failures = {}
+        day = chunk["dteday"]
+        hr = chunk["hr"].to_numpy()
+        previous_day = day.shift(fill_value=self.last_day)
+        previous_hr = np.concatenate([[self.last_hr], hr[:-1]])
+        same_day = (day == previous_day).to_numpy()
+        # ISO dates (yyyy-mm-dd) sort like the days
+        day_back = (day < previous_day).to_numpy()
+        failures["hour_order"] = (same_day & (hr <= previous_hr)) | day_back
+        # hours skipped since the previous row: within its day, or at the
+        # end of the previous day and the start of this one
+        new_day = ~same_day & ~day_back
+        day_end = previous_hr < 23
+        if self.last_day is None:
+            day_end[0] = False
+        failures["missing_hours"] = (same_day & (hr > previous_hr + 1)) | (
+            new_day & ((hr > 0) | day_end)
+        )
+        return failures
+
+    def validate(self, chunk):
+        """
+        Check a chunk of raw rows, following the previous chunks.
+        Returns {check: labels of the invalid rows} for the failed checks.
+        """
+        if chunk.empty:
+            return {}
+        failures = self._failures(chunk)
+        self.n_rows += len(chunk)
+        self.last_day = chunk["dteday"].iloc[-1]
+        self.last_hr = chunk["hr"].iloc[-1]
+        self.last_instant = max(self.last_instant, chunk["instant"].max())
+
+        invalid = {
+            check: chunk.index[mask].to_numpy()
+            for check, mask in failures.items()
+            if mask.any()
+        }
+        for check, labels in invalid.items():
+            self.errors[check].append(labels)
+        if self.fail_fast and set(invalid) - set(WARNINGS):
+            raise ValidationError(f"invalid rows: {format_invalid(invalid)}")
+        return invalid
+
+    def invalid_rows(self):
+        """{check: labels of all the invalid rows seen so far}."""
+        return {
+            check: np.concatenate(labels) if labels else np.array([], dtype=int)
+            for check, labels in self.errors.items()
+        }
+
+    def report(self):
+        """Number of invalid rows and the first ones for every check."""
+        rows = self.invalid_rows()
+        return pd.DataFrame(
+            {
+                "invalid": [len(labels) for labels in rows.values()],
+                "first_rows": [labels[:5].tolist() for labels in rows.values()],
+            },
+            index=pd.Index(self.checks, name="check"),
+        )
+
+    @property
+    def valid(self):
+        return not any(
+            labels for check, labels in self.errors.items() if check not in WARNINGS
+        )
+
+
+def format_invalid(invalid, n_first=5):
+    """One line per check, with the number and the first labels of its rows."""
+    return "; ".join(
+        f"{check}: {len(labels)} rows {labels[:n_first].tolist()}"
+        for check, labels in invalid.items()
+    )
+
+
+@timed("validate")
+def validate(data, fail_fast=False, ordered=False):
+    """Check a whole frame of raw rows, returns its Validator."""
+    validator = Validator(fail_fast, ordered)
+    validator.validate(data)
+    return validator
@@ -0,0 +1,263 @@
+# --------------------------------------------------------------
+# Timing and memory instrumentation of the hot paths
+# --------------------------------------------------------------
+"""
+Measures the hot paths of a report build (reading and decoding the data,
+the parquet stores, the rollups, correlations, t-tests, ADF tests,
+decompositions, plotting and savefig) when profiling is enabled, and does
+nothing otherwise.
+
+Profiling is enabled by setting PROFILE_EVENTS to the path of a JSON-lines
+file (or with --profile in cli.py). Every measured block then appends one
+event to that file when it ends, with its wall time, CPU time, resident
+memory (current, change and peak of the process) and, when PROFILE_TRACEMALLOC
+is set too, the peak of the memory allocated by Python (numpy and pandas
+buffers included) inside the block, above what was allocated before it
+(tracemalloc slows the code down, so it is off by default). Subprocesses and
+pool workers inherit the settings and write to the same file, tagged with
+the run of the process that enabled profiling, which prints a summary table
+per block name at exit.
+
+Functions are measured with the @timed(name) decorator and blocks of code
+with `with stage(name):`. When profiling is disabled @timed returns the
+function itself and stage returns a shared no-op context, so the cost is
+one global lookup per block.
+
+summary of an events file:  python instrumentation.py events.jsonl [run]
+"""
+
+import atexit
+import contextlib
+import functools
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+EVENTS_ENV = "PROFILE_EVENTS"
+TRACEMALLOC_ENV = "PROFILE_TRACEMALLOC"
+RUN_ENV = "PROFILE_RUN"
+MB = 2**20
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+_NULL = contextlib.nullcontext()
+
+
+def rss_mb():
+    """Current resident set size of the process in MB (None if unknown)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except OSError:
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / MB
+
+
+def max_rss_mb():
+    """Peak resident set size of the process so far in MB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * MAXRSS_UNIT / MB
+
+
+class Recorder:
+    """
+    Appends the events of the measured blocks to a JSON-lines file.
+    Nested blocks are tagged with their parent; the tracemalloc peak of a
+    block includes the peaks of its children.
+    """
+
+    def __init__(self, path, run, trace_memory=False):
+        self.path = path
+        self.run = run
+        self.trace_memory = trace_memory
+        # appends of whole lines with O_APPEND don't interleave across
+        # processes sharing the file
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.stack = []
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def emit(self, event):
+        os.write(self.fd, (json.dumps(event) + "\n").encode())
+
+    @contextlib.contextmanager
+    def stage(self, name, **fields):
+        frame = {"name": name, "child_peak": 0, "traced_start": 0}
+        if self.trace_memory:
+            # the peak so far belongs to the parent, start a new one
+            traced, peak = tracemalloc.get_traced_memory()
+            if self.stack:
+                parent = self.stack[-1]
+                parent["child_peak"] = max(parent["child_peak"], peak)
+            tracemalloc.reset_peak()
+            frame["traced_start"] = traced
+        parent = self.stack[-1]["name"] if self.stack else None
+        self.stack.append(frame)
+        rss_start = rss_mb()
+        start, cpu_start = time.perf_counter(), time.process_time()
+        wall_start = time.time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start
+            cpu = time.process_time() - cpu_start
+            self.stack.pop()
+            rss = rss_mb()
+            event = {
+                "run": self.run,
+                "pid": os.getpid(),
+                "name": name,
+                "parent": parent,
+                "depth": len(self.stack),
+                "start": round(wall_start, 6),
+                "wall_s": round(wall, 6),
+                "cpu_s": round(cpu, 6),
+                "rss_mb": None if rss is None else round(rss, 3),
+                "rss_delta_mb": None if rss is None else round(rss - rss_start, 3),
+                "max_rss_mb": round(max_rss_mb(), 3),
+            }
+            if self.trace_memory:
+                peak = max(tracemalloc.get_traced_memory()[1], frame["child_peak"])
+                # allocated on top of what was traced when the block started
+                event["traced_peak_mb"] = round((peak - frame["traced_start"]) / MB, 3)
+                if self.stack:
+                    outer = self.stack[-1]
+                    outer["child_peak"] = max(outer["child_peak"], peak)
+            event.update(fields)
+            self.emit(event)
+
+
+_recorder = None
+
+
+def enable(path, trace_memory=False, summary_at_exit=True):
+    """
+    Start recording events to path, in this process and (through the
+    environment) in its subprocesses. Functions decorated with @timed are
+    only measured when profiling is enabled before their module is imported.
+    summary_at_exit: print the summary of the run when this process exits,
+    if it starts the run (the caller prints it otherwise, see print_summary)
+    """
+    global _recorder
+    os.environ[EVENTS_ENV] = path
+    if trace_memory:
+        os.environ[TRACEMALLOC_ENV] = "1"
+    if RUN_ENV not in os.environ:
+        # the run is named after the process that prints its summary
+        os.environ[RUN_ENV] = f"{os.getpid()}-{int(time.time())}"
+        if summary_at_exit:
+            atexit.register(print_summary, path, os.environ[RUN_ENV])
+    _recorder = Recorder(path, os.environ[RUN_ENV], trace_memory)
+    return _recorder
+
+
+def enabled():
+    return _recorder is not None
+
+
+def stage(name, **fields):
+    """
+    Context manager measuring a block of code as an event called name, with
+    the extra fields (e.g. the path of a figure). A no-op when disabled.
+    """
+    if _recorder is None:
+        return _NULL
+    return _recorder.stage(name, **fields)
+
+
+def timed(name=None):
+    """Decorator measuring every call of a function (named after it by default)."""
+
+    def decorate(func):
+        if _recorder is None:
+            return func
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _recorder.stage(label):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def read_events(path, run=None):
+    """Events of the file, of the given run (the last one by default)."""
+    with open(path) as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    run = run or (events[-1]["run"] if events else None)
+    return [event for event in events if event["run"] == run]
+
+
+def summarize(events):
+    """
+    One row per block name: number of calls, total and mean wall time,
+    total CPU time, and the highest memory measures, slowest first.
+    """
+    rows = {}
+    for event in events:
+        row = rows.setdefault(
+            event["name"],
+            {
+                "name": event["name"],
+                "calls": 0,
+                "wall_s": 0.0,
+                "cpu_s": 0.0,
+                "max_rss_mb": 0.0,
+                "traced_peak_mb": None,
+            },
+        )
+        row["calls"] += 1
+        row["wall_s"] += event["wall_s"]
+        row["cpu_s"] += event["cpu_s"]
+        row["max_rss_mb"] = max(row["max_rss_mb"], event["max_rss_mb"])
+        if event.get("traced_peak_mb") is not None:
+            row["traced_peak_mb"] = max(
+                row["traced_peak_mb"] or 0, event["traced_peak_mb"]
+            )
+    for row in rows.values():
+        row["mean_s"] = row["wall_s"] / row["calls"]
+    return sorted(rows.values(), key=lambda row: row["wall_s"], reverse=True)
+
+
+def format_summary(rows):
+    lines = [
+        f"{'stage':<24} {'calls':>6} {'wall s':>9} {'mean s':>9} "
+        f"{'cpu s':>9} {'rss MB':>8} {'traced MB':>10}"
+    ]
+    for row in rows:
+        traced = row["traced_peak_mb"]
+        lines.append(
+            f"{row['name']:<24} {row['calls']:>6} {row['wall_s']:>9.3f} "
+            f"{row['mean_s']:>9.4f} {row['cpu_s']:>9.3f} {row['max_rss_mb']:>8.1f} "
+            f"{'-' if traced is None else f'{traced:.1f}':>10}"
+        )
+    return "\n".join(lines)
+
+
+def print_summary(path=None, run=None):
+    """Print the summary of a run (by default the current one) to stderr."""
+    path = path or os.environ.get(EVENTS_ENV)
+    run = run or os.environ.get(RUN_ENV)
+    if not path or not os.path.exists(path):
+        return
+    events = read_events(path, run)
+    if events:
+        print(f"\nprofile of run {run} ({path}):", file=sys.stderr)
+        print(format_summary(summarize(events)), file=sys.stderr)
+
+
+# profiling set up by a parent process (or the user) through the environment
+if os.environ.get(EVENTS_ENV):
+    enable(os.environ[EVENTS_ENV], bool(os.environ.get(TRACEMALLOC_ENV)))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit(__doc__.strip().splitlines()[-1])
+    events = read_events(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    print(format_summary(summarize(events)))
@@ -0,0 +1,244 @@
+# --------------------------------------------------------------
+# Incremental pipeline runner for the numbered scripts
+# --------------------------------------------------------------
+"""
+Runs data/01 and visualization/01-04 in order, but only the stages whose
+inputs changed since their last successful run.
+
+Each stage lists its script, the code it imports, the data files it reads,
+its parameters (command line arguments) and the files it writes. A stage's
+hash is the sha256 of all of those inputs; it is stored in
+data/interim/pipeline_state.json after the stage succeeds. On the next run a
+stage is skipped when its hash is unchanged and all its outputs still exist.
+Since the outputs of one stage are the inputs of the next, changing hour.csv
+reruns everything while editing one plotting script reruns only that stage.
+Within a stage, render_jobs (visualization/rendering.py) skips the figures
+whose data and plotting code are unchanged, so editing one plotting function
+redraws only its figures; --force redraws them all.
+
+run from src:  python pipeline.py [stage ...] [--force]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import namedtuple
+
+from instrumentation import stage as profile_stage
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATE_PATH = os.path.join(ROOT, "data", "interim", "pipeline_state.json")
+
+Stage = namedtuple("Stage", ["name", "script", "code", "inputs", "outputs", "params"])
+
+RAW = "data/raw/hour.csv"
+INTERIM = "data/interim/01_preprocessed_data.parquet"
+CACHE_MANIFEST = "data/interim/01_preprocessed_columns/manifest.json"
+CUBE = "data/interim/01_rides_cube.parquet"
+CUBOIDS = [
+    "data/interim/01_rides_cuboids/daily.parquet",
+    "data/interim/01_rides_cuboids/profile.parquet",
+]
+DATA_CODE = [
+    "src/data/decoding.py",
+    "src/data/interim.py",
+    "src/data/schema.py",
+    "src/instrumentation.py",
+]
+PLOT_CODE = DATA_CODE + [
+    "src/visualization/plot_settings.py",
+    "src/visualization/figures.py",
+    "src/visualization/rendering.py",
+    "src/analysis/parallel.py",
+    "src/analysis/rolling.py",
+]
+# analysis/stages.py, which computes the numbers of scripts 02 to 04, and
+# the modules it imports
+STAGES_CODE = [
+    "src/analysis/stages.py",
+    "src/analysis/aggregates.py",
+    "src/analysis/correlations.py",
+    "src/analysis/cube.py",
+    "src/analysis/decomposition.py",
+    "src/analysis/gaps.py",
+    "src/analysis/hypothesis.py",
+    "src/analysis/resampling.py",
+    "src/analysis/sampling.py",
+    "src/analysis/stationarity.py",
+    "src/analysis/timeseries.py",
+]
+FIGS = "reports/Figs"
+
+STAGES = [
+    Stage(
+        name="preprocess",
+        script="src/data/01_Processing_data.py",
+        code=DATA_CODE
+        + [
+            "src/data/preprocessing.py",
+            "src/data/validation.py",
+            "src/analysis/aggregates.py",
+            "src/analysis/cube.py",
+        ],
+        inputs=[RAW],
+        outputs=[INTERIM, CACHE_MANIFEST, CUBE] + CUBOIDS,
+        params=[],
+    ),
+    Stage(
+        name="temporal",
+        script="src/visualization/01_Preprocess_temporal_and_weather_feature.py",
+        code=PLOT_CODE + ["src/analysis/aggregates.py", "src/analysis/cube.py"],
+        inputs=[INTERIM] + CUBOIDS,
+        outputs=[
+            f"{FIGS}/01_rides_distributions.png",
+            f"{FIGS}/02_rides_daily.png",
+            f"{FIGS}/03_rides_aggregated.png.png",
+            f"{FIGS}/04_weekday_hour_distributions.png",
+            f"{FIGS}/0_5_season_impact.png",
+            f"{FIGS}/0_6_season_impact_to_weekday.png",
+        ],
+        params=[],
+    ),
+    Stage(
+        name="hypothesis",
+        script="src/visualization/02_Hypothises testing.py",
+        code=PLOT_CODE + STAGES_CODE,
+        inputs=[INTERIM] + CUBOIDS,
+        outputs=[
+            f"{FIGS}/0_7_Registered rides distributions.png",
+            f"{FIGS}/0_8_casual rides distributions.png",
+        ],
+        params=[],
+    ),
+    Stage(
+        name="weather",
+        script="src/visualization/03_Analysis_of_Weather_Related_Features.py",
+        code=PLOT_CODE + STAGES_CODE,
+        inputs=[INTERIM, CACHE_MANIFEST],
+        outputs=[
+            f"{FIGS}/0_9_Correlation between rides and temp.png",
+            f"{FIGS}/10_Correlation between rides and atemp.png",
+            f"{FIGS}/11_Correlation between rides and hum.png",
+            f"{FIGS}/12_Correlation between rides and windspeed.png",
+            f"{FIGS}/13_Difference between the Pearson and Spearman Correlations.png",
+            f"{FIGS}/14_matrix correlations.png",
+        ],
+        params=[],
+    ),
+    Stage(
+        name="timeseries",
+        script="src/visualization/04_Time series analysis.py",
+        code=PLOT_CODE + STAGES_CODE,
+        inputs=[INTERIM],
+        outputs=[
+            f"{FIGS}/15_daily_registered_original.png",
+            f"{FIGS}/16_daily_registered_original.png",
+            f"{FIGS}/17_tested_stationarity_for_registered.png",
+            f"{FIGS}/18_tested_stationarity_for_casual.png",
+            f"{FIGS}/19_tested_stationarity_for_registered_as_lastValue.png",
+            f"{FIGS}/20_tested_stationarity_for_casual_as_lastValue.png",
+            f"{FIGS}/21_registered_decomposition.png",
+            f"{FIGS}/22_casual_decomposition.png",
+            f"{FIGS}/23_registered_resid.png",
+            f"{FIGS}/24_casual_resid.png",
+            f"{FIGS}/25_registered_hourly_decomposition.png",
+        ],
+        params=[],
+    ),
+]
+
+
+def file_hash(path, blocksize=2**20):
+    digest = hashlib.sha256()
+    with open(os.path.join(ROOT, path), "rb") as f:
+        for block in iter(lambda: f.read(blocksize), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def stage_hash(stage):
+    """Hash of everything a stage depends on: code, input files and params."""
+    digest = hashlib.sha256()
+    for path in [stage.script] + stage.code + stage.inputs:
+        # a missing input hashes differently from any existing content
+        exists = os.path.exists(os.path.join(ROOT, path))
+        digest.update(f"{path}:{file_hash(path) if exists else 'missing'}".encode())
+    digest.update(json.dumps(stage.params).encode())
+    return digest.hexdigest()
+
+
+def load_state(path=STATE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(state, path=STATE_PATH):
+    # replaced atomically, an interrupted write keeps the previous state
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def is_stale(stage, state):
+    if state.get(stage.name) != stage_hash(stage):
+        return True
+    return not all(os.path.exists(os.path.join(ROOT, p)) for p in stage.outputs)
+
+
+def run_stage(stage, force=False):
+    # the scripts use paths relative to their own directory
+    script = os.path.join(ROOT, stage.script)
+    env = dict(os.environ, MPLBACKEND="Agg")
+    if force:
+        env["RENDER_FORCE"] = "1"
+    subprocess.run(
+        [sys.executable, os.path.basename(script), *map(str, stage.params)],
+        cwd=os.path.dirname(script),
+        env=env,
+        check=True,
+    )
+
+
+def run_pipeline(names=None, force=False, stages=STAGES, state_path=STATE_PATH):
+    """
+    Run the selected stages (all when names is None) in order, skipping the
+    ones that are up to date unless force is set.
+    Returns a list of (stage name, "executed" or "skipped", seconds).
+    """
+    state = load_state(state_path)
+    report = []
+    for stage in stages:
+        if names and stage.name not in names:
+            continue
+        start = time.perf_counter()
+        if force or is_stale(stage, state):
+            with profile_stage(f"{stage.name} stage"):
+                run_stage(stage, force)
+            # hash after running, the stage may have rewritten its own inputs
+            state[stage.name] = stage_hash(stage)
+            save_state(state, state_path)
+            status = "executed"
+        else:
+            status = "skipped"
+        report.append((stage.name, status, time.perf_counter() - start))
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("stages", nargs="*", help="stages to run (default: all)")
+    parser.add_argument("--force", action="store_true", help="ignore the hashes")
+    args = parser.parse_args()
+
+    unknown = set(args.stages) - {stage.name for stage in STAGES}
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    for name, status, seconds in run_pipeline(args.stages, args.force):
+        print(f"{name:<12} {status:<9} {seconds:7.2f}s")
@@ -5,17 +5,34 @@ import os
 import sys
 import pandas as pd
 import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
 
 sys.path.append("..")
-import visualization.plot_settings
+from analysis.cube import load_cuboids, rollup_summary, rollup_totals
+from data.interim import load_interim
+from visualization import figures
+from visualization.plot_settings import apply_plot_settings
+from visualization.rendering import FigureJob, render_jobs
+
+apply_plot_settings()
 
 # --------------------------------------------------------------
 # Loading Data
 # --------------------------------------------------------------
 
-preprocessed_data = pd.read_pickle("../../data/interim/01_preprocessed_data.plk")
+# read only the columns used in this script
+preprocessed_data = load_interim(columns=["registered", "casual", "cnt"])
+
+# the grouped views (totals per day, means per hour and weekday, ...) are
+# rollups of the cuboids of the aggregate cube built by
+# data/01_Processing_data.py (the smallest one having the dimensions is used)
+cube = load_cuboids()
+
+"""
+every figure is added to jobs as (plotting function, data, output path),
+the jobs are rendered together in a process pool at the end of the script
+"""
+FIGS = "../../reports/Figs"
+jobs = []
 
 # --------------------------------------------------------------
 #  Registered versus Casual Use Analysis
@@ -32,12 +49,13 @@ assert (
 
 
 # plot distributions of registered vs casual rides
-sns.distplot(preprocessed_data["registered"], label="registered")
-sns.distplot(preprocessed_data["casual"], label="casual")
-plt.legend()
-plt.title("Rides distributions")
-plt.xlabel("rides")
-plt.savefig("../../reports/Figs/01_rides_distributions.png", format="png")
+jobs.append(
+    FigureJob(
+        figures.rides_distributions,
+        preprocessed_data[["registered", "casual"]],
+        f"{FIGS}/01_rides_distributions.png",
+    )
+)
 
 """
 We can see that registered users take many more rides than casual ones
@@ -45,11 +63,8 @@ We can see that registered users take many more rides than casual ones
 
 
 # plot evolution of rides over time
-plot_data = preprocessed_data[["registered", "casual", "dteday"]]
-ax = plot_data.groupby("dteday").sum().plot(figsize=(15, 5))
-ax.set_xlabel("time")
-ax.set_ylabel("number of rides per day")
-plt.savefig("../../reports/Figs/02_rides_daily.png", format="png")
+daily_rides = rollup_totals(cube, ["dteday"], ["registered", "casual"])
+jobs.append(FigureJob(figures.rides_daily, daily_rides, f"{FIGS}/02_rides_daily.png"))
 
 """
 The number of registered rides is always above and significantly higher than 
@@ -66,71 +81,42 @@ number of rides per day, by grouping over each day. the define window
 for computing the rolling mean and standard deviation.
 """
 
-plot_data = preprocessed_data[["registered", "casual", "dteday"]]
-plot_data = plot_data.groupby("dteday").sum()
 window = 7
-rolling_means = plot_data.rolling(window).mean()
-rolling_deviations = plot_data.rolling(window).std()
 
 """
 Create a plot of the series, where we first plot the series of rolling 
 means, then we color the zone between the series of rolling means +- 2 
-rolling standard deviations
+rolling standard deviations (see figures.rides_rolling)
 """
 
-ax = rolling_means.plot()
-ax.fill_between(
-    rolling_means.index,
-    rolling_means["registered"] + 2 * rolling_deviations["registered"],
-    rolling_means["registered"] - 2 * rolling_deviations["registered"],
-    alpha=0.2,
+jobs.append(
+    FigureJob(
+        figures.rides_rolling,
+        daily_rides,
+        f"{FIGS}/03_rides_aggregated.png.png",
+        {"window": window},
+    )
 )
-ax.fill_between(
-    rolling_means.index,
-    rolling_means["casual"] + 2 * rolling_deviations["casual"],
-    rolling_means["casual"] - 2 * rolling_deviations["registered"],
-    alpha=0.2,
-)
-ax.set_xlabel("time")
-ax.set_ylabel("number of rides per day")
-plt.savefig("../../reports/Figs/03_rides_aggregated.png.png", format="png")
 
 
 # the distributions of the requests over separate hours and days of the week.
-# select relevant columns
-plot_data = preprocessed_data[["hr", "weekday", "registered", "casual"]]
-
-"""
-transform the data into a format, in number of entries are computed as 
-count,for each distinct hr, weekday and type (registered or casual)
-"""
-
-plot_data = plot_data.melt(
-    id_vars=["hr", "weekday"], var_name="type", value_name="count"
-)
 """
-create FacetGrid object, in which a grid plot is produced.As columns, 
+summarize the data, computing the mean number of rides with its confidence
+interval for each distinct hr, weekday and type (registered or casual) from
+the sums of the cube, instead of letting seaborn bootstrap every bar from the raw rows.
+then create FacetGrid object, in which a grid plot is produced.As columns, 
 we have the various days of the week,as rows, the different types (registered and casual)
-"""
-grid = sns.FacetGrid(
-    plot_data,
-    row="weekday",
-    col="type",
-    height=2.5,
-    aspect=2.5,
-    row_order=[
-        "Monday",
-        "Tuesday",
-        "Wednesday",
-        "Thursday",
-        "Friday",
-        "Saturday",
-        "Sunday",
-    ],
+the grid is populated with the precomputed bars in figures.rides_facet_barplot
+"""
+plot_data = rollup_summary(cube, ["weekday", "hr"], ["registered", "casual"])
+jobs.append(
+    FigureJob(
+        figures.rides_facet_barplot,
+        plot_data,
+        f"{FIGS}/04_weekday_hour_distributions.png",
+        {"row": "weekday", "x": "hr", "row_order": figures.WEEKDAYS_ORDER},
+    )
 )
-# populate the FacetGrid with the specific plots
-grid.map(sns.barplot, "hr", "count", alpha=0.5)
-grid.savefig("../../reports/Figs/04_weekday_hour_distributions.png", format="png")
 """
 the highest number of rides for registered users takes place around 8 AM and at 6 PM. 
 This is totally in line with our expectations, as it is likely that most registered users
@@ -141,63 +127,42 @@ use the bike sharing service for commuting.
 #  Analyzing Seasonal Impact on Rides
 # --------------------------------------------------------------
 # we'll investigate the impact of the different season on the total number of rides
-# select subset of data contains season with hr columns
-plot_data = preprocessed_data[["hr", "season", "registered", "casual"]]
-
-# unpivot data from wide to long format
-plot_data = plot_data.melt(
-    id_vars=["hr", "season"], var_name="type", value_name="count"
-)
-
-# define FacetGrid
-grid = sns.FacetGrid(
-    plot_data,
-    row="season",
-    col="type",
-    height=2.5,
-    aspect=2.5,
-    row_order=["winter", "spring", "summer", "fall"],
-)
-# apply plotting function to each element in the grid
-grid.map(sns.barplot, "hr", "count", alpha=0.5)
-plt.show()
-grid.savefig("../../reports/Figs/0_5_season_impact.png", format="png")
-
-
-# select subset of data contains season with weekday columns
-plot_data = preprocessed_data[["weekday", "season", "registered", "casual"]]
-plot_data = plot_data.melt(
-    id_vars=["weekday", "season"], var_name="type", value_name="count"
+# summarize rides per season, hr and type, define FacetGrid and apply
+# plotting function to each element in the grid
+plot_data = rollup_summary(cube, ["season", "hr"], ["registered", "casual"])
+jobs.append(
+    FigureJob(
+        figures.rides_facet_barplot,
+        plot_data,
+        f"{FIGS}/0_5_season_impact.png",
+        {"row": "season", "x": "hr", "row_order": figures.SEASONS_ORDER},
+    )
 )
 
-grid = sns.FacetGrid(
-    plot_data,
-    row="season",
-    col="type",
-    height=2.5,
-    aspect=2.5,
-    row_order=["winter", "spring", "summer", "fall"],
-)
 
-grid.map(
-    sns.barplot,
-    "weekday",
-    "count",
-    alpha=0.5,
-    order=[
-        "Monday",
-        "Tuesday",
-        "Wednesday",
-        "Thursday",
-        "Friday",
-        "Saturday",
-        "Sunday",
-    ],
+# summarize rides per season and weekday
+plot_data = rollup_summary(cube, ["season", "weekday"], ["registered", "casual"])
+jobs.append(
+    FigureJob(
+        figures.rides_facet_barplot,
+        plot_data,
+        f"{FIGS}/0_6_season_impact_to_weekday.png",
+        {
+            "row": "season",
+            "x": "weekday",
+            "row_order": figures.SEASONS_ORDER,
+            "order": figures.WEEKDAYS_ORDER,
+        },
+    )
 )
 
-grid.savefig("../../reports/Figs/0_6_season_impact_to_weekday.png", format="png")
-
 """
 Analyzing Seasonal Impact on Rides. There is a decreasing number of registered rides over 
 the weekend (compared to the rest of the week), while the number of casual rides increases.
 """
+
+# --------------------------------------------------------------
+#  Rendering
+# --------------------------------------------------------------
+# render all figures of the script in parallel (RENDER_PROCESSES=1 for serial)
+render_jobs(jobs)
@@ -5,17 +5,32 @@ import os
 import sys
 import pandas as pd
 import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
 
 sys.path.append("..")
-import visualization.plot_settings
+from analysis.cube import load_cuboids
+from analysis.parallel import cpu_count
+from analysis.stages import STAGE_COLUMNS, WEEKEND_DAYS, hypothesis_stage
+from data.interim import load_interim
+from visualization import figures
+from visualization.plot_settings import apply_plot_settings
+from visualization.rendering import FigureJob, render_jobs
+
+apply_plot_settings()
 
 # --------------------------------------------------------------
 # Loading Data
 # --------------------------------------------------------------
 
-preprocessed_data = pd.read_pickle("../../data/interim/01_preprocessed_data.plk")
+# read only the columns used in this script
+preprocessed_data = load_interim(columns=STAGE_COLUMNS["hypothesis"])
+
+"""
+all the tests of this script are computed by analysis/stages.py, the same code
+the headless cli runs (python cli.py hypothesis --no-figures): the sections
+below print its tables and plot the rides they compare.
+"""
+results = hypothesis_stage(preprocessed_data, load_cuboids(), n_jobs=cpu_count())
+tests = results["tests"].set_index(["test", "type"])
 
 # --------------------------------------------------------------
 #  Hypothesis Tests
@@ -33,25 +48,19 @@ computing the population statistic—that is, the average number of rides.
 """
 
 # Estimating Average Registered Rides
-# compute population mean of registered rides
-
-population_mean = preprocessed_data.registered.mean()
+# the population mean of registered rides is the mean over the whole data
 
 """
 there are two example we'll perform the first for estemating the true avarage numbers of rides perform by 
 registerd for a SUMMER then, we'll perform the same ture avarge but using random sample which a true representation 
 of the population not a summer only
 """
-# get sample of the data (summer 2011)
-sample = preprocessed_data[
-    (preprocessed_data["season"] == "summer") & (preprocessed_data["yr"] == 2011)
-].registered
-
-# perform t_test and p-value, the significance level is 0.05
-from scipy.stats import ttest_1samp
-
-test_result = ttest_1samp(sample, population_mean)
-print(f"Test statistic: {test_result[0]:0.03f}, p-value: {test_result[1]: 0.03f}")
+# t-test of the sample of the data (summer 2011), the significance level is 0.05
+test_result = tests.loc[("t_1samp_summer_2011", "registered")]
+print(
+    f"Test statistic: {test_result.statistic:0.03f}, "
+    f"p-value: {test_result.p_value: 0.03f}"
+)
 
 """ 
 The result of the previous test returns a p-value smaller than 0.001, which is less than 
@@ -67,21 +76,38 @@ selected only entries from the summer of 2011. Therefore, neither data from the
 full year is present, nor entries from 2012. 
 """
 
-# get sample as 5% of the full data
-import random
-
-random.seed(111)
-sample_unbiased = preprocessed_data.registered.sample(frac=0.5)
-test_result_unbiased = ttest_1samp(sample_unbiased, population_mean)
+# t-test of a sample of 50% of the full data
+"""
+random.seed doesn't seed pandas' sample, so the sample (and the p-value) changed
+on every run. the indices are drawn from a numpy Generator seeded with 111 instead,
+the same seed always gives the same sample.
+"""
+test_result_unbiased = tests.loc[("t_1samp_random_half", "registered")]
 print(
-    f"Test statistic: {test_result_unbiased[0]:0.03f}, p-value: {test_result_unbiased[1]: 0.03f}"
+    f"Test statistic: {test_result_unbiased.statistic:0.03f}, "
+    f"p-value: {test_result_unbiased.p_value: 0.03f}"
 )
 """
-This time, the computed p-value is equal to 0.685, which is much larger than the critical 0.05, 
+This time, the computed p-value is much larger than the critical 0.05, 
 and so, you cannot reject the null hypothesis.we saw the importance of having an unbiased sample 
 of the data, as test results can be easily compromised if working with biased data.
 """
 
+# sampling distribution of the mean registered rides
+"""
+to see how much the sample mean varies, draw 1000 samples of 5% of the data,
+stratified by season, yr and hr so every sample has the composition of the full
+data. the samples are drawn at once as a 2-D array of indices (one row per sample)
+and the same array is reused for every statistic.
+"""
+sampling = results["sampling_distribution"].set_index("statistic")
+print(
+    f"Sample means: {sampling.loc['mean', 'mean']:0.03f} "
+    f"+- {sampling.loc['mean', 'std']:0.03f}, "
+    f"sample medians: {sampling.loc['median', 'mean']:0.03f} "
+    f"+- {sampling.loc['median', 'std']:0.03f}"
+)
+
 # --------------------------------------------------------------
 # Hypothesis Testing on Registered Rides
 # --------------------------------------------------------------
@@ -93,37 +119,58 @@ weekend≠0
 """
 
 # define mask, indicating if the day is weekend or work day
-weekend_days = ["Saturday", "Sunday"]
-weekend_mask = preprocessed_data.weekday.isin(weekend_days)
-workingdays_mask = ~preprocessed_data.weekday.isin(weekend_days)
+weekend_mask = preprocessed_data.weekday.isin(WEEKEND_DAYS)
+workingdays_mask = ~weekend_mask
 
 # select registered rides for the weekend and working days
 weekend_data = preprocessed_data.registered[weekend_mask]
 workingdays_data = preprocessed_data.registered[workingdays_mask]
 
-# perform ttest
-from scipy.stats import ttest_ind
-
 """
 ttest_ind function from the scipy.stats module is used to
 perform a T-test for the means of two independent samples.
 """
-test_result = ttest_ind(weekend_data, workingdays_data)
-print(f"Test statistic: {test_result[0]:0.03f}, p-value: {test_result[1]: 0.03f}")
+test_result = tests.loc[("t_ind_weekend", "registered")]
+print(
+    f"Test statistic: {test_result.statistic:0.03f}, "
+    f"p-value: {test_result.p_value: 0.03f}"
+)
 """ 
 The resulting p-value from this test is less than 0.0001, which is far below the 
 standard critical 0.05 value. As a conclusion, we can reject the null hypothesis 
 and confirm that our initial observation is correct
 """
 
-#  plot distributions of registered rides for working vs weekend days
-sns.distplot(weekend_data, label="weekend days")
-sns.distplot(workingdays_data, label="working days")
-plt.legend()
-plt.xlabel("rides")
-plt.ylabel("frequency")
-plt.title("Registered rides distributions")
-plt.savefig("../../reports/Figs/0_7_Registered rides distributions.png", format="png")
+"""
+the t-test assumes normally distributed data, but the rides distributions are
+clearly skewed. permutation and bootstrap tests make no such assumption: the
+permutation test shuffles the weekend/working day labels, the bootstrap resamples
+both groups to get a confidence interval of the difference of means. both draw
+10000 resamples in vectorized batches, spread over all cores.
+"""
+perm_result = tests.loc[("permutation_mean", "registered")]
+print(
+    f"Permutation test: difference {perm_result.statistic:0.03f}, "
+    f"p-value: {perm_result.p_value: 0.04f}"
+)
+boot_result = tests.loc[("bootstrap_mean", "registered")]
+print(
+    f"Bootstrap 95% CI of the difference: "
+    f"[{boot_result.ci_low:0.03f}, {boot_result.ci_high:0.03f}], "
+    f"p-value: {boot_result.p_value: 0.04f}"
+)
+
+#  plot distributions of registered rides for working vs weekend days,
+# the figures of this script are rendered together at the end
+FIGS = "../../reports/Figs"
+jobs = [
+    FigureJob(
+        figures.weekend_distributions,
+        {"weekend days": weekend_data, "working days": workingdays_data},
+        f"{FIGS}/0_7_Registered rides distributions.png",
+        {"title": "Registered rides distributions"},
+    )
+]
 
 """ 
 the second assumption from the last section that is, casual users perform more
@@ -136,18 +183,35 @@ during the weekend, both performed only by casual customers.
 weekend_data = preprocessed_data.casual[weekend_mask]
 workingdays_data = preprocessed_data.casual[workingdays_mask]
 
-# perform ttest
-test_result = ttest_ind(weekend_data, workingdays_data)
-print(f"Test statistic: {test_result[0]:0.03f}, p-value: {test_result[1]: 0.03f}")
+test_result = tests.loc[("t_ind_weekend", "casual")]
+print(
+    f"Test statistic: {test_result.statistic:0.03f}, "
+    f"p-value: {test_result.p_value: 0.03f}"
+)
+
+# and the distribution-free tests, here comparing mean ranks in the permutation test
+perm_result = tests.loc[("permutation_rank", "casual")]
+print(
+    f"Permutation test: rank difference {perm_result.statistic:0.03f}, "
+    f"p-value: {perm_result.p_value: 0.04f}"
+)
+boot_result = tests.loc[("bootstrap_mean", "casual")]
+print(
+    f"Bootstrap 95% CI of the difference: "
+    f"[{boot_result.ci_low:0.03f}, {boot_result.ci_high:0.03f}], "
+    f"p-value: {boot_result.p_value: 0.04f}"
+)
 
 # plot distribution of casual rides for working days VS weekend days
-sns.distplot(weekend_data, label="weekend days")
-sns.distplot(workingdays_data, label="working days")
-plt.legend()
-plt.xlabel("rides")
-plt.ylabel("frequancy")
-plt.title("Casual rides distributions")
-plt.savefig("../../reports/Figs/0_8_casual rides distributions.png", format="png")
+jobs.append(
+    FigureJob(
+        figures.weekend_distributions,
+        {"weekend days": weekend_data, "working days": workingdays_data},
+        f"{FIGS}/0_8_casual rides distributions.png",
+        {"title": "Casual rides distributions"},
+    )
+)
+render_jobs(jobs)
 
 """
 The p-value returned from the previous code snippet is 0, which is strong 
@@ -158,3 +222,30 @@ we can say that there is a statistically significant difference between
 the number of rides on working days and weekend days for both casual and  
 registered customers. 
 """
+
+# --------------------------------------------------------------
+# Hypothesis Testing across Segments
+# --------------------------------------------------------------
+"""
+The same tests can be run for every segment of the data at once. Counts, means
+and variances of all segments are rolled up from the sums and sums of squares
+of the cuboids of the aggregate cube, without going back to the rows, and the t-tests
+are evaluated on whole arrays. With hundreds of tests, some would reject the
+null hypothesis by chance alone, so the p-values are corrected for multiple
+comparisons (Benjamini-Hochberg false discovery rate).
+"""
+# one-sample t-test of every segment (season, yr, weathersit and hr) against
+# the population mean of each ride type
+segment_tests = results["segment_tests"]
+print(
+    f"Segments differing from the population mean: "
+    f"{segment_tests.reject.sum()} of {len(segment_tests)}"
+)
+
+# weekend vs working days (Welch t-test) inside every season, year and hour
+weekend_tests = results["weekend_segment_tests"]
+print(
+    weekend_tests.groupby("type")["reject"]
+    .agg(["sum", "count"])
+    .rename(columns={"sum": "significant", "count": "tests"})
+)
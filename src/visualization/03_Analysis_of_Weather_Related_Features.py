@@ -5,17 +5,29 @@ import os
 import sys
 import pandas as pd
 import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
 
 sys.path.append("..")
-import visualization.plot_settings
+from analysis.correlations import compute_correlations
+from analysis.stages import RIDE_TYPES, STAGE_COLUMNS, WEATHER_FEATURES, weather_stage
+from data.interim import column_cache_fresh, load_column_cache, load_interim
+from visualization import figures
+from visualization.plot_settings import apply_plot_settings
+from visualization.rendering import FigureJob, render_jobs
+
+apply_plot_settings()
 
 # --------------------------------------------------------------
 # Loading Data
 # --------------------------------------------------------------
 
-preprocessed_data = pd.read_pickle("../../data/interim/01_preprocessed_data.plk")
+# read only the columns used in this script, all of them are numeric so they
+# can be memory-mapped from the column cache when it was written with the
+# current parquet (a streaming run of 01_Processing_data.py removes it)
+cols = STAGE_COLUMNS["weather"]
+if column_cache_fresh():
+    preprocessed_data = load_column_cache(columns=cols)
+else:
+    preprocessed_data = load_interim(columns=cols)
 
 # --------------------------------------------------------------
 # Analysis of Weather-Related Features
@@ -25,56 +37,65 @@ the first and most common way to measure the relationship
 between two different continuous variables is to measure their correlation.
 """
 # correlation coefficient assuming there's a linear relatioship between random variable
-#  define a function that performs the analysis between the variables
-
-
-def plot_correlations(data, col):
-    # get correlation betwwen col and registered rides
-    corr_reg = np.corrcoef(data[col], data["registered"])[0, 1]
-    ax = sns.regplot(
-        x=col,
-        y="registered",
-        data=data,
-        scatter_kws={"alpha": 0.1},
-        label=f"Registered rides (correlation: {corr_reg: 0.3f})",
-    )
-    # get correlation betwwen col and registered rides
-    corr_casu = np.corrcoef(data[col], data["casual"])[0, 1]
-    ax = sns.regplot(
-        x=col,
-        y="casual",
-        data=data,
-        scatter_kws={"alpha": 0.1},
-        label=f"Casual rides (correlation: {corr_reg: 0.3f})",
+"""
+all the correlations of this script (Pearson and Spearman, with p-values) are
+computed once, as full matrices over the weather features and ride types, by
+analysis/stages.py (the same code the headless cli runs). the regression plots,
+the correlations table and the correlation matrix below are all read from its
+tables.
+"""
+features = WEATHER_FEATURES
+targets = RIDE_TYPES
+correlations = weather_stage(preprocessed_data)
+pearson = correlations["pearson"].set_index("feature")
+
+FIGS = "../../reports/Figs"
+jobs = []
+
+
+#  define a function that creates the job plotting the relationship between
+#  col and the rides, labeled with the correlations computed above
+def plot_correlations(data, col, path):
+    return FigureJob(
+        figures.rides_correlation,
+        data[[col, "registered", "casual"]],
+        path,
+        {
+            "col": col,
+            "corr_registered": pearson.loc[col, "registered"],
+            "corr_casual": pearson.loc[col, "casual"],
+        },
     )
-    # adjust legand alpha
-    legend = ax.legend()
-    for lh in legend.legendHandles:
-        lh.set_alpha(0.5)
-        ax.set_ylabel("rides")
-        ax.set_title(f"Correlation between rides and {col}")
-        return ax
 
 
 # Applying the previously defined function to the four columns (temp, atemp, hum, and windspeed)
-plt.figure()
-ax = plot_correlations(preprocessed_data, "temp")
-plt.savefig(
-    "../../reports/Figs/0_9_Correlation between rides and temp.png", format="png"
+jobs.append(
+    plot_correlations(
+        preprocessed_data,
+        "temp",
+        f"{FIGS}/0_9_Correlation between rides and temp.png",
+    )
 )
-plt.figure()
-ax = plot_correlations(preprocessed_data, "atemp")
-plt.savefig(
-    "../../reports/Figs/10_Correlation between rides and atemp.png", format="png"
+jobs.append(
+    plot_correlations(
+        preprocessed_data,
+        "atemp",
+        f"{FIGS}/10_Correlation between rides and atemp.png",
+    )
 )
-plt.figure()
-ax = plot_correlations(preprocessed_data, "hum")
-plt.savefig("../../reports/Figs/11_Correlation between rides and hum.png", format="png")
-plt.figure()
-ax = plot_correlations(preprocessed_data, "windspeed")
-plt.savefig(
-    "../../reports/Figs/12_Correlation between rides and windspeed.png",
-    format="png",
+jobs.append(
+    plot_correlations(
+        preprocessed_data,
+        "hum",
+        f"{FIGS}/11_Correlation between rides and hum.png",
+    )
+)
+jobs.append(
+    plot_correlations(
+        preprocessed_data,
+        "windspeed",
+        f"{FIGS}/12_Correlation between rides and windspeed.png",
+    )
 )
 """ 
 A big problem with the correlation coefficient is that it assumes the relationship between 
@@ -91,31 +112,20 @@ y_lin = 0.5 * x + 0.1 * np.random.randn(100)
 y_mon = np.exp(x) + 0.1 * np.random.randn(100)
 
 # compute correlations
-from scipy.stats import pearsonr, spearmanr
-
-corr_lin_pearson = pearsonr(x, y_lin)[0]
-corr_lin_spearman = spearmanr(x, y_lin)[0]
-
-corr_mon_pearson = pearsonr(x, y_mon)[0]
-corr_mon_spearman = spearmanr(x, y_mon)[0]
+example = pd.DataFrame({"x": x, "y_lin": y_lin, "y_mon": y_mon})
+example_correlations = compute_correlations(example, ["x", "y_lin", "y_mon"])
 
 # visualize variables
-fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(10, 5))
-ax1.scatter(x, y_lin)
-ax1.set_title(
-    f"Linear relationship\n \
-Pearson: {corr_lin_pearson:.3f}, \
-Spearman: {corr_lin_spearman:.3f}"
-)
-ax2.scatter(x, y_mon)
-ax2.set_title(
-    f"Monotonic relationship\n \
-Pearson: {corr_mon_pearson:.3f}, \
-Spearman: {corr_mon_spearman:.3f}"
-)
-plt.savefig(
-    "../../reports/Figs/13_Difference between the Pearson and Spearman Correlations.png",
-    format="png",
+jobs.append(
+    FigureJob(
+        figures.pearson_vs_spearman,
+        example,
+        f"{FIGS}/13_Difference between the Pearson and Spearman Correlations.png",
+        {
+            "pearson": example_correlations.pearson["x"],
+            "spearman": example_correlations.spearman["x"],
+        },
+    )
 )
 
 """ 
@@ -131,50 +141,22 @@ the almost perfect relationship between the two variables.
 
 """
 
-
-# define function for computing correlations
-def compute_correlations(data, col):
-    pearson_regis = pearsonr(data[col], data["registered"])[0]
-    pearson_casul = pearsonr(data[col], data["casual"])[0]
-    spearman_regis = spearmanr(data[col], data["registered"])[0]
-    spearman_casul = spearmanr(data[col], data["casual"])[0]
-    return pd.Series(
-        {
-            "Pearson (Registered)": pearson_regis,
-            "Pearson (Casual)": pearson_casul,
-            "Spearman (Registered)": spearman_regis,
-            "Spearman (Casual)": spearman_casul,
-        }
-    )
-
-
 """
-Note: function returns a pandas.Series() object, 
-which will be used to create a new dataset containing the different correlations
+Note: the correlations table is a pandas.DataFrame() object containing the
+different correlations, read from the matrices computed at the beginning
 """
-# compute correlation measures between different features
-cols = ["temp", "atemp", "hum", "windspeed"]
-corr_data = pd.DataFrame(
-    index=[
-        "Pearson (Registered)",
-        "Spearman (Registered)",
-        "Pearson (Casual)",
-        "Spearman (Casual)",
-    ]
-)
-for col in cols:
-    corr_data[col] = compute_correlations(preprocessed_data, col)
+# correlation measures between different features
+corr_data = correlations["correlations"].set_index("correlation")
 corr_data.T
 
+# p-values of the correlations, all far below 0.05
+correlations["pearson_p"].set_index("feature")
+correlations["spearman_p"].set_index("feature")
+
 # plot correlation matrix
-cols = ["temp", "atemp", "hum", "windspeed", "registered", "casual"]
-plot_data = preprocessed_data[cols]
-corr = plot_data.corr()
-fig = plt.figure(figsize=(10, 8))
-plt.matshow(corr, fignum=fig.number)
-plt.xticks(range(len(plot_data.columns)), plot_data.columns)
-plt.yticks(range(len(plot_data.columns)), plot_data.columns)
-plt.colorbar()
-plt.ylim([5.5, -0.5])
-plt.title("Matrix correlations.png")
-plt.savefig("../../reports/Figs/14_matrix correlations.png", format="png")
+corr = correlations["pearson_matrix"].set_index("feature").rename_axis(None)
+jobs.append(
+    FigureJob(figures.correlation_matrix, corr, f"{FIGS}/14_matrix correlations.png")
+)
+
+render_jobs(jobs)
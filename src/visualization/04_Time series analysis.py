@@ -5,17 +5,40 @@ import os
 import sys
 import pandas as pd
 import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
 
 sys.path.append("..")
-import visualization.plot_settings
+from analysis.stages import (
+    STAGE_COLUMNS,
+    decomposition_result,
+    panel_series,
+    timeseries_stage,
+)
+from data.interim import INTERIM_DIR, load_interim
+from visualization import figures
+from visualization.plot_settings import apply_plot_settings
+from visualization.rendering import FigureJob, render_jobs
+
+apply_plot_settings()
 
 # --------------------------------------------------------------
 # Loading Data
 # --------------------------------------------------------------
 
-preprocessed_data = pd.read_pickle("../../data/interim/01_preprocessed_data.plk")
+# read only the columns used in this script
+preprocessed_data = load_interim(columns=STAGE_COLUMNS["timeseries"])
+
+"""
+all the series of this script (daily totals, their differences and the
+residuals of their decompositions), the decompositions and the Dickey-Fuller
+tests are computed by analysis/stages.py, the same code the headless cli
+runs: the hourly series of rides is built once, the daily totals are
+resampled from it, and the ADF results are cached by a hash of the series,
+so unchanged series are not tested again. the sections below plot its tables.
+"""
+results = timeseries_stage(preprocessed_data, cache_dir=f"{INTERIM_DIR}/adf_cache")
+series = results["series"]
+decompositions = results["decomposition"]
+stationarity = results["stationarity"].set_index("series")
 
 # --------------------------------------------------------------
 #  Time Series Analysis
@@ -29,41 +52,41 @@ time.
 we can rely on two different techniques for identifying time series stationarity:
 rolling statistics and augmented Dickey-Fuller stationarity test
 
-define function for plotting rolling statistics and 
-Augmented Dickey-Fuller stationarity test (ADF)) for time series.
+every tested series is plotted with its rolling statistics, titled with the
+p-value of its augmented Dickey-Fuller stationarity test (ADF), run over the
+whole panel of series at once (in parallel, with cached results).
 """
-from statsmodels.tsa.stattools import adfuller
-
+FIGS = "../../reports/Figs"
+jobs = []
 
-def test_stationarity(ts, window=10, center=True, **kwargs):
-    # create a dataframe for plotting
-    plot_data = pd.DataFrame(ts)
-    plot_data["rolling_mean"] = ts.rolling(window=window, center=center).mean()
-    plot_data["rolling_std"] = ts.rolling(window=window, center=center).std()
-    # compute p-value of Dickey-Fuller test
-    p_value = adfuller(ts)[1]
-    # Plotting the data
-    ax = plot_data.plot(**kwargs)
-    ax.set_title(f"Dickey-Fuller p-value: {p_value:.3f}")
-    plt.show()
 
+def test_stationarity(name, label, path, window=10, center=True, **kwargs):
+    # plot the rolling statistics of the tested series name, labeled label
+    kwargs = dict(window=window, center=center, **kwargs)
+    kwargs["p_value"] = stationarity.loc[name, "p_value"]
+    ts = panel_series(series, name).rename(label)
+    jobs.append(FigureJob(figures.stationarity_plot, ts, path, kwargs))
 
-# Example usage with DataFrame 'daily_rides'
-daily_rides = preprocessed_data[["dteday", "registered", "casual"]]
-daily_rides = daily_rides.groupby("dteday").sum()
 
-# convert index to DateTime object
-daily_rides.index = pd.to_datetime(daily_rides.index)
-plt.figure()
 # Test stationarity on the 'registered' series
 test_stationarity(
-    ts=daily_rides["registered"], window=10, center=True, ylabel="Rides", xlabel="Date"
+    "registered",
+    "registered",
+    f"{FIGS}/15_daily_registered_original.png",
+    window=10,
+    center=True,
+    ylabel="Rides",
+    xlabel="Date",
 )
-plt.savefig("../../reports/Figs/15_daily_registered_original.png", format="png")
 test_stationarity(
-    ts=daily_rides["casual"], window=10, center=True, ylabel="Rides", xlabel="Date"
+    "casual",
+    "casual",
+    f"{FIGS}/16_daily_registered_original.png",
+    window=10,
+    center=True,
+    ylabel="Rides",
+    xlabel="Date",
 )
-plt.savefig("../../reports/Figs/16_daily_registered_original.png", format="png")
 
 """ 
 From the performed tests, we can see that neither the moving average nor standard 
@@ -77,49 +100,39 @@ A common way to detrend a time series and make it stationary is to subtract eith
 rolling mean or its last value, or to decompose it into a component that will contain its 
 trend, seasonality, and residual components.
 """
-# substract rolling mean
-registered = daily_rides["registered"]
-registered_ma = registered.rolling(window=10).mean()
-registered_ma_differance = registered - registered_ma
-registered_ma_differance.dropna(inplace=True)
+# substract rolling mean (of 10 days, computed for both series in a single pass)
 # plot tested stationarity for registered
-plt.figure()
-test_stationarity(registered_ma_differance, figsize=(20, 5))
-plt.savefig(
-    "../../reports/Figs/17_tested_stationarity_for_registered.png", format="png"
+test_stationarity(
+    "registered_ma_difference",
+    "registered",
+    f"{FIGS}/17_tested_stationarity_for_registered.png",
+    figsize=(20, 5),
 )
 
-# plot tested stationarity for registered
-casual = daily_rides["casual"]
-casual_ma = casual.rolling(window=10).mean()
-casual_ma_differance = casual - casual_ma
-casual_ma_differance.dropna(inplace=True)
-plt.figure()
-test_stationarity(casual_ma_differance, figsize=(20, 5))
-plt.savefig("../../reports/Figs/18_tested_stationarity_for_casual.png", format="png")
+# plot tested stationarity for casual
+test_stationarity(
+    "casual_ma_difference",
+    "casual",
+    f"{FIGS}/18_tested_stationarity_for_casual.png",
+    figsize=(20, 5),
+)
 
 
 # subtract last value
-registered = daily_rides["registered"]
-registered_differance = registered - registered.shift()
-registered_differance.dropna(inplace=True)
 # plot tested stationarity for registered
-plt.figure()
-test_stationarity(registered_differance, figsize=(20, 5))
-plt.savefig(
-    "../../reports/Figs/19_tested_stationarity_for_registered_as_lastValue.png",
-    format="png",
+test_stationarity(
+    "registered_last_difference",
+    "registered",
+    f"{FIGS}/19_tested_stationarity_for_registered_as_lastValue.png",
+    figsize=(20, 5),
 )
 
 # plot tested stationarity for casual
-casual = daily_rides["casual"]
-casual_differance = casual - casual.shift()
-casual_differance.dropna(inplace=True)
-plt.figure()
-test_stationarity(casual_ma_differance, figsize=(20, 5))
-plt.savefig(
-    "../../reports/Figs/20_tested_stationarity_for_casual_as_lastValue.png",
-    format="png",
+test_stationarity(
+    "casual_last_difference",
+    "casual",
+    f"{FIGS}/20_tested_stationarity_for_casual_as_lastValue.png",
+    figsize=(20, 5),
 )
 """
 both of the techniques returned a time series, which is stationary, according to the Dickey-Fuller test. 
@@ -131,29 +144,68 @@ in which it is lower.
 # --------------------------------------------------------------
 # decompose the number of rides into three separate components, trend, seasonal, and residual components
 # --------------------------------------------------------------
-
-from statsmodels.tsa.seasonal import seasonal_decompose
-
-registered_decomposition = seasonal_decompose(daily_rides["registered"])
-casual_decomposition = seasonal_decompose(daily_rides["casual"])
+# incremental decomposition with a weekly period (same result as statsmodels'
+# seasonal_decompose); a new day can be added with .append(new_rides) without
+# recomputing the history, the last 3 days stay provisional until then
+registered_decomposition = decomposition_result(decompositions, "registered", 7)
+casual_decomposition = decomposition_result(decompositions, "casual", 7)
 
 # plot decompositions
-registered_plot = registered_decomposition.plot()
-registered_plot.set_size_inches(10, 8)
-
-casual_plot = casual_decomposition.plot()
-casual_plot.set_size_inches(10, 8)
-
-registered_plot.savefig(
-    "../../reports/Figs/21_registered_decomposition.png", format="png"
+jobs.append(
+    FigureJob(
+        figures.decomposition_plot,
+        registered_decomposition,
+        f"{FIGS}/21_registered_decomposition.png",
+    )
+)
+jobs.append(
+    FigureJob(
+        figures.decomposition_plot,
+        casual_decomposition,
+        f"{FIGS}/22_casual_decomposition.png",
+    )
 )
-casual_plot.savefig("../../reports/Figs/22_casual_decomposition.png", format="png")
 
 # test residuals for stationarity
-plt.figure()
-test_stationarity(registered_decomposition.resid.dropna(), figsize=(25, 5))
-plt.savefig("../../reports/Figs/23_registered_resid.png", format="png")
+test_stationarity(
+    "registered_resid",
+    "resid",
+    f"{FIGS}/23_registered_resid.png",
+    figsize=(25, 5),
+)
+test_stationarity(
+    "casual_resid",
+    "resid",
+    f"{FIGS}/24_casual_resid.png",
+    figsize=(20, 5),
+)
 
-plt.figure()
-test_stationarity(registered_decomposition.resid.dropna(), figsize=(20, 5))
-plt.savefig("../../reports/Figs/24_registered_resid.png", format="png")
+# --------------------------------------------------------------
+# hourly resolution: daily (24 hours) and weekly (168 hours) seasonality
+# --------------------------------------------------------------
+"""
+some hours have no row in the data (the daily totals hide it). the gap
+report lists every run of missing hours; for the hourly decompositions
+the missing hours are interpolated from their neighbours rather than
+counted as hours without rides.
+"""
+gaps = results["gaps"]
+print(
+    f"{gaps.hours.sum()} missing hours in {len(gaps)} gaps, "
+    f"longest: {gaps.hours.max()} hours from {gaps.start[gaps.hours.idxmax()]}"
+)
+# the residuals of the daily (24) and weekly (168 hours) decompositions are
+# tested too, see the table below
+jobs.append(
+    FigureJob(
+        figures.decomposition_plot,
+        decomposition_result(decompositions, "registered", 168, "hourly"),
+        f"{FIGS}/25_registered_hourly_decomposition.png",
+    )
+)
+
+# --------------------------------------------------------------
+# Dickey-Fuller tests of all the series, and rendering
+# --------------------------------------------------------------
+print(stationarity[["adf_stat", "p_value", "used_lag", "n_obs", "cached"]])
+render_jobs(jobs)
@@ -0,0 +1,188 @@
+# --------------------------------------------------------------
+# Plotting functions used as figure jobs
+# --------------------------------------------------------------
+"""
+Each function draws one report figure on a new figure from the data it is
+given and returns the object to save (see visualization.rendering).
+"""
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import seaborn as sns
+
+from analysis.rolling import rolling_stats
+
+WEEKDAYS_ORDER = [
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+    "Sunday",
+]
+SEASONS_ORDER = ["winter", "spring", "summer", "fall"]
+
+
+def rides_distributions(data):
+    # distributions of registered vs casual rides
+    fig = plt.figure()
+    sns.distplot(data["registered"], label="registered")
+    sns.distplot(data["casual"], label="casual")
+    plt.legend()
+    plt.title("Rides distributions")
+    plt.xlabel("rides")
+    return fig
+
+
+def rides_daily(daily_rides):
+    # evolution of rides over time, daily_rides is indexed by day
+    ax = daily_rides.plot(figsize=(15, 5))
+    ax.set_xlabel("time")
+    ax.set_ylabel("number of rides per day")
+    return ax.figure
+
+
+def rides_rolling(daily_rides, window=7):
+    # rolling means of the daily rides with a band of +- 2 rolling std
+    rolling_means = daily_rides.rolling(window).mean()
+    rolling_deviations = daily_rides.rolling(window).std()
+
+    ax = rolling_means.plot()
+    ax.fill_between(
+        rolling_means.index,
+        rolling_means["registered"] + 2 * rolling_deviations["registered"],
+        rolling_means["registered"] - 2 * rolling_deviations["registered"],
+        alpha=0.2,
+    )
+    ax.fill_between(
+        rolling_means.index,
+        rolling_means["casual"] + 2 * rolling_deviations["casual"],
+        rolling_means["casual"] - 2 * rolling_deviations["registered"],
+        alpha=0.2,
+    )
+    ax.set_xlabel("time")
+    ax.set_ylabel("number of rides per day")
+    return ax.figure
+
+
+def _summary_barplot(x, order, data, alpha=0.5, color=None, **kwargs):
+    # bars of precomputed means with their confidence intervals
+    data = data.set_index(x).reindex(order)
+    positions = np.arange(len(order))
+    ax = plt.gca()
+    ax.bar(positions, data["mean"], color=color, alpha=alpha, **kwargs)
+    ax.vlines(positions, data["ci_low"], data["ci_high"], color=".26")
+    ax.set_xticks(positions, [str(label) for label in order])
+    ax.set_xlim(-0.5, len(order) - 0.5)
+    ax.set_xlabel(x)
+
+
+def rides_facet_barplot(summary, row, x, row_order, order=None):
+    """
+    Grid of barplots of the mean rides per x, with one row per value of row
+    and one column per ride type. summary is the output of
+    analysis.aggregates.group_summary(data, [row, x], ride types).
+    """
+    if order is None:
+        order = sorted(summary[x].unique())
+    grid = sns.FacetGrid(
+        summary,
+        row=row,
+        col="type",
+        height=2.5,
+        aspect=2.5,
+        row_order=row_order,
+    )
+    grid.map_dataframe(_summary_barplot, x, order, alpha=0.5)
+    grid.set_axis_labels(x, "count")
+    return grid
+
+
+def weekend_distributions(data, title, ylabel="frequency"):
+    # distributions of rides for weekend vs working days, data is a dict
+    # with the rides of "weekend days" and of "working days"
+    fig = plt.figure()
+    sns.distplot(data["weekend days"], label="weekend days")
+    sns.distplot(data["working days"], label="working days")
+    plt.legend()
+    plt.xlabel("rides")
+    plt.ylabel(ylabel)
+    plt.title(title)
+    return fig
+
+
+def rides_correlation(data, col, corr_registered, corr_casual):
+    # regression plots of registered and casual rides against col, the
+    # correlations for the labels are computed beforehand
+    fig = plt.figure()
+    ax = sns.regplot(
+        x=col,
+        y="registered",
+        data=data,
+        scatter_kws={"alpha": 0.1},
+        seed=0,
+        label=f"Registered rides (correlation: {corr_registered: 0.3f})",
+    )
+    ax = sns.regplot(
+        x=col,
+        y="casual",
+        data=data,
+        scatter_kws={"alpha": 0.1},
+        seed=0,
+        label=f"Casual rides (correlation: {corr_casual: 0.3f})",
+    )
+    # adjust legand alpha
+    legend = ax.legend()
+    for lh in legend.legend_handles:
+        lh.set_alpha(0.5)
+    ax.set_ylabel("rides")
+    ax.set_title(f"Correlation between rides and {col}")
+    return fig
+
+
+def pearson_vs_spearman(data, pearson, spearman):
+    # scatter plots of y_lin and y_mon against x, titled with their
+    # correlations (dicts keyed by y_lin and y_mon)
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(10, 5))
+    ax1.scatter(data["x"], data["y_lin"])
+    ax1.set_title(f"Linear relationship\n \
+Pearson: {pearson['y_lin']:.3f}, \
+Spearman: {spearman['y_lin']:.3f}")
+    ax2.scatter(data["x"], data["y_mon"])
+    ax2.set_title(f"Monotonic relationship\n \
+Pearson: {pearson['y_mon']:.3f}, \
+Spearman: {spearman['y_mon']:.3f}")
+    return fig
+
+
+def correlation_matrix(corr):
+    # heatmap of a correlation matrix
+    fig = plt.figure(figsize=(10, 8))
+    plt.matshow(corr, fignum=fig.number)
+    plt.xticks(range(len(corr.columns)), corr.columns)
+    plt.yticks(range(len(corr.columns)), corr.columns)
+    plt.colorbar()
+    plt.ylim([len(corr.columns) - 0.5, -0.5])
+    plt.title("Matrix correlations.png")
+    return fig
+
+
+def stationarity_plot(ts, p_value, window=10, center=True, **kwargs):
+    # the series with its rolling mean and std, titled with the p-value of
+    # its Dickey-Fuller test (see analysis.stationarity.adf_screen)
+    plot_data = pd.DataFrame(ts)
+    rolling = rolling_stats(ts, [window], center=center)
+    plot_data["rolling_mean"] = rolling["mean", window].iloc[:, 0]
+    plot_data["rolling_std"] = rolling["std", window].iloc[:, 0]
+    ax = plot_data.plot(**kwargs)
+    ax.set_title(f"Dickey-Fuller p-value: {p_value:.3f}")
+    return ax.figure
+
+
+def decomposition_plot(decomposition):
+    # observed, trend, seasonal and residual components of a decomposition
+    fig = decomposition.plot()
+    fig.set_size_inches(10, 8)
+    return fig
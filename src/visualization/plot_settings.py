@@ -2,17 +2,21 @@ import matplotlib as mpl
 import matplotlib.pyplot as plt
 from cycler import cycler
 
-colors = cycler(color=plt.get_cmap("tab10").colors)  # ["b", "r", "g"]
 
-mpl.style.use("ggplot")
-mpl.rcParams["figure.figsize"] = (20, 5)
-mpl.rcParams["axes.facecolor"] = "white"
-mpl.rcParams["axes.grid"] = True
-mpl.rcParams["grid.color"] = "lightgray"
-mpl.rcParams["axes.prop_cycle"] = colors
-mpl.rcParams["axes.linewidth"] = 1
-mpl.rcParams["xtick.color"] = "black"
-mpl.rcParams["ytick.color"] = "black"
-mpl.rcParams["font.size"] = 12
-mpl.rcParams["figure.titlesize"] = 25
-mpl.rcParams["figure.dpi"] = 100
+def apply_plot_settings():
+    # global matplotlib settings of the report figures, applied by the
+    # scripts (and the rendering workers) rather than on import
+    colors = cycler(color=plt.get_cmap("tab10").colors)  # ["b", "r", "g"]
+
+    mpl.style.use("ggplot")
+    mpl.rcParams["figure.figsize"] = (20, 5)
+    mpl.rcParams["axes.facecolor"] = "white"
+    mpl.rcParams["axes.grid"] = True
+    mpl.rcParams["grid.color"] = "lightgray"
+    mpl.rcParams["axes.prop_cycle"] = colors
+    mpl.rcParams["axes.linewidth"] = 1
+    mpl.rcParams["xtick.color"] = "black"
+    mpl.rcParams["ytick.color"] = "black"
+    mpl.rcParams["font.size"] = 12
+    mpl.rcParams["figure.titlesize"] = 25
+    mpl.rcParams["figure.dpi"] = 100
@@ -0,0 +1,187 @@
+# --------------------------------------------------------------
+# Parallel figure rendering
+# --------------------------------------------------------------
+"""
+Every figure of a script is described as an independent job: a plotting
+function, the data slice it needs, the output path and extra keyword
+arguments. render_jobs draws the jobs in a process pool using the Agg
+backend, each worker applying plot_settings first, so a report renders on
+all cores. Since every job draws on a fresh figure with the same settings,
+the images are the same whether the jobs run in the pool or one by one.
+
+A job is skipped when its png exists and its hash (the data slice, the
+kwargs, the source of the plotting function and of the code it calls, and
+plot_settings) is the one stored in data/interim/figures_state.json when
+the png was last written, so editing one plotting function only redraws its
+own figures.
+RENDER_FORCE=1 (set by pipeline.py --force) redraws everything.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from analysis.parallel import cpu_count, process_pool
+from instrumentation import stage, timed
+
+# plot(data, **kwargs) must return the object to save: a matplotlib Figure,
+# or anything with a savefig method such as a seaborn FacetGrid
+FigureJob = namedtuple("FigureJob", ["plot", "data", "path", "kwargs"], defaults=[None])
+
+# number of worker processes, 1 renders the jobs serially in this process
+RENDER_PROCESSES = int(os.environ.get("RENDER_PROCESSES", cpu_count()))
+RENDER_FORCE = bool(os.environ.get("RENDER_FORCE"))
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+FIGURES_STATE = os.path.join(ROOT, "data", "interim", "figures_state.json")
+PLOT_SETTINGS = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "plot_settings.py"
+)
+
+
+def _update_digest(digest, obj):
+    # pandas and numpy objects by their values, containers and plain objects
+    # (e.g. statsmodels results) item by item, anything else by its repr
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        digest.update(repr((type(obj).__name__, obj.shape)).encode())
+        if isinstance(obj, pd.DataFrame):
+            digest.update(repr(list(obj.columns)).encode())
+        digest.update(str(obj.dtypes).encode())
+        digest.update(pd.util.hash_pandas_object(obj).to_numpy().tobytes())
+    elif isinstance(obj, np.ndarray):
+        digest.update(f"{obj.dtype}{obj.shape}".encode())
+        digest.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, dict):
+        for key in sorted(obj, key=str):
+            digest.update(repr(key).encode())
+            _update_digest(digest, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        digest.update(f"{type(obj).__name__}{len(obj)}".encode())
+        for item in obj:
+            _update_digest(digest, item)
+    elif hasattr(obj, "__dict__") and not callable(obj):
+        digest.update(type(obj).__qualname__.encode())
+        _update_digest(digest, vars(obj))
+    else:
+        digest.update(repr(obj).encode())
+
+
+def _state_key(path):
+    # the png path relative to the repository, whatever the working directory
+    return os.path.relpath(os.path.abspath(path), ROOT)
+
+
+def _names(code):
+    # global names used by code and by the functions nested in it
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _names(const)
+    return names
+
+
+def _update_code_digest(digest, func, seen):
+    # the source of func, of the functions of its module it calls (their own
+    # calls included) and of the modules of the other functions it calls, and
+    # the values of the module constants it uses; libraries are left out
+    seen.add(func)
+    digest.update(inspect.getsource(func).encode())
+    for name in sorted(_names(func.__code__)):
+        value = func.__globals__.get(name)
+        if inspect.isfunction(value) and value not in seen:
+            if value.__module__ == func.__module__:
+                _update_code_digest(digest, value, seen)
+            elif inspect.getsourcefile(value).startswith(ROOT):
+                seen.add(value)
+                with open(inspect.getsourcefile(value), "rb") as f:
+                    digest.update(f.read())
+        elif value is not None and not (inspect.ismodule(value) or callable(value)):
+            _update_digest(digest, value)
+
+
+def job_hash(job):
+    """
+    Hash of everything a figure depends on: the data slice, the kwargs, the
+    plotting code (see _update_code_digest) and the plot settings.
+    """
+    digest = hashlib.sha256(job.plot.__qualname__.encode())
+    _update_code_digest(digest, job.plot, set())
+    with open(PLOT_SETTINGS, "rb") as f:
+        digest.update(f.read())
+    _update_digest(digest, job.data)
+    _update_digest(digest, job.kwargs or {})
+    return digest.hexdigest()
+
+
+def load_figures_state(path=FIGURES_STATE):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_figures_state(state, path=FIGURES_STATE):
+    # replaced atomically, an interrupted write keeps the previous state
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def _init_worker():
+    import matplotlib
+
+    matplotlib.use("Agg")
+    from visualization.plot_settings import apply_plot_settings
+
+    apply_plot_settings()
+
+
+def render_job(job):
+    import matplotlib.pyplot as plt
+
+    figure_name = os.path.basename(job.path)
+    with stage(job.plot.__name__, figure=figure_name):
+        figure = job.plot(job.data, **(job.kwargs or {}))
+    with stage("savefig", figure=figure_name):
+        figure.savefig(job.path, format="png")
+    plt.close("all")
+    return job.path
+
+
+@timed("render_jobs")
+def render_jobs(jobs, processes=None, state_path=FIGURES_STATE, force=None):
+    """
+    Render the jobs whose figure is missing or out of date (all of them with
+    force, or when state_path is None), returns the paths of all the jobs, in
+    the order of jobs.
+    """
+    processes = RENDER_PROCESSES if processes is None else processes
+    force = RENDER_FORCE if force is None else force
+    state = None if state_path is None else load_figures_state(state_path)
+    hashes = {}
+    pending = []
+    for job in jobs:
+        if state is not None:
+            key = _state_key(job.path)
+            hashes[key] = job_hash(job)
+            if not force and state.get(key) == hashes[key] and os.path.exists(job.path):
+                continue
+        pending.append(job)
+
+    processes = min(processes, len(pending))
+    if processes <= 1:
+        written = [render_job(job) for job in pending]
+    else:
+        with process_pool(processes, initializer=_init_worker) as pool:
+            written = list(pool.map(render_job, pending))
+
+    if state is not None and written:
+        for path in written:
+            state[_state_key(path)] = hashes[_state_key(path)]
+        save_figures_state(state, state_path)
+    return [job.path for job in jobs]